@@ -7,7 +7,10 @@ from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
 import sys
 import os
-from utils import cores_regionais 
+
+# Cadastro de regionais compartilhado com o Monitoramento (scripts/regionais.json)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Monitoramento.scripts.regionais import cor_regional
 
 
 
@@ -192,8 +195,8 @@ def criar_planilha_final(df, expected_2024, expected_2025):
 
         # Aplica a cor da Regional usando o dicionário importado
         regional_name = row['Regional']
-        if regional_name in cores_regionais:
-            color_code = cores_regionais[regional_name]
+        color_code = cor_regional(regional_name)
+        if color_code:
             regional_fill = PatternFill(start_color=color_code, end_color=color_code, fill_type="solid")
             ws.cell(row=current_row_index, column=1).fill = regional_fill
 
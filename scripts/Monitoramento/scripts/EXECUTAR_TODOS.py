@@ -1,9 +1,10 @@
-from openpyxl import Workbook
-from pathlib import Path 
+from pathlib import Path
+import argparse
 import os
+import queue
 import sys
-import pandas as pd
-from dotenv import load_dotenv 
+import threading
+from dotenv import load_dotenv
 
 
 
@@ -17,44 +18,19 @@ pasta_raiz_projeto = pasta_scripts.parent.parent
 
 sys.path.append(str(pasta_raiz_projeto))
 
-# Carrega variáveis de ambiente
-load_dotenv()
-
 
 try:
-    from lib_validacao import export_query_to_csv
+    from manifesto import Manifesto
 except ImportError:
     # Fallback caso o Python se perca nos caminhos relativos
     sys.path.append(str(pasta_scripts))
-    from lib_validacao import export_query_to_csv
-
-# --- INICIALIZAÇÃO DE WORKBOOKS ---
-belem_wb = Workbook()
-expansao_wb = Workbook()
-grs_wb = Workbook()
-expansao_ms_wb = Workbook()
-
-# Remove aba padrão
-for wb in [belem_wb, expansao_wb, grs_wb, expansao_ms_wb]:
-    wb.remove(wb.active)
-
-# Disponibiliza variáveis globais para os scripts executados via exec()
+    from manifesto import Manifesto
 
-globals().update({
-    "belem_wb": belem_wb,
-    "expansao_wb": expansao_wb,
-    "grs_wb": grs_wb,
-    "expansao_ms_wb": expansao_ms_wb,
-    "pasta_inputs": pasta_inputs, 
-    "pasta_saida": pasta_saida
-})
+from relatorio_execucao import RelatorioExecucao
 
-# --- ETAPA 1: ATUALIZAÇÃO DOS DADOS (BANCO -> CSV) ---
+# pandas, openpyxl e psycopg2 são importados só nas etapas que os usam,
+# para que --help e execuções parciais iniciem rápido
 
-print("\n=== ETAPA 1: Atualizando Bases de Dados ===")
-
-db_vars = ["DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST"]
-tem_credenciais = all(os.getenv(var) for var in db_vars)
 
 mapa_queries = [
     ("form1.sql", "form1.csv"),
@@ -63,90 +39,390 @@ mapa_queries = [
     ("form4.sql", "form4.csv")
 ]
 
-if tem_credenciais:
-    print("Credenciais encontradas. Iniciando extração...")
-    try:
-        for sql_file, csv_file in mapa_queries:
-            print(f"Processando: {sql_file} -> {csv_file}...")
-            export_query_to_csv(sql_file, csv_file, pasta_inputs)
-        print(">>> Bases atualizadas com sucesso.")
-    except Exception as e:
-        print(f"[ERRO CRÍTICO] Falha na conexão ou extração: {e}")
-else:
-    print("[AVISO] Sem credenciais. Usando CSVs locais.")
+# Coluna de data de envio de cada query, usada como marca d'água na extração incremental
+colunas_marca = {
+    "form1.sql": "data_envio",
+    "form2.sql": "data_envio",
+    "form3.sql": "data_envio",
+    "form4.sql": "data_de_envio"
+}
 
-# --- ETAPA 2: EXECUÇÃO DOS SCRIPTS ---
+# Chave de cada envio, usada para não repetir no CSV as linhas buscadas de novo
+# (form4 não tem chave própria: a linha inteira é comparada)
+chaves_envio = {
+    "form1.sql": ["id", "data_envio"],
+    "form2.sql": ["id", "uvr_nro", "data_envio"],
+    "form3.sql": ["id", "data_envio"]
+}
 
-print("\n=== ETAPA 2: Gerando Planilhas de Monitoramento ===")
+# Marcas d'água e data da última extração completa de cada query (modo incremental)
+caminho_estado_incremental = pasta_inputs / ".extracao_incremental.json"
 
-# Lista dos scripts que serão rodados
-scripts_para_rodar = [
-    "script_form1.py",
-    "script_form2.py",
-    "script_form3.py",
-    "script_form4.py"
-]
+# Resultados das queries em cache, compartilhados com o script_validacao.py
+pasta_cache_consultas = pasta_inputs / ".cache_consultas"
 
-# Verifica CSVs
-for _, csv_file in mapa_queries:
-    if not (pasta_inputs / csv_file).exists():
-        print(f"[ALERTA] Arquivo {csv_file} não encontrado em: {pasta_inputs}")
+# Hashes das entradas de cada saída gerada, usados para pular o que não mudou
+caminho_manifesto = pasta_saida / ".manifesto_build.json"
 
-try:
-    for script_nome in scripts_para_rodar:
-        caminho_script_filho = pasta_scripts / script_nome
-        
-        if caminho_script_filho.exists():
-            print(f"Executando {script_nome}...")
-            # O exec lê o arquivo usando o caminho completo (pathlib)
-            with open(caminho_script_filho, 'r', encoding='utf-8') as f:
-                exec(f.read(), globals()) # Passa as globais explicitamente
-            print(f"{script_nome}: OK")
+# Um JSON por execução com tempos, memória e contadores de cada etapa
+pasta_relatorios = pasta_saida / "relatorios"
+
+
+def extrair_em_segundo_plano(queries, max_conexoes, gravar_csv, relatorio, fila, streaming=False, incremental=None,
+                             cache=None, agregacoes=None, perfil=False):
+    # Roda em uma thread: avisa pela fila cada query concluída e, no fim, envia None
+    try:
+        from lib_validacao import exportar_queries_concorrente
+
+        with relatorio.etapa("extracao", streaming=streaming, incremental=incremental is not None,
+                             cache_ttl_s=cache.ttl if cache else None, agregada=bool(agregacoes),
+                             perfil_sql=perfil) as etapa:
+            resultados = exportar_queries_concorrente(
+                queries, pasta_inputs, max_conexoes, ao_concluir=fila.put, gravar=gravar_csv, streaming=streaming,
+                incremental=incremental, cache=cache, agregacoes=agregacoes, perfil=perfil
+            )
+            # Os DataFrames seguem pela fila; no relatório ficam só os números (e, com perfil, os planos)
+            etapa.dados["detalhes"] = [{k: v for k, v in r.items() if k != "dados"} for r in resultados]
+            etapa.contar(
+                linhas_lidas=sum(r["linhas"] for r in resultados if r["status"] == "ok"),
+                consultas_cache=sum(r["origem"] == "cache" for r in resultados),
+                consultas_banco=sum(r["origem"] == "banco" for r in resultados)
+            )
+    except Exception as e:
+        print(f"[ERRO] Falha na extração: {e}")
+    finally:
+        fila.put(None)
+
+
+def salvar_saidas(saidas, decisoes, manifesto, relatorio, etapa, nivel_compressao=None):
+    """
+    Etapa 4: grava os workbooks gerados em outputs/<convênio>/ e atualiza o manifesto.
+    Retorna o conjunto dos artefatos salvos.
+    """
+    from motor_forms import substituir_abas
+    from salvamento import salvar_workbooks
+    from utils import pastas_convenios
+
+    salvar_workers = int(os.getenv("SALVAR_WORKERS", "0")) or None
+
+    tarefas = []
+    for (arquivo_saida, convenio), wb in saidas.items():
+        # Cria caminho: outputs/NomePasta
+        nome_pasta = pastas_convenios[convenio][1]
+        caminho_final_pasta = pasta_saida / nome_pasta
+        caminho_final_pasta.mkdir(parents=True, exist_ok=True)
+
+        caminho_arquivo = caminho_final_pasta / arquivo_saida
+        decisao = next(d for d in decisoes if d["arquivo_saida"] == arquivo_saida and d["convenio"] == convenio)
+
+        # Só parte dos forms do arquivo foi gerada: as demais abas vêm do arquivo já salvo
+        if decisao["parcial"]:
+            wb = substituir_abas(wb, caminho_arquivo)
+
+        if len(wb.sheetnames) > 0:
+            tarefas.append((decisao, wb, caminho_arquivo))
         else:
-            print(f"[ERRO] Script não encontrado: {caminho_script_filho}")
+            print(f"[AVISO] {nome_pasta} vazio. Não salvo.")
+
+    resultados_salvamento = salvar_workbooks(
+        [(wb, caminho) for _, wb, caminho in tarefas], salvar_workers, nivel_compressao
+    )
+
+    salvos = set()
+    for (decisao, _, caminho_arquivo), resultado in zip(tarefas, resultados_salvamento):
+        relatorio.adicionar(resultado, etapa)
+        if resultado["status"] != "ok":
+            print(f"[ERRO] Falha ao salvar {caminho_arquivo}: {resultado['erro']}")
+            continue
+        etapa.contar(**resultado["contadores"])
+        print(f"Salvo em: {caminho_arquivo}")
+        # Um arquivo atualizado em parte não garante as demais abas em dia: a próxima execução completa o refaz
+        if decisao["parcial"]:
+            manifesto.descartar(decisao["artefato"])
+        else:
+            manifesto.registrar(decisao["artefato"], decisao["hashes"])
+        salvos.add(decisao["artefato"])
 
-except Exception as e:
-    print(f"[ERRO] Falha durante a execução dos scripts: {e}")
+    manifesto.salvar()
+    return salvos
 
 
-# --- ETAPA 3: VALIDAÇÃO ---
+def imprimir_resumo(decisoes, salvos):
+    print("\n=== Resumo da Execução ===")
+    for d in decisoes:
+        if not d["reconstruir"]:
+            print(f"  Mantido      {d['artefato']}: {d['motivo']}")
+        elif d["artefato"] in salvos:
+            parcial = " (apenas os forms selecionados)" if d["parcial"] else ""
+            print(f"  Reconstruído {d['artefato']}: {d['motivo']}{parcial}")
+        else:
+            print(f"  Não gerado   {d['artefato']}: falha ou aba ausente ({d['motivo']})")
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        description="Atualiza as bases, gera as planilhas de monitoramento e os relatórios de validação."
+    )
+    parser.add_argument(
+        "--form", action="append", choices=["1", "2", "3", "4"],
+        help="gera apenas o formulário informado (pode ser repetido); padrão: todos"
+    )
+    parser.add_argument(
+        "--convenio", action="append",
+        help="gera apenas o convênio informado: belem, expansao, grs ou expansao_ms (pode ser repetido); padrão: todos"
+    )
+    parser.add_argument("--skip-extract", action="store_true", help="não consulta o banco; usa os CSVs de inputs/")
+    parser.add_argument("--skip-validation", action="store_true", help="não gera os relatórios de validação")
+    parser.add_argument(
+        "--gravar-csv", action="store_true",
+        help="grava em inputs/ os CSVs extraídos do banco, para auditoria (equivale a GRAVAR_CSV=1)"
+    )
+    parser.add_argument(
+        "--streaming", action="store_true",
+        help="grava cada resultado do banco direto no CSV, em lotes, com memória constante; "
+             "os builders leem os CSVs (equivale a EXTRACAO_STREAMING=1)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="busca no banco só os envios a partir da última extração e os acrescenta aos CSVs de inputs/ "
+             "(equivale a EXTRACAO_INCREMENTAL=1)"
+    )
+    parser.add_argument(
+        "--extracao-completa", action="store_true",
+        help="no modo incremental, extrai as queries inteiras nesta execução, refletindo linhas apagadas no banco"
+    )
+    parser.add_argument(
+        "--agregar-envios", action="store_true",
+        help="agrupa os envios dos forms no banco (GROUP BY): uma linha por município/UVR/mês, com o número "
+             "de envios, as datas e o status, em vez de uma por envio (equivale a EXTRACAO_AGREGADA=1)"
+    )
+    parser.add_argument(
+        "--cache-consultas", type=float, metavar="MINUTOS",
+        help="reaproveita resultados de queries idênticas extraídos há menos de MINUTOS, sem ir ao banco "
+             "(equivale a CACHE_CONSULTAS_TTL; 0 desliga). Invalidação: python cache_consultas.py --limpar"
+    )
+    parser.add_argument(
+        "--perfil-sql", action="store_true",
+        help="registra no relatório da execução o EXPLAIN (ANALYZE, BUFFERS) de cada query e o tempo no "
+             "servidor, na transferência e na montagem do DataFrame; cada query roda duas vezes no banco e "
+             "o cache de consultas não é lido (equivale a PERFIL_SQL=1)"
+    )
+    parser.add_argument(
+        "--forcar", action="store_true",
+        help="reconstrói mesmo sem alterações nas entradas (equivale a FORCAR_RECONSTRUCAO=1)"
+    )
+    return parser
+
+
+def main(argv=None):
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+
+    # Carrega variáveis de ambiente
+    load_dotenv()
+
+    forms = sorted(set(args.form)) if args.form else ["1", "2", "3", "4"]
+    builders = [f"script_form{n}" for n in forms]
+    if {"1", "2", "3"} <= set(forms):
+        # Um builder só para as três abas: cada planilha auxiliar é aberta uma vez
+        builders = ["script_form123"] + builders[3:]
+    queries = [(sql, csv) for sql, csv in mapa_queries if sql in {f"form{n}.sql" for n in forms}]
+
+    from utils import pastas_convenios
+
+    convenios = list(dict.fromkeys(args.convenio)) if args.convenio else list(pastas_convenios)
+    desconhecidos = [c for c in convenios if c not in pastas_convenios]
+    if desconhecidos:
+        parser.error(f"convênio desconhecido: {', '.join(desconhecidos)} (use {', '.join(pastas_convenios)})")
+
+    relatorio = RelatorioExecucao(pasta_relatorios)
+    relatorio.extras["selecao"] = {
+        "forms": forms,
+        "convenios": convenios,
+        "skip_extract": args.skip_extract,
+        "skip_validation": args.skip_validation
+    }
+
+    # --- ETAPAS 1 E 2: EXTRAÇÃO (BANCO -> CSV) E BUILDERS, EM PIPELINE ---
+
+    print("\n=== ETAPAS 1 e 2: Atualizando Bases e Gerando Planilhas ===")
+
+    db_vars = ["DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST"]
+    tem_credenciais = all(os.getenv(var) for var in db_vars)
+    extrair = tem_credenciais and not args.skip_extract
+    validar = tem_credenciais and not args.skip_validation
+
+    # Número máximo de conexões simultâneas ao banco (1 = extração sequencial)
+    max_conexoes_db = int(os.getenv("DB_MAX_CONEXOES", "4"))
+
+    # Os dados extraídos vão direto, em memória, para os builders; o CSV é opcional
+    gravar_csv = args.gravar_csv or os.getenv("GRAVAR_CSV", "") == "1"
+
+    # Em streaming a extração não monta DataFrames: grava os CSVs em lotes e os builders os leem
+    streaming = args.streaming or os.getenv("EXTRACAO_STREAMING", "") == "1"
+
+    # No modo incremental os CSVs de inputs/ guardam o histórico e recebem só os envios novos;
+    # a cada INCREMENTAL_DIAS_COMPLETA dias (padrão 7) a extração é completa
+    incremental = None
+    if args.incremental or os.getenv("EXTRACAO_INCREMENTAL", "") == "1":
+        from lib_validacao import ExtracaoIncremental
+        incremental = ExtracaoIncremental(
+            caminho_estado_incremental, colunas_marca, int(os.getenv("INCREMENTAL_DIAS_COMPLETA", "7")),
+            forcar_completa=args.extracao_completa, chaves=chaves_envio
+        )
+
+    # Na extração agregada o banco devolve uma linha por chave; os builders reconhecem o formato
+    agregacoes = None
+    if args.agregar_envios or os.getenv("EXTRACAO_AGREGADA", "") == "1":
+        if incremental is not None:
+            parser.error("a extração agregada não combina com a incremental, que acrescenta envios aos CSVs")
+        from envios_agregados import AGREGACOES
+        agregacoes = {sql: AGREGACOES[sql] for sql, _ in queries if sql in AGREGACOES}
+
+    # Com TTL (minutos), queries já extraídas há pouco, aqui ou pelo script_validacao.py, vêm do cache
+    from cache_consultas import CacheConsultas
+    cache = CacheConsultas.do_ambiente(pasta_cache_consultas, args.cache_consultas)
+
+    # Perfil das queries: EXPLAIN ANALYZE e tempo de cada fase, no relatório da execução
+    perfil = args.perfil_sql or os.getenv("PERFIL_SQL", "") == "1"
+
+    # As consultas da validação entram na fila depois das dos forms e são
+    # adiantadas enquanto os builders ocupam a CPU
+    consultas_validacao = []
+    if validar:
+        import script_validacao
+        if extrair:
+            consultas_validacao = script_validacao.consultas_selecionadas(convenios)
+
+    if extrair:
+        modo = (", incremental" if incremental else "") + (", em streaming para os CSVs" if streaming else "")
+        modo += ", envios agregados no banco" if agregacoes else ""
+        modo += f", cache de {cache.ttl / 60:g} min" if cache else ""
+        modo += ", com perfil das queries" if perfil else ""
+        print(f"Credenciais encontradas. Iniciando extração ({max_conexoes_db} conexões{modo})...")
+    else:
+        with relatorio.etapa("extracao") as etapa:
+            etapa.dados["status_extracao"] = "pulada"
+        if args.skip_extract:
+            print("[PULADO] Extração desativada (--skip-extract). Usando CSVs locais.")
+        else:
+            print("[AVISO] Sem credenciais. Usando CSVs locais.")
+
+    from motor_forms import PipelineBuilders
+    from estado_validacao import sincronizar
+
+    # Verifica CSVs que não serão extraídos agora
+    for _, csv_file in queries:
+        if not extrair and not (pasta_inputs / csv_file).exists():
+            print(f"[ALERTA] Arquivo {csv_file} não encontrado em: {pasta_inputs}")
+
+    with relatorio.etapa("builders") as etapa:
+        # Só reconstrói as saídas cujas entradas (CSVs, SQLs, planilhas auxiliares, código) mudaram;
+        # cada builder começa assim que os CSVs dos quais ele depende chegam do banco
+        manifesto = Manifesto(caminho_manifesto, pasta_scripts.parent)
+        forcar = args.forcar or os.getenv("FORCAR_RECONSTRUCAO", "") == "1"
+        max_workers = int(os.getenv("MAX_WORKERS", "0")) or None
+        medicoes_builders = []
+
+        # Edições dos analistas nas planilhas auxiliares entram no estado de validação,
+        # que os builders leem por convênio e form; só as planilhas alteradas são relidas
+        importados = sincronizar(pasta_inputs, builders, convenios)
+        etapa.dados["estado_validacao"] = {f"{c}/{arquivo}": linhas for (c, arquivo), linhas in importados.items()}
+        if importados:
+            print(f"Estado de validação: {len(importados)} planilha(s) auxiliar(es) importada(s).")
+
+        pipeline = PipelineBuilders(
+            pasta_inputs, pasta_saida, manifesto, builders, convenios, forcar=forcar,
+            pendentes=[csv_file for _, csv_file in queries] if extrair else [],
+            max_workers=max_workers, medicoes=medicoes_builders
+        )
+
+        dados_extraidos = {}
+        if extrair:
+            fila = queue.Queue()
+            threading.Thread(
+                target=extrair_em_segundo_plano,
+                args=(queries + consultas_validacao, max_conexoes_db, gravar_csv, relatorio, fila, streaming, incremental,
+                      cache, agregacoes, perfil),
+                daemon=True
+            ).start()
+
+            # Resumo por query: uma falha não interrompe as demais e a cópia local do CSV é usada
+            falhas = []
+            while (r := fila.get()) is not None:
+                if r["status"] == "ok":
+                    novas = f", {r['linhas_novas']} novas, {r['modo']}" if r["modo"] else ""
+                    print(f"  {r['sql']:<22} OK     {r['tempo']:>7.2f}s  {r['linhas']} linhas "
+                          f"({r['origem']}, {r['linhas_por_s']} linhas/s{novas})")
+                    if r["dados"] is not None:
+                        dados_extraidos[r["csv"]] = r["dados"]
+                else:
+                    print(f"  {r['sql']:<22} ERRO   {r['erro']}")
+                    falhas.append(r["sql"])
+                pipeline.entrada_disponivel(r["csv"], r["dados"])
+
+            if falhas:
+                print(f"[AVISO] Falha na extração de: {', '.join(falhas)}. Usando CSVs locais para essas bases.")
+            else:
+                print(">>> Bases atualizadas com sucesso.")
+
+        saidas, decisoes = pipeline.concluir()
+
+        etapa.dados["decisoes"] = [
+            {k: d[k] for k in ("artefato", "reconstruir", "motivo", "parcial")} for d in decisoes
+        ]
+        etapa.dados["detalhes"] = medicoes_builders
+        for m in medicoes_builders:
+            etapa.contar(**m.get("contadores", {}))
+
+
+    # --- ETAPA 3: VALIDAÇÃO ---
+
+    print("\n=== ETAPA 3: Validação ===")
+
+    with relatorio.etapa("validacao") as etapa:
+        if args.skip_validation:
+            etapa.dados["status_validacao"] = "pulada"
+            print("[PULADO] Validação desativada (--skip-validation).")
+        elif validar:
+            medicoes_validacao = []
+            etapa.dados["detalhes"] = medicoes_validacao
+            try:
+                # Os dados da validação já vieram junto com a extração (ou são os CSVs locais, com --skip-extract)
+                script_validacao.executar(
+                    pasta_inputs, pasta_saida, medicoes_validacao, convenios, extrair=False, dados=dados_extraidos
+                )
+                print(">>> Validação finalizada.")
+            except Exception as e:
+                etapa.dados["erro"] = str(e)
+                print(f"[ERRO] Falha na validação: {e}")
+        else:
+            etapa.dados["status_validacao"] = "pulada"
+            print("[PULADO] Validação requer credenciais.")
 
-print("\n=== ETAPA 3: Validação ===")
 
-if tem_credenciais:
-    try:
-        val_script = pasta_scripts / "script_validacao.py"
-        with open(val_script, 'r', encoding='utf-8') as f:
-            exec(f.read(), globals())
-        print(">>> Validação finalizada.")
-    except Exception as e:
-        print(f"[ERRO] Falha na validação: {e}")
-else:
-    print("[PULADO] Validação requer credenciais.")
+    # --- ETAPA 4: SALVAMENTO ---
 
+    print("\n=== ETAPA 4: Salvando Arquivos ===")
 
-# --- ETAPA 4: SALVAMENTO ---
+    from salvamento import nivel_compressao_padrao
 
-print("\n=== ETAPA 4: Salvando Arquivos ===")
+    # Os arquivos são gravados em paralelo; XLSX_COMPRESSAO ajusta o nível do zip (0-9)
+    nivel_compressao = nivel_compressao_padrao()
 
-mapa_saida = {
-    belem_wb: "Belém",
-    expansao_wb: "Expansão",
-    grs_wb: "GRS",
-    expansao_ms_wb: "Expansão MS"
-}
+    with relatorio.etapa("salvamento", nivel_compressao=nivel_compressao) as etapa:
+        salvos = salvar_saidas(saidas, decisoes, manifesto, relatorio, etapa, nivel_compressao)
+
+    # --- RESUMO ---
+
+    imprimir_resumo(decisoes, salvos)
+
+    for etapa in relatorio.etapas:
+        print(f"  {etapa.nome:<12} {etapa.dados['tempo_parede_s']:>7.2f}s")
+    print(f"Relatório da execução: {relatorio.salvar()}")
+
+    print("\nProcesso Finalizado.")
 
-for wb, nome_pasta in mapa_saida.items():
-    # Cria caminho: outputs/NomePasta
-    caminho_final_pasta = pasta_saida / nome_pasta
-    caminho_final_pasta.mkdir(parents=True, exist_ok=True)
-    
-    caminho_arquivo = caminho_final_pasta / "0 - Monitoramento Form 1, 2 e 3.xlsx"
-    
-    if len(wb.sheetnames) > 0:
-        wb.save(caminho_arquivo)
-        print(f"Salvo em: {caminho_arquivo}")
-    else:
-        print(f"[AVISO] {nome_pasta} vazio. Não salvo.")
 
-print("\nProcesso Finalizado.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Benchmark dos pipelines de monitoramento e inserção sobre dados sintéticos.
+
+Gera (uma vez por escala) as entradas sintéticas em outputs/benchmark/dados_<N>x/
+e mede cada alvo em um processo próprio, gravando o resultado em
+outputs/benchmark/historico.jsonl para comparar execuções ao longo do tempo.
+
+    python benchmark.py --escala 1 --escala 10
+    python benchmark.py --escala 100 --alvo form4 --rotulo "teste compressão"
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import runpy
+import shutil
+import subprocess
+import sys
+from datetime import datetime
+from importlib.metadata import version
+from pathlib import Path
+
+from relatorio_execucao import medir, contar_workbook
+
+pasta_scripts = Path(__file__).resolve().parent
+pasta_root = pasta_scripts.parent
+pasta_raiz_scripts = pasta_root.parent  # .../scripts (Monitoramento, Engajamento, Inserção)
+pasta_benchmark = pasta_root / "outputs" / "benchmark"
+arquivo_historico = pasta_benchmark / "historico.jsonl"
+
+# Scripts fora do Monitoramento: copiados para os dados sintéticos a cada execução,
+# para que resolvam inputs/ e outputs/ (relativos ao próprio arquivo) lá dentro
+SCRIPTS_EXTERNOS = {
+    "engajamento": ("Engajamento", ["engajamento.py"]),
+    "json_script": ("Inserção/script_json", ["json_script.py"]),
+    "lacunas": ("Inserção/planilha_lacunas", ["script.py"])
+}
+
+# Cadastro de regionais e os módulos do Monitoramento que o Engajamento importa
+# (Monitoramento.scripts.regionais), copiados para a mesma posição nos dados sintéticos
+ARQUIVOS_COMPARTILHADOS = ["regionais.json", "Monitoramento/scripts/regionais.py", "Monitoramento/scripts/utils.py"]
+
+ALVOS = ["form1", "form2", "form3", "form123", "form4", "validacao", *SCRIPTS_EXTERNOS]
+
+# Linha da saída do processo filho que carrega a medição
+_PREFIXO_RESULTADO = "RESULTADO_BENCHMARK "
+
+
+def _alvo_form(numero, raiz, medicao):
+    # Builder do Monitoramento, mais o salvamento dos workbooks gerados
+    from salvamento import salvar_workbook
+
+    modulo = importlib.import_module(f"script_form{numero}")
+    pasta_inputs = raiz / "Monitoramento" / "inputs"
+    pasta_outputs = raiz / "Monitoramento" / "outputs"
+    with medir("construir") as construcao:
+        workbooks = modulo.construir(pasta_inputs=pasta_inputs)
+    with medir("salvar") as salvamento:
+        for convenio, wb in workbooks.items():
+            medicao.contar(**contar_workbook(wb))
+            salvar_workbook(wb, pasta_outputs / f"{convenio}_form{numero}.xlsx")
+    medicao.dados["construir_s"] = construcao.dados["tempo_parede_s"]
+    medicao.dados["salvar_s"] = salvamento.dados["tempo_parede_s"]
+
+
+def _alvo_validacao(raiz, medicao):
+    # processar_e_salvar_excel sobre os CSVs de validação sintéticos
+    from lib_validacao import processar_e_salvar_excel
+    from tipagem import ler_csv_tipado
+
+    pasta_inputs = raiz / "Monitoramento" / "inputs"
+    pasta_outputs = raiz / "Monitoramento" / "outputs"
+    for nome_csv in ["data_grs.csv", "data_expansao.csv"]:
+        df = ler_csv_tipado(pasta_inputs / nome_csv)
+        medicao.contar(linhas_lidas=len(df))
+        processar_e_salvar_excel(df, pasta_outputs / nome_csv.replace(".csv", ".xlsx"))
+
+
+def _alvo_script(alvo, raiz, medicao):
+    # Executa o script copiado como se fosse chamado pela linha de comando
+    pasta_relativa, arquivos = SCRIPTS_EXTERNOS[alvo]
+    pasta_script = raiz / pasta_relativa
+    for arquivo in arquivos:
+        shutil.copyfile(pasta_raiz_scripts / pasta_relativa / arquivo, pasta_script / arquivo)
+    for arquivo in ARQUIVOS_COMPARTILHADOS:
+        (raiz / arquivo).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(pasta_raiz_scripts / arquivo, raiz / arquivo)
+    shutil.rmtree(pasta_script / "outputs", ignore_errors=True)
+
+    # Como na linha de comando, a pasta do script vem primeiro no sys.path
+    sys.path.insert(0, str(pasta_script))
+    try:
+        runpy.run_path(str(pasta_script / arquivos[0]), run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f"{arquivos[0]} terminou com código {e.code}")
+
+    saidas = list((pasta_script / "outputs").glob("*")) if (pasta_script / "outputs").exists() else []
+    medicao.contar(arquivos_gerados=len(saidas))
+
+
+def executar_alvo(alvo, raiz):
+    """
+    Roda um alvo no processo atual e devolve a medição (dict).
+    Chamado no processo filho, via --executar-alvo.
+    """
+    with medir(alvo) as medicao:
+        if alvo.startswith("form"):
+            _alvo_form(alvo[len("form"):], raiz, medicao)
+        elif alvo == "validacao":
+            _alvo_validacao(raiz, medicao)
+        else:
+            _alvo_script(alvo, raiz, medicao)
+    return medicao.como_dict()
+
+
+def medir_em_processo(alvo, raiz, timeout=None):
+    """
+    Mede um alvo em um processo Python novo, para que o tempo e o pico de memória
+    de um alvo não herdem o estado (caches, imports, heap) dos anteriores.
+    """
+    comando = [sys.executable, str(Path(__file__).resolve()), "--executar-alvo", alvo, "--raiz", str(raiz)]
+    try:
+        processo = subprocess.run(
+            comando, cwd=pasta_scripts, capture_output=True, text=True, encoding="utf-8",
+            errors="replace", timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return {"nome": alvo, "status": "erro", "erro": f"tempo limite de {timeout}s excedido"}
+
+    for linha in reversed(processo.stdout.splitlines()):
+        if linha.startswith(_PREFIXO_RESULTADO):
+            return json.loads(linha[len(_PREFIXO_RESULTADO):])
+    erro = (processo.stderr.strip().splitlines() or ["sem saída"])[-1]
+    return {"nome": alvo, "status": "erro", "erro": erro}
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=pasta_scripts, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _ambiente():
+    # Versões e variáveis que mudam o resultado: o que se compara entre execuções
+    return {
+        "commit": _commit_atual(),
+        "python": platform.python_version(),
+        "pandas": version("pandas"),
+        "openpyxl": version("openpyxl"),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "variaveis": {nome: os.environ[nome] for nome in ["XLSX_COMPRESSAO", "RELATORIO_TRACEMALLOC"] if nome in os.environ}
+    }
+
+
+def carregar_historico():
+    if not arquivo_historico.exists():
+        return []
+    with open(arquivo_historico, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def _anterior(historico, alvo, fatores):
+    # Última medição bem-sucedida do mesmo alvo na mesma escala
+    for registro in reversed(historico):
+        if (registro["nome"] == alvo and registro.get("status") == "ok"
+                and registro["fator_uvrs"] == fatores["fator_uvrs"]
+                and registro["fator_meses"] == fatores["fator_meses"]):
+            return registro
+    return None
+
+
+def preparar_dados(escala, regenerar=False):
+    """
+    Devolve a pasta e os fatores dos dados sintéticos da escala, gerando-os se preciso.
+    A geração também roda em outro processo: o pico de RSS que o Linux informa
+    para um processo filho inclui o do pai no momento do fork, que deve ficar pequeno.
+    """
+    pasta = pasta_benchmark / f"dados_{escala}x"
+    marcador = pasta / "escala.json"
+    if regenerar or not marcador.exists():
+        comando = [sys.executable, str(Path(__file__).resolve()), "--gerar-dados", str(escala), "--raiz", str(pasta)]
+        subprocess.run(comando, cwd=pasta_scripts, check=True)
+    return pasta, json.loads(marcador.read_text(encoding="utf-8"))
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        description="Mede os scripts de monitoramento e inserção sobre dados sintéticos em escala."
+    )
+    parser.add_argument("--escala", action="append", type=int,
+                        help="Escala dos dados (UVRs x meses): 1, 10, 100 ou outro fator de UVRs. Pode ser repetida; padrão 1.")
+    parser.add_argument("--alvo", action="append", choices=ALVOS,
+                        help="Mede apenas este alvo. Pode ser repetido; padrão: todos.")
+    parser.add_argument("--repeticoes", type=int, default=1, help="Execuções de cada alvo (padrão 1).")
+    parser.add_argument("--regenerar", action="store_true", help="Gera os dados sintéticos de novo, mesmo que já existam.")
+    parser.add_argument("--rotulo", help="Descrição gravada no histórico (ex: a engine ou a mudança testada).")
+    parser.add_argument("--timeout", type=float, help="Tempo máximo de cada alvo, em segundos.")
+    parser.add_argument("--executar-alvo", choices=ALVOS, help=argparse.SUPPRESS)
+    parser.add_argument("--gerar-dados", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--raiz", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+
+    if args.executar_alvo:
+        resultado = executar_alvo(args.executar_alvo, Path(args.raiz))
+        print(_PREFIXO_RESULTADO + json.dumps(resultado, ensure_ascii=False, default=str))
+        return
+    if args.gerar_dados:
+        import dados_sinteticos
+        dados_sinteticos.gerar(Path(args.raiz), args.gerar_dados)
+        return
+
+    escalas = args.escala or [1]
+    alvos = args.alvo or ALVOS
+    historico = carregar_historico()
+    execucao = {"data": datetime.now().isoformat(timespec="seconds"), "rotulo": args.rotulo, **_ambiente()}
+
+    pasta_benchmark.mkdir(parents=True, exist_ok=True)
+    for escala in escalas:
+        raiz, fatores = preparar_dados(escala, args.regenerar)
+        print(f"\n>>> Escala {escala}x ({fatores['fator_uvrs']}x UVRs, {fatores['fator_meses']}x meses)")
+        for alvo in alvos:
+            for repeticao in range(1, args.repeticoes + 1):
+                resultado = medir_em_processo(alvo, raiz, args.timeout)
+                registro = {**execucao, **fatores, "repeticao": repeticao, **resultado}
+
+                if resultado.get("status") == "ok":
+                    linha = f"   [OK]   {alvo}: {resultado['tempo_parede_s']}s (CPU {resultado['tempo_cpu_s']}s, pico {resultado['pico_rss_mb']} MB)"
+                    anterior = _anterior(historico, alvo, fatores)
+                    if anterior:
+                        variacao = (resultado["tempo_parede_s"] / anterior["tempo_parede_s"] - 1) * 100 if anterior["tempo_parede_s"] else 0
+                        linha += f" | {variacao:+.0f}% vs {anterior['data']}" + (f" ({anterior['rotulo']})" if anterior.get("rotulo") else "")
+                    print(linha)
+                else:
+                    print(f"   [ERRO] {alvo}: {resultado.get('erro')}")
+
+                with open(arquivo_historico, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+                historico.append(registro)
+
+    print(f"\nResultados acrescentados a {arquivo_historico}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Cache em disco dos resultados das queries, compartilhado pelo EXECUTAR_TODOS.py
+e pelo script_validacao.py (que rodam em seguida um do outro no fechamento).
+
+Cada entrada é identificada pelo hash do texto SQL e dos parâmetros e vale por
+um tempo (TTL). Fica em inputs/.cache_consultas/: o resultado (DataFrame tipado
+serializado, ou o CSV da extração em streaming) e um .json com a descrição.
+
+    python cache_consultas.py --listar
+    python cache_consultas.py --limpar               # invalida tudo
+    python cache_consultas.py --limpar form1.sql     # só as entradas da query
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+
+pasta_scripts = Path(__file__).resolve().parent
+pasta_cache_padrao = pasta_scripts.parent / "inputs" / ".cache_consultas"
+
+# Formato de cada entrada: DataFrame serializado ou CSV pronto (streaming)
+_EXTENSOES = {"dados": ".pkl", "csv": ".csv"}
+
+
+class CacheConsultas:
+    """
+    Cache de resultados de queries com validade de `ttl` segundos.
+    As gravações são atômicas (arquivo temporário + rename), então threads e
+    processos diferentes podem usar a mesma pasta.
+    """
+
+    def __init__(self, pasta, ttl):
+        self.pasta = Path(pasta)
+        self.ttl = ttl
+
+    @classmethod
+    def do_ambiente(cls, pasta=pasta_cache_padrao, minutos=None):
+        """
+        Cache configurado por `minutos` ou pela variável CACHE_CONSULTAS_TTL
+        (validade em minutos). Retorna None quando o cache está desligado (0 ou ausente).
+        """
+        if minutos is None:
+            minutos = float(os.getenv("CACHE_CONSULTAS_TTL", "0") or 0)
+        return cls(pasta, minutos * 60) if minutos > 0 else None
+
+    def chave(self, caminho_sql, parametros=None, formato="dados"):
+        texto = Path(caminho_sql).read_text(encoding="utf-8")
+        conteudo = json.dumps([texto, parametros, formato], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+    def _arquivos(self, chave, formato):
+        return self.pasta / f"{chave}{_EXTENSOES[formato]}", self.pasta / f"{chave}.json"
+
+    def _valida(self, caminho):
+        # Idade da entrada em segundos, ou None se ausente ou vencida (que é apagada)
+        try:
+            idade = time.time() - caminho.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        if idade > self.ttl:
+            caminho.unlink(missing_ok=True)
+            caminho.with_suffix(".json").unlink(missing_ok=True)
+            return None
+        return idade
+
+    def buscar(self, caminho_sql, parametros=None):
+        """DataFrame tipado guardado para a query e a idade da entrada (s), ou None."""
+        arquivo, _ = self._arquivos(self.chave(caminho_sql, parametros), "dados")
+        idade = self._valida(arquivo)
+        if idade is None:
+            return None
+        try:
+            return pickle.loads(arquivo.read_bytes()), idade
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def copiar_csv(self, caminho_sql, caminho_csv, parametros=None):
+        """Copia o CSV guardado (streaming) para `caminho_csv`. Retorna (linhas, idade) ou None."""
+        chave = self.chave(caminho_sql, parametros, "csv")
+        arquivo, descricao = self._arquivos(chave, "csv")
+        idade = self._valida(arquivo)
+        if idade is None:
+            return None
+        try:
+            linhas = json.loads(descricao.read_text(encoding="utf-8"))["linhas"]
+            temporario = caminho_csv.with_name(f".{caminho_csv.name}.parcial")
+            shutil.copyfile(arquivo, temporario)
+            temporario.replace(caminho_csv)
+        except (OSError, ValueError, KeyError):
+            return None
+        return linhas, idade
+
+    def _gravar(self, chave, formato, caminho_sql, linhas, escrever):
+        # Falhar ao guardar não invalida a extração: a query só não fica em cache
+        arquivo, descricao = self._arquivos(chave, formato)
+        temporario = arquivo.with_name(f".{arquivo.name}.{os.getpid()}.tmp")
+        try:
+            self.pasta.mkdir(parents=True, exist_ok=True)
+            escrever(temporario)
+            descricao.write_text(json.dumps({
+                "consulta": Path(caminho_sql).name, "formato": formato, "linhas": linhas,
+                "criado_em": datetime.now().isoformat(timespec="seconds")
+            }, ensure_ascii=False), encoding="utf-8")
+            temporario.replace(arquivo)
+        except OSError as e:
+            temporario.unlink(missing_ok=True)
+            print(f"[AVISO] Não foi possível guardar {Path(caminho_sql).name} no cache de consultas: {e}")
+
+    def guardar(self, caminho_sql, df, parametros=None):
+        dados = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        self._gravar(self.chave(caminho_sql, parametros), "dados", caminho_sql, len(df),
+                     lambda destino: destino.write_bytes(dados))
+
+    def guardar_csv(self, caminho_sql, caminho_csv, linhas, parametros=None):
+        self._gravar(self.chave(caminho_sql, parametros, "csv"), "csv", caminho_sql, linhas,
+                     lambda destino: shutil.copyfile(caminho_csv, destino))
+
+
+def listar_entradas(pasta=pasta_cache_padrao):
+    """Descrição de cada entrada do cache, com a chave e a idade em segundos."""
+    entradas = []
+    for descricao in sorted(Path(pasta).glob("*.json")):
+        try:
+            dados = json.loads(descricao.read_text(encoding="utf-8"))
+            arquivo = descricao.with_suffix(_EXTENSOES[dados["formato"]])
+            idade = time.time() - arquivo.stat().st_mtime
+        except (OSError, ValueError, KeyError):
+            continue
+        entradas.append({**dados, "chave": descricao.stem, "idade_s": round(idade)})
+    return entradas
+
+
+def invalidar(pasta=pasta_cache_padrao, consultas=None):
+    """
+    Apaga as entradas do cache (todas, ou só as das queries em `consultas`,
+    pelo nome do .sql). Retorna o número de entradas apagadas.
+    """
+    pasta = Path(pasta)
+    if not pasta.exists():
+        return 0
+    if not consultas:
+        apagadas = len(list(pasta.glob("*.json")))
+        shutil.rmtree(pasta)
+        return apagadas
+    apagadas = 0
+    for entrada in listar_entradas(pasta):
+        if entrada["consulta"] in consultas:
+            (pasta / f"{entrada['chave']}{_EXTENSOES[entrada['formato']]}").unlink(missing_ok=True)
+            (pasta / f"{entrada['chave']}.json").unlink(missing_ok=True)
+            apagadas += 1
+    return apagadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lista ou invalida o cache de resultados das queries.")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--listar", action="store_true", help="lista as entradas do cache")
+    grupo.add_argument("--limpar", nargs="*", metavar="CONSULTA.sql",
+                       help="apaga as entradas das queries informadas (sem nomes: todas)")
+    parser.add_argument("--pasta", type=Path, default=pasta_cache_padrao, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.listar:
+        entradas = listar_entradas(args.pasta)
+        if not entradas:
+            print("Cache de consultas vazio.")
+        for e in entradas:
+            print(f"  {e['consulta']:<24} {e['formato']:<6} {e['linhas']:>9} linhas  "
+                  f"{e['criado_em']} ({e['idade_s'] // 60} min)  {e['chave'][:12]}")
+        return
+
+    apagadas = invalidar(args.pasta, args.limpar)
+    print(f"[OK] {apagadas} entrada(s) removida(s) do cache de consultas.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import pickle
+from pathlib import Path
+from openpyxl import load_workbook
+
+
+# {caminho: ((mtime_ns, tamanho), workbook serializado)}; None = cache desligado
+_cache = None
+
+
+def ativar_cache():
+    """
+    Liga o cache de planilhas do processo atual. Usado pelo serviço residente
+    (no processo principal e como initializer dos workers), onde as mesmas
+    planilhas auxiliares são abertas a cada regeneração.
+    """
+    global _cache
+    if _cache is None:
+        _cache = {}
+
+
+def carregar_planilha(caminho):
+    """
+    Equivale ao load_workbook(caminho). Com o cache ligado, o arquivo só é lido
+    de novo quando muda (data de modificação ou tamanho); nas demais vezes o
+    workbook é reconstruído da cópia serializada, bem mais rápido que reler o
+    XML e sem compartilhar objetos entre execuções.
+    """
+    if _cache is None:
+        return load_workbook(caminho)
+
+    caminho = Path(caminho).resolve()
+    estado = caminho.stat()
+    versao = (estado.st_mtime_ns, estado.st_size)
+    registro = _cache.get(caminho)
+    if registro is not None and registro[0] == versao:
+        return pickle.loads(registro[1])
+
+    wb = load_workbook(caminho)
+    _cache[caminho] = (versao, pickle.dumps(wb, protocol=pickle.HIGHEST_PROTOCOL))
+    return wb
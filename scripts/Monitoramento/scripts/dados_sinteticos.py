@@ -0,0 +1,260 @@
+import json
+import re
+import shutil
+from copy import copy
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.formula.translate import Translator
+from openpyxl.worksheet.formula import ArrayFormula
+
+pasta_scripts = Path(__file__).resolve().parent
+pasta_raiz_scripts = pasta_scripts.parent.parent  # .../scripts (Monitoramento, Engajamento, Inserção)
+
+# Escala: (fator de UVRs, fator de meses)
+ESCALAS = {
+    1: (1, 1),
+    10: (10, 1),
+    100: (10, 10)
+}
+
+# Cada cópia de mês avança este número de anos, para não colidir com as abas MM.AA reais
+ANOS_POR_COPIA = 2
+
+ARQUIVOS_AUXILIARES = ["0 - Monitoramento Form 1, 2 e 3.xlsx", "0 - Monitoramento Form 4.xlsx"]
+
+# Coluna de município de cada CSV dos forms
+COLUNA_MUNICIPIO = {
+    "form1.csv": "municipio",
+    "form2.csv": "municipio",
+    "form3.csv": "municipio",
+    "form4.csv": "gm_nome"
+}
+
+# Relatório de validação já formatado de onde saem os CSVs sintéticos da validação
+RELATORIOS_VALIDACAO = {
+    "data_grs.csv": ("0 - GRS II", "1 - Formulários - GRS - *.xlsx"),
+    "data_expansao.csv": ("0 - Expansão", "1 - Formulários - Expansão - *.xlsx")
+}
+
+_PADRAO_ABA_MES = re.compile(r"^(\d{2})\.(\d{2})$")
+_PADRAO_PAYLOAD = re.compile(r"^(.*?)_UVR-(\d+)_(\d{1,2})-(\d{4})\.xlsx$", re.IGNORECASE)
+_PADRAO_ANO = re.compile(r"(?<!\d)(\d{4})(?!\d)")
+
+
+def nome_sintetico(nome, copia):
+    # A cópia 0 é o próprio município; as demais ganham um sufixo numérico
+    if copia == 0 or not isinstance(nome, str) or not nome.strip():
+        return nome
+    return f"{nome.strip()} {copia + 1}"
+
+
+def deslocar_anos(texto, anos):
+    # Avança o ano de datas em texto ("2025-02-01", "15/11/2024")
+    if not anos or not isinstance(texto, str):
+        return texto
+    return _PADRAO_ANO.sub(lambda m: str(int(m.group(1)) + anos), texto)
+
+
+def _copias(df, fator_uvrs, fator_meses, colunas_municipio=(), colunas_data=()):
+    # Uma cópia do DataFrame por (UVR, mês), com municípios renomeados e datas deslocadas
+    partes = []
+    for copia in range(fator_uvrs):
+        for mes in range(fator_meses):
+            parte = df.copy()
+            for coluna in colunas_municipio:
+                parte[coluna] = parte[coluna].map(lambda v: nome_sintetico(v, copia))
+            for coluna in colunas_data:
+                parte[coluna] = parte[coluna].map(lambda v: deslocar_anos(v, mes * ANOS_POR_COPIA))
+            partes.append(parte)
+    return pd.concat(partes, ignore_index=True)
+
+
+def gerar_csvs_forms(pasta_origem, pasta_destino, fator_uvrs, fator_meses):
+    """
+    form1-3.csv crescem só em UVRs; o form4.csv (mensal) cresce em UVRs e em meses.
+    """
+    for nome_csv, coluna in COLUNA_MUNICIPIO.items():
+        origem = pasta_origem / nome_csv
+        if not origem.exists():
+            print(f"[AVISO] {origem} não encontrado. Entrada sintética não gerada.")
+            continue
+        df = pd.read_csv(origem, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+        if nome_csv == "form4.csv":
+            df = _copias(df, fator_uvrs, fator_meses, [coluna], ["data_de_envio", "data_de_referencia"])
+        else:
+            df = _copias(df, fator_uvrs, 1, [coluna])
+        df.to_csv(pasta_destino / nome_csv, index=False, encoding="utf-8-sig")
+
+
+def gerar_csvs_validacao(pasta_origem, pasta_destino, fator_uvrs, fator_meses):
+    """
+    Reconstrói o resultado das consultas de validação a partir dos relatórios já
+    formatados em inputs/. Aqui os municípios são mantidos (para as regionais
+    continuarem batendo) e cada cópia vira outra UVR do mesmo município.
+    """
+    for nome_csv, (pasta_convenio, padrao) in RELATORIOS_VALIDACAO.items():
+        relatorios = sorted((pasta_origem / pasta_convenio).glob(padrao))
+        if not relatorios:
+            print(f"[AVISO] Nenhum relatório '{padrao}' em {pasta_convenio}. {nome_csv} não gerado.")
+            continue
+        base = pd.read_excel(relatorios[-1], dtype=str).drop(columns=["regional"], errors="ignore")
+        partes = []
+        for copia in range(fator_uvrs):
+            for mes in range(fator_meses):
+                parte = base.copy()
+                if copia:
+                    parte["uvr_id"] = (pd.to_numeric(parte["uvr_id"]) + 10000 * copia).astype(str)
+                    parte["uvr"] = (pd.to_numeric(parte["uvr"]) + 100 * copia).astype(str)
+                parte["mes_referencia"] = parte["mes_referencia"].map(lambda v: deslocar_anos(v, mes * ANOS_POR_COPIA))
+                partes.append(parte)
+        pd.concat(partes, ignore_index=True).to_csv(pasta_destino / nome_csv, index=False, encoding="utf-8-sig")
+
+
+def _valor_copiado(valor, origem, destino):
+    # Fórmulas são transladadas para a nova linha, como o Excel faria ao copiar
+    if isinstance(valor, ArrayFormula):
+        return ArrayFormula(destino, Translator(valor.text, origin=origem).translate_formula(destino))
+    if isinstance(valor, str) and valor.startswith("="):
+        return Translator(valor, origin=origem).translate_formula(destino)
+    return valor
+
+
+def _replicar_linhas(ws, fator_uvrs):
+    # Abas com municípios na coluna B (forms, meses, Monitoramento, Irregulares) ganham UVRs
+    linhas = [row for row in ws.iter_rows(min_row=2) if isinstance(row[1].value, str) and row[1].value.strip()]
+    proxima = ws.max_row + 1
+    for copia in range(1, fator_uvrs):
+        for row in linhas:
+            for cell in row:
+                destino = ws.cell(row=proxima, column=cell.column)
+                destino.value = _valor_copiado(cell.value, cell.coordinate, destino.coordinate)
+                if cell.column == 2:
+                    destino.value = nome_sintetico(cell.value, copia)
+                if cell.has_style:
+                    destino._style = copy(cell._style)
+            altura = ws.row_dimensions[row[0].row].height
+            if altura is not None:
+                ws.row_dimensions[proxima].height = altura
+            proxima += 1
+
+
+def gerar_planilha_auxiliar(origem, destino, fator_uvrs, fator_meses):
+    """
+    Copia uma planilha auxiliar com fator_uvrs vezes as linhas de municípios e,
+    nas abas mensais (MM.AA), fator_meses vezes as abas.
+    """
+    wb = load_workbook(origem)
+    for ws in wb.worksheets:
+        if ws.cell(row=1, column=2).value in ("Município", "Municípios"):
+            _replicar_linhas(ws, fator_uvrs)
+
+    abas_mes = [ws for ws in wb.worksheets if _PADRAO_ABA_MES.match(ws.title)]
+    for mes in range(1, fator_meses):
+        for ws in abas_mes:
+            mm, aa = _PADRAO_ABA_MES.match(ws.title).groups()
+            copia = wb.copy_worksheet(ws)
+            copia.title = f"{mm}.{int(aa) + mes * ANOS_POR_COPIA:02d}"
+    wb.save(destino)
+
+
+def gerar_payloads(pasta_origem, pasta_destino, fator_uvrs, fator_meses):
+    # Entradas do json_script: uma planilha por (município, UVR, mês), copiada com novo nome
+    for arquivo in sorted(pasta_origem.glob("*.xlsx")):
+        if arquivo.name.startswith("~$"):
+            continue
+        partes = _PADRAO_PAYLOAD.match(arquivo.name)
+        if not partes:
+            shutil.copyfile(arquivo, pasta_destino / arquivo.name)
+            continue
+        municipio, uvr, mm, ano = partes.groups()
+        for copia in range(fator_uvrs):
+            nome = nome_sintetico(municipio.replace("_", " "), copia).replace(" ", "_")
+            for mes in range(fator_meses):
+                novo = f"{nome}_UVR-{uvr}_{mm}-{int(ano) + mes * ANOS_POR_COPIA}.xlsx"
+                shutil.copyfile(arquivo, pasta_destino / novo)
+
+
+def gerar_dados_lacunas(origem, destino, fator_uvrs, fator_meses):
+    # Só as abas filtradas são lidas pelo gerador de planilhas de lacunas
+    with pd.ExcelWriter(destino, engine="openpyxl") as writer:
+        for aba in ["Macro Dados - Filtrados", "Micro Dados - Filtrados"]:
+            df = pd.read_excel(origem, sheet_name=aba)
+            df["Data de referência"] = df["Data de referência"].map(
+                lambda v: v.strftime("%d/%m/%Y") if isinstance(v, pd.Timestamp) else v
+            )
+            df = _copias(df, fator_uvrs, fator_meses, ["Município"], ["Data de referência"])
+            # "UVR 01 - Formosa do Oeste" acompanha o município renomeado
+            df["UVR Município + Número"] = [
+                re.sub(r" - .*$", f" - {municipio}", str(uvr)) for uvr, municipio in zip(df["UVR Município + Número"], df["Município"])
+            ]
+            df.to_excel(writer, sheet_name=aba, index=False)
+
+
+def gerar(pasta_destino, escala=1, fator_uvrs=None, fator_meses=None, raiz_scripts=pasta_raiz_scripts):
+    """
+    Gera em `pasta_destino` uma cópia sintética das entradas de Monitoramento,
+    Engajamento e Inserção, na mesma estrutura de pastas de scripts/.
+
+    A escala é UVRs x meses: cada município dos CSVs e das planilhas auxiliares
+    é replicado `fator_uvrs` vezes (com nome próprio) e as abas/datas mensais
+    `fator_meses` vezes. Os fatores vêm de ESCALAS, ou podem ser informados.
+    """
+    padrao_uvrs, padrao_meses = ESCALAS.get(escala, (escala, 1))
+    fator_uvrs = fator_uvrs or padrao_uvrs
+    fator_meses = fator_meses or padrao_meses
+    if fator_meses > 1 and 25 + (fator_meses - 1) * ANOS_POR_COPIA > 99:
+        raise ValueError(f"fator_meses={fator_meses} ultrapassa os anos representáveis nas abas MM.AA")
+
+    pasta_destino = Path(pasta_destino)
+    if pasta_destino.exists():
+        shutil.rmtree(pasta_destino)
+
+    print(f">>> Gerando dados sintéticos ({fator_uvrs}x UVRs, {fator_meses}x meses) em {pasta_destino}")
+
+    # Monitoramento: CSVs dos forms, CSVs da validação e planilhas auxiliares
+    inputs_origem = raiz_scripts / "Monitoramento" / "inputs"
+    inputs_destino = pasta_destino / "Monitoramento" / "inputs"
+    inputs_destino.mkdir(parents=True)
+    (pasta_destino / "Monitoramento" / "outputs").mkdir()
+    gerar_csvs_forms(inputs_origem, inputs_destino, fator_uvrs, fator_meses)
+    gerar_csvs_validacao(inputs_origem, inputs_destino, fator_uvrs, fator_meses)
+    for pasta_convenio in sorted(p for p in inputs_origem.iterdir() if p.is_dir()):
+        (inputs_destino / pasta_convenio.name).mkdir()
+        for nome_arquivo in ARQUIVOS_AUXILIARES:
+            origem = pasta_convenio / nome_arquivo
+            if origem.exists():
+                print(f"Gerando '{pasta_convenio.name}/{nome_arquivo}'...")
+                gerar_planilha_auxiliar(origem, inputs_destino / pasta_convenio.name / nome_arquivo, fator_uvrs, fator_meses)
+
+    # Engajamento: lê as planilhas de monitoramento do GRS
+    engajamento = pasta_destino / "Engajamento" / "inputs"
+    engajamento.mkdir(parents=True)
+    for nome_arquivo in ARQUIVOS_AUXILIARES:
+        gerado = inputs_destino / "0 - GRS II" / nome_arquivo
+        if gerado.exists():
+            shutil.copyfile(gerado, engajamento / nome_arquivo)
+
+    # Inserção: planilhas de payload (json_script) e dados do gerador de lacunas
+    insercao_origem = raiz_scripts / "Inserção"
+    insercao_destino = pasta_destino / "Inserção"
+    dados_payload = insercao_destino / "script_json" / "inputs" / "dados"
+    dados_payload.mkdir(parents=True)
+    gerar_payloads(insercao_origem / "script_json" / "inputs" / "dados", dados_payload, fator_uvrs, fator_meses)
+    shutil.copytree(
+        insercao_origem / "script_json" / "inputs" / "tabelas_referencia",
+        insercao_destino / "script_json" / "inputs" / "tabelas_referencia"
+    )
+
+    lacunas_destino = insercao_destino / "planilha_lacunas" / "inputs"
+    lacunas_destino.mkdir(parents=True)
+    lacunas_origem = insercao_origem / "planilha_lacunas" / "inputs"
+    gerar_dados_lacunas(lacunas_origem / "dados.xlsx", lacunas_destino / "dados.xlsx", fator_uvrs, fator_meses)
+    shutil.copyfile(lacunas_origem / "template.xlsx", lacunas_destino / "template.xlsx")
+
+    # Gravado por último: sua presença indica que a geração terminou
+    fatores = {"escala": escala, "fator_uvrs": fator_uvrs, "fator_meses": fator_meses}
+    (pasta_destino / "escala.json").write_text(json.dumps(fatores, indent=2), encoding="utf-8")
+    return fatores
+
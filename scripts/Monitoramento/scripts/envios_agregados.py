@@ -0,0 +1,162 @@
+"""
+Extração agregada dos forms 1 a 4: em vez de uma linha por envio, o banco
+devolve uma linha por chave (município, UVR e, no Form 4, mês de referência)
+com o número de envios, as datas de envio em ordem e o status
+("Duplicado" quando há mais de um envio), agrupados com GROUP BY.
+
+A query original de cada form vira subconsulta, então os .sql não mudam.
+Os builders reconhecem o resultado agregado pelas colunas e montam o mesmo
+índice de envios que montam a partir do resultado linha a linha (ver
+`indexar_envios`, usado pelos forms 1 a 3).
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    from utils import normalizar_texto
+except ImportError:
+    from Monitoramento.scripts.utils import normalizar_texto
+
+# Colunas acrescentadas pela agregação
+COLUNA_ENVIOS = "envios"
+COLUNA_DATAS = "datas_envio"
+COLUNA_STATUS = "status"
+
+# Separador das datas de envio de uma chave (o mesmo usado nas planilhas)
+SEPARADOR_DATAS = ", "
+
+# Formato das datas de envio que chegam como texto (CSV sem tipagem)
+FORMATO_DATA_ENVIO = "%Y-%m-%d %H:%M:%S.%f"
+
+# Chaves de agrupamento de cada query, a coluna da data de envio e, no Form 4,
+# o mês de referência e as colunas das quais se guarda o valor do primeiro envio
+AGREGACOES = {
+    "form1.sql": {"chaves": ["municipio"], "data": "data_envio"},
+    "form2.sql": {"chaves": ["municipio", "uvr_nro"], "data": "data_envio"},
+    "form3.sql": {"chaves": ["municipio", "uvr_numero"], "data": "data_envio"},
+    "form4.sql": {
+        "chaves": ["gm_nome", "guvr_numero"], "data": "data_de_envio",
+        "mes": "data_de_referencia", "primeiros": ["nome_tc_uvr"]
+    }
+}
+
+
+def consulta_agregada(query, agregacao):
+    """
+    SQL que agrupa o resultado de `query` pelas chaves de `agregacao` (ver AGREGACOES).
+    As datas vêm formatadas como nas planilhas (DD/MM/AAAA, vazio quando nulas),
+    em ordem cronológica, e as chaves em ordem do primeiro envio.
+    """
+    coluna = lambda nome: f'consulta."{nome}"'
+    data = coluna(agregacao["data"])
+    grupo = [coluna(c) for c in agregacao["chaves"]]
+    selecao = list(grupo)
+    if agregacao.get("mes"):
+        # Primeiro dia do mês como data: o builder o converte para MM.AA como faria com a data original
+        mes = f"date_trunc('month', {coluna(agregacao['mes'])})::date"
+        grupo.append(mes)
+        selecao.append(f'{mes} AS "{agregacao["mes"]}"')
+    selecao += [
+        f'count(*) AS "{COLUNA_ENVIOS}"',
+        f"string_agg(coalesce(to_char({data}, 'DD/MM/YYYY'), ''), '{SEPARADOR_DATAS}' ORDER BY {data}) "
+        f'AS "{COLUNA_DATAS}"',
+        f"CASE WHEN count(*) > 1 THEN 'Duplicado' ELSE 'Enviado' END AS \"{COLUNA_STATUS}\""
+    ]
+    selecao += [
+        f'(array_agg({coluna(c)} ORDER BY {data}))[1] AS "{c}"' for c in agregacao.get("primeiros", [])
+    ]
+    query = query.strip().rstrip(";")
+    return (
+        f"SELECT {', '.join(selecao)}\n"
+        f"FROM ({query}) AS consulta\n"
+        f"GROUP BY {', '.join(grupo)}\n"
+        f"ORDER BY min({data})"
+    )
+
+
+def eh_agregado(df):
+    return COLUNA_ENVIOS in df.columns and COLUNA_DATAS in df.columns
+
+
+def _datas(texto, envios):
+    # Uma data por envio; sem nenhuma data válida a coluna chega vazia (nula)
+    if isinstance(texto, str):
+        return texto.split(SEPARADOR_DATAS)
+    return [""] * int(envios) if pd.notna(envios) else [""]
+
+
+def indexar_agregado(df, chaves, campo_datas="datas", extras=None):
+    """
+    Índice de envios a partir do resultado agregado, no formato que os builders
+    montam linha a linha: {chave: {campo_datas: [...], "status": ...}}.
+
+    `chaves` traz a chave de cada linha já normalizada (None para ignorar a linha)
+    e `extras`, se informado, os campos adicionais de cada linha. Linhas que a
+    normalização junta na mesma chave (ex: grafias diferentes do município) são
+    somadas e ficam como "Duplicado".
+    """
+    indice = {}
+    extras = extras if extras is not None else [{}] * len(df)
+    for chave, envios, texto, extra in zip(chaves, df[COLUNA_ENVIOS], df[COLUNA_DATAS], extras):
+        if chave is None:
+            continue
+        datas = _datas(texto, envios)
+        if chave in indice:
+            indice[chave][campo_datas].extend(datas)
+            indice[chave]["status"] = "Duplicado"
+        else:
+            indice[chave] = {campo_datas: datas, "status": "Duplicado" if len(datas) > 1 else "Enviado", **extra}
+    return indice
+
+
+def _por_valor(serie, funcao):
+    # Aplica `funcao` uma vez por valor distinto: municípios e UVRs se repetem a cada envio
+    codigos, valores = pd.factorize(pd.Series(serie), use_na_sentinel=False)
+    return np.array([funcao(v) for v in valores], dtype=object)[codigos]
+
+
+def chaves_envio(municipios, uvrs=None, formatar_uvr=format):
+    """
+    Chave de cada envio no índice dos builders: o município normalizado e, com
+    `uvrs`, "municipio_uvr" (a UVR passada por `formatar_uvr`). None quando o
+    município não é texto, para a linha ser ignorada.
+    """
+    chaves = _por_valor(municipios, lambda m: normalizar_texto(m) if isinstance(m, str) else None)
+    if uvrs is None:
+        return chaves
+    validas = chaves != None  # noqa: E711 (comparação elemento a elemento)
+    chaves[validas] = chaves[validas] + "_" + _por_valor(uvrs, lambda u: f"{formatar_uvr(u)}")[validas]
+    return chaves
+
+
+def datas_envio(serie):
+    """Datas de envio como DD/MM/AAAA; vazio quando nulas ou em texto fora de FORMATO_DATA_ENVIO."""
+    if not pd.api.types.is_datetime64_any_dtype(serie):
+        serie = pd.to_datetime(serie, format=FORMATO_DATA_ENVIO, errors="coerce")
+    # Formata cada dia uma vez (os envios se concentram em poucos dias); nulos têm código -1 -> ""
+    codigos, dias = pd.factorize(serie.dt.normalize())
+    return np.append(dias.strftime("%d/%m/%Y").to_numpy(dtype=object), "")[codigos]
+
+
+def indexar_envios(df, chaves, coluna_data):
+    """
+    Índice de envios a partir do resultado linha a linha (um envio por linha):
+    {chave: {"datas": [...], "status": "Enviado" | "Duplicado"}}, com as chaves
+    na ordem do primeiro envio e as datas na ordem das linhas.
+
+    `chaves` traz a chave de cada linha (ver `chaves_envio`; None para ignorar
+    a linha) e `coluna_data` a coluna da data de envio.
+    """
+    chaves = np.asarray(chaves, dtype=object)
+    validas = chaves != None  # noqa: E711
+    if not validas.any():
+        return {}
+    datas = datas_envio(df[coluna_data])[validas]
+    codigos, unicas = pd.factorize(chaves[validas])
+    # Ordenação estável por chave: cada grupo fica contíguo e com as datas na ordem original
+    ordem = np.argsort(codigos, kind="stable")
+    grupos = np.split(datas[ordem], np.cumsum(np.bincount(codigos))[:-1])
+    return {
+        chave: {"datas": grupo.tolist(), "status": "Duplicado" if len(grupo) > 1 else "Enviado"}
+        for chave, grupo in zip(unicas, grupos)
+    }
@@ -0,0 +1,330 @@
+"""
+Estado de validação manual das planilhas de monitoramento (Situação, Validado
+pelo Regional, Observações, respostas da equipe de TI e as datas de envio já
+registradas), guardado em um SQLite local por (convênio, form, município, UVR,
+mês, envio) e pela ocorrência da linha, já que uma aba pode repetir a chave.
+
+Os builders leem esse estado de uma vez por convênio, em vez de varrer as
+planilhas anteriores linha a linha. As edições dos analistas nas planilhas
+auxiliares de inputs/ entram no banco por uma importação única (`sincronizar`,
+antes dos builders), que só relê os arquivos alterados desde a última vez
+(hash do conteúdo).
+
+    python estado_validacao.py                # importa as planilhas de inputs/
+    python estado_validacao.py --forcar       # reimporta mesmo sem alteração
+"""
+import argparse
+import importlib
+import json
+import re
+import sqlite3
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from openpyxl import load_workbook
+
+from manifesto import hash_arquivo
+from utils import normalizar_texto, normalizar_uvr
+
+pasta_scripts = Path(__file__).resolve().parent
+pasta_inputs = pasta_scripts.parent / "inputs"
+
+# Fica junto das planilhas de onde o estado é importado (os dados sintéticos do benchmark têm o próprio)
+NOME_ARQUIVO = ".estado_validacao.sqlite"
+
+# Colunas que os builders levam do estado para as abas geradas: as preenchidas à mão
+# e as datas de envio já registradas (usadas para detectar envios novos)
+CAMPOS_MANUAIS = {
+    "Situação", "Data de Envio", "Validado pelo Regional", "Observações", "Formulários para Deletar (ID)",
+    "Validado Equip de TI", "Validado Equipe de TI", "Resposta Equipe de TI"
+}
+
+# Abas além das dos forms 1-3 (Form N - ...) e das mensais do Form 4 (MM.AA):
+# {aba: (form, coluna do mês, coluna da data de envio que também entra na chave)}
+ABAS_FORM4 = {
+    "Irregulares": ("4:irregulares", "Mês de referência", "Data de Envio"),
+    "Discrepantes": ("4:discrepantes", "Mês Referência", None),
+}
+
+# Bancos de versões anteriores são recriados e reimportados das planilhas
+VERSAO_ESQUEMA = 2
+
+ESQUEMA = """
+CREATE TABLE campos (
+    convenio TEXT NOT NULL,
+    form TEXT NOT NULL,
+    municipio TEXT NOT NULL,
+    uvr TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    envio TEXT NOT NULL,
+    ocorrencia INTEGER NOT NULL,
+    arquivo TEXT NOT NULL,
+    ordem INTEGER NOT NULL,
+    valores TEXT NOT NULL,
+    PRIMARY KEY (convenio, form, municipio, uvr, mes, envio, ocorrencia)
+);
+CREATE TABLE importacoes (
+    convenio TEXT NOT NULL,
+    arquivo TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    versao TEXT NOT NULL,
+    linhas INTEGER NOT NULL,
+    importado_em TEXT NOT NULL,
+    PRIMARY KEY (convenio, arquivo)
+);
+"""
+
+_TIPOS_DATA = {"datetime": datetime, "date": date, "time": time}
+
+
+def _codificar(valor):
+    # Datas e durações das células em JSON, recuperadas com o mesmo tipo por _decodificar
+    if isinstance(valor, (datetime, date, time)):
+        return {"$" + type(valor).__name__: valor.isoformat()}
+    if isinstance(valor, timedelta):
+        return {"$timedelta": valor.total_seconds()}
+    raise TypeError(f"Valor de célula não suportado: {valor!r}")
+
+
+def _decodificar(objeto):
+    if len(objeto) == 1:
+        (chave, valor), = objeto.items()
+        if chave == "$timedelta":
+            return timedelta(seconds=valor)
+        if chave.startswith("$") and chave[1:] in _TIPOS_DATA:
+            return _TIPOS_DATA[chave[1:]].fromisoformat(valor)
+    return objeto
+
+
+def _texto(valor):
+    return "" if valor is None else str(valor)
+
+
+def _versao(caminho):
+    # (mtime, tamanho) do arquivo: basta para saber se a planilha mudou desde a importação
+    estado = caminho.stat()
+    return f"{estado.st_mtime_ns}:{estado.st_size}"
+
+
+def _form_da_aba(aba):
+    # (form, coluna do mês, coluna da data de envio) de uma aba, ou None se ela não guarda estado
+    if aba in ABAS_FORM4:
+        return ABAS_FORM4[aba]
+    if aba.count('.') == 1 and all(x.isdigit() for x in aba.split('.')):
+        return "4", None, None
+    encontrado = re.match(r"Form (\d) - ", aba)
+    if encontrado:
+        return encontrado.group(1), None, None
+    return None
+
+
+def chave_linha(municipio, uvr, mes="", envio=""):
+    """
+    Chave de uma linha no estado (município e UVR normalizados), ou None se a
+    linha não tem município.
+    """
+    if not isinstance(municipio, str) or not municipio.strip():
+        return None
+    return normalizar_texto(municipio), _texto(normalizar_uvr(uvr)), _texto(mes), _texto(envio)
+
+
+def _linhas_planilha(caminho):
+    # Linhas com estado de cada aba: (form, chave + ocorrência, {cabeçalho: valor}).
+    # A ocorrência numera as linhas que repetem a chave no mesmo form, na ordem da aba
+    ocorrencias = Counter()
+    wb = load_workbook(caminho, read_only=True)
+    try:
+        for aba in wb.sheetnames:
+            form = _form_da_aba(aba)
+            if form is None:
+                continue
+            form, coluna_mes, coluna_envio = form
+
+            linhas = wb[aba].iter_rows(values_only=True)
+            cabecalhos = next(linhas, None)
+            if not cabecalhos or "Município" not in cabecalhos:
+                continue
+
+            for row in linhas:
+                valores = {
+                    cabecalho: row[i] if i < len(row) else None
+                    for i, cabecalho in enumerate(cabecalhos) if cabecalho is not None
+                }
+                chave = chave_linha(
+                    valores.get("Município"), valores.get("UVR"),
+                    valores.get(coluna_mes) if coluna_mes else (aba if form == "4" else ""),
+                    valores.get(coluna_envio) if coluna_envio else ""
+                )
+                if chave is not None:
+                    yield form, (*chave, ocorrencias[(form, chave)]), valores
+                    ocorrencias[(form, chave)] += 1
+    finally:
+        wb.close()
+
+
+class EstadoValidacao:
+    """
+    Banco SQLite com o estado de validação de uma pasta de inputs. Pode ser
+    aberto por vários processos ao mesmo tempo (um builder por convênio).
+    """
+
+    def __init__(self, pasta=pasta_inputs):
+        self.caminho = Path(pasta) / NOME_ARQUIVO
+        self.conexao = sqlite3.connect(self.caminho, timeout=60)
+        if self.conexao.execute("PRAGMA user_version").fetchone()[0] != VERSAO_ESQUEMA:
+            # O estado é só o conteúdo das planilhas: um banco de outra versão é recriado
+            self.conexao.executescript(
+                "BEGIN IMMEDIATE; DROP TABLE IF EXISTS campos; DROP TABLE IF EXISTS importacoes;"
+                f"{ESQUEMA} PRAGMA user_version = {VERSAO_ESQUEMA}; COMMIT;"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        self.conexao.close()
+
+    def importar(self, convenio, caminho, forcar=False):
+        """
+        Substitui o estado de `convenio` vindo da planilha `caminho` pelo conteúdo
+        atual dela. Retorna o número de linhas importadas, ou None se o arquivo
+        não mudou desde a última importação (ou não existe).
+        """
+        caminho = Path(caminho)
+        hash_atual = hash_arquivo(caminho)
+        if hash_atual is None:
+            return None
+        versao = _versao(caminho)
+
+        registro = self.conexao.execute(
+            "SELECT hash FROM importacoes WHERE convenio = ? AND arquivo = ?", (convenio, caminho.name)
+        ).fetchone()
+        if registro and registro[0] == hash_atual and not forcar:
+            # Conteúdo igual (ex: arquivo só copiado ou tocado): basta registrar a nova versão
+            with self.conexao:
+                self.conexao.execute(
+                    "UPDATE importacoes SET versao = ? WHERE convenio = ? AND arquivo = ?",
+                    (versao, convenio, caminho.name)
+                )
+            return None
+
+        linhas = [
+            (convenio, form, *chave, caminho.name, ordem, json.dumps(valores, default=_codificar, ensure_ascii=False))
+            for ordem, (form, chave, valores) in enumerate(_linhas_planilha(caminho))
+        ]
+        with self.conexao:
+            self.conexao.execute("DELETE FROM campos WHERE convenio = ? AND arquivo = ?", (convenio, caminho.name))
+            self.conexao.executemany("INSERT INTO campos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", linhas)
+            self.conexao.execute(
+                "INSERT OR REPLACE INTO importacoes VALUES (?, ?, ?, ?, ?, ?)",
+                (convenio, caminho.name, hash_atual, versao, len(linhas), datetime.now().isoformat(timespec="seconds"))
+            )
+        return len(linhas)
+
+    def atualizado(self, convenio, caminho):
+        """Indica se a planilha `caminho` não mudou desde a última importação."""
+        caminho = Path(caminho)
+        registro = self.conexao.execute(
+            "SELECT versao FROM importacoes WHERE convenio = ? AND arquivo = ?", (convenio, caminho.name)
+        ).fetchone()
+        return registro is not None and caminho.exists() and registro[0] == _versao(caminho)
+
+    def ler(self, convenio, form):
+        """
+        Estado de um form do convênio: {(município, UVR, mês, envio, ocorrência): {cabeçalho: valor}},
+        na ordem das linhas da planilha importada.
+        """
+        return self.ler_planilha(convenio, None, [form])[form]
+
+    def ler_planilha(self, convenio, caminho, forms):
+        """
+        Estado dos `forms` do convênio em uma única consulta: {form: {chave: {cabeçalho: valor}}},
+        com as chaves de `ler`. Com `caminho`, só as linhas vindas dessa planilha, que é
+        importada antes se mudou desde a última sincronização (os builders não a varrem
+        quando o estado está em dia).
+        """
+        parametros = [convenio, *forms]
+        filtro = f"convenio = ? AND form IN ({', '.join('?' * len(forms))})"
+        if caminho is not None:
+            if not self.atualizado(convenio, caminho):
+                self.importar(convenio, caminho)
+            filtro += " AND arquivo = ?"
+            parametros.append(Path(caminho).name)
+
+        resultado = {form: {} for form in forms}
+        cursor = self.conexao.execute(
+            f"SELECT form, municipio, uvr, mes, envio, ocorrencia, valores FROM campos WHERE {filtro} ORDER BY ordem",
+            parametros
+        )
+        for form, municipio, uvr, mes, envio, ocorrencia, valores in cursor:
+            resultado[form][(municipio, uvr, mes, envio, ocorrencia)] = json.loads(valores, object_hook=_decodificar)
+        return resultado
+
+
+def por_linha(estado):
+    """
+    Consulta do estado de um form (ver `EstadoValidacao.ler`) linha a linha, na
+    ordem da aba: cada chamada com a chave de uma linha (ver `chave_linha`)
+    devolve os campos da próxima ocorrência dessa chave, de modo que linhas que
+    repetem município/UVR recuperam cada uma o próprio estado.
+    """
+    ocorrencias = Counter()
+
+    def campos(chave):
+        if chave is None:
+            return None
+        ocorrencia = ocorrencias[chave]
+        ocorrencias[chave] += 1
+        return estado.get((*chave, ocorrencia))
+
+    return campos
+
+
+def aplicar_campos(row_data, cabecalhos, valores):
+    """
+    Leva para `row_data` (valores da linha, na ordem de `cabecalhos`) os campos
+    manuais guardados em `valores`; colunas sem estado ficam como estão.
+    """
+    if not valores:
+        return
+    for i, cabecalho in enumerate(cabecalhos):
+        if cabecalho in CAMPOS_MANUAIS and cabecalho in valores and i < len(row_data):
+            row_data[i] = valores[cabecalho]
+
+
+def sincronizar(pasta_inputs=pasta_inputs, builders=("script_form123", "script_form4"), convenios=None, forcar=False):
+    """
+    Importa para o estado as planilhas auxiliares dos builders que mudaram.
+    Retorna {(convênio, arquivo): linhas importadas} só com as reimportadas.
+    """
+    caminhos = {}
+    for nome in builders:
+        for convenio, caminho in importlib.import_module(nome).caminhos_auxiliares(pasta_inputs).items():
+            if not convenios or convenio in convenios:
+                caminhos[(convenio, Path(caminho))] = None
+
+    importados = {}
+    with EstadoValidacao(pasta_inputs) as estado:
+        for convenio, caminho in caminhos:
+            linhas = estado.importar(convenio, caminho, forcar)
+            if linhas is not None:
+                importados[(convenio, caminho.name)] = linhas
+    return importados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa as edições das planilhas auxiliares para o estado de validação.")
+    parser.add_argument("--forcar", action="store_true", help="reimporta todas as planilhas, mesmo sem alteração")
+    args = parser.parse_args()
+
+    importados = sincronizar(forcar=args.forcar)
+    for (convenio, arquivo), linhas in importados.items():
+        print(f"{convenio}: {arquivo} ({linhas} linhas)")
+    print(f"{len(importados)} planilha(s) importada(s) para {pasta_inputs / NOME_ARQUIVO}")
+
+
+if __name__ == "__main__":
+    main()
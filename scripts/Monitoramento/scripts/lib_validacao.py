@@ -1,228 +1,739 @@
+import csv
+import io
+import json
 import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+import numpy as np
 import pandas as pd
 import psycopg2
-from openpyxl import load_workbook
+from psycopg2 import pool as pg_pool
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment, Border, Side, Font, PatternFill
+from openpyxl.utils import get_column_letter
 from pathlib import Path
 
+try:
+    from envios_agregados import consulta_agregada
+    from manifesto import hash_arquivo
+    from regionais import carregar_registro
+    from tipagem import tipar_dataframe
+except ImportError:
+    from Monitoramento.scripts.envios_agregados import consulta_agregada
+    from Monitoramento.scripts.manifesto import hash_arquivo
+    from Monitoramento.scripts.regionais import carregar_registro
+    from Monitoramento.scripts.tipagem import tipar_dataframe
+
 
 # (db.py)
+def _parametros_conexao():
+    return {
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT")
+    }
+
 def get_db_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT")
+    return psycopg2.connect(**_parametros_conexao())
+
+def criar_pool_conexoes(max_conexoes):
+    """
+    Cria um pool de conexões limitado a `max_conexoes`, seguro para uso entre threads.
+    """
+    return pg_pool.ThreadedConnectionPool(1, max_conexoes, **_parametros_conexao())
+
+def _ler_consulta(caminho_sql, agregacao=None):
+    # Texto da query; com `agregacao` (ver envios_agregados), a versão agrupada no banco
+    query = caminho_sql.read_text(encoding='utf-8')
+    return consulta_agregada(query, agregacao) if agregacao else query
+
+class _CursorCronometrado:
+    # Repassa tudo ao cursor, anotando quando as linhas terminam de chegar do banco
+    def __init__(self, cursor, marcas):
+        self._cursor = cursor
+        self._marcas = marcas
+
+    def fetchall(self):
+        linhas = self._cursor.fetchall()
+        self._marcas["busca"] = time.perf_counter()
+        return linhas
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+class _ConexaoCronometrada:
+    # Conexão entregue ao read_sql_query no modo perfil: separa a busca da montagem do DataFrame
+    def __init__(self, conn, marcas):
+        self._conn = conn
+        self._marcas = marcas
+
+    def cursor(self, *args, **kwargs):
+        return _CursorCronometrado(self._conn.cursor(*args, **kwargs), self._marcas)
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+def _executar_consulta(caminho_sql, conn, agregacao=None, perfil=None):
+    # Executa a query na conexão recebida e devolve o DataFrame com os tipos do banco ajustados.
+    # Com `perfil` (dict), registra nele o tempo de cada fase do lado do cliente
+    query = _ler_consulta(caminho_sql, agregacao)
+    if perfil is None:
+        return tipar_dataframe(pd.read_sql_query(query, conn))
+
+    marcas = {}
+    inicio = time.perf_counter()
+    df = pd.read_sql_query(query, _ConexaoCronometrada(conn, marcas))
+    montagem = time.perf_counter()
+    df = tipar_dataframe(df)
+    fim = time.perf_counter()
+
+    busca = marcas.get("busca", montagem)
+    servidor = perfil.get("servidor_s") or 0.0
+    perfil.update(
+        consulta_s=round(busca - inicio, 4),
+        # O que passa do tempo de execução no servidor é rede e conversão das linhas pelo psycopg2
+        transferencia_s=round(max(busca - inicio - servidor, 0.0), 4),
+        dataframe_s=round(montagem - busca, 4),
+        tipagem_s=round(fim - montagem, 4),
+        linhas=len(df)
     )
+    return df
+
+def _nos_mais_lentos(plano, quantidade=3):
+    # Nós do plano com mais tempo próprio (total do nó menos o dos filhos, vezes as repetições)
+    nos = []
+
+    def visitar(no):
+        total = no.get("Actual Total Time", 0.0) * no.get("Actual Loops", 1)
+        filhos = no.get("Plans", [])
+        proprio = total - sum(f.get("Actual Total Time", 0.0) * f.get("Actual Loops", 1) for f in filhos)
+        descricao = no["Node Type"] + (f" em {no['Relation Name']}" if "Relation Name" in no else "")
+        nos.append({"no": descricao, "tempo_proprio_s": round(max(proprio, 0.0) / 1000, 4),
+                    "linhas": no.get("Actual Rows", 0) * no.get("Actual Loops", 1)})
+        for filho in filhos:
+            visitar(filho)
+
+    visitar(plano)
+    return sorted(nos, key=lambda n: n["tempo_proprio_s"], reverse=True)[:quantidade]
 
-def export_query_to_csv(query_file_name, output_csv_name, pasta_inputs):
+def perfilar_consulta(query, conn):
     """
-    Lê o arquivo SQL da pasta inputs, executa e salva o CSV na mesma pasta inputs.
+    Roda `EXPLAIN (ANALYZE, BUFFERS)` da query (que é executada no servidor, sem
+    trazer as linhas) e devolve o tempo de planejamento e de execução no servidor,
+    os blocos lidos do cache e do disco, os nós mais lentos e o plano completo.
+    """
+    inicio = time.perf_counter()
+    with conn.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query.strip().rstrip(';')}")
+        resultado = cursor.fetchone()[0]
+    conn.rollback()  # o EXPLAIN ANALYZE abre uma transação; nada foi alterado
+    explicacao = (json.loads(resultado) if isinstance(resultado, str) else resultado)[0]
+    plano = explicacao["Plan"]
+    return {
+        "servidor_s": round(explicacao.get("Execution Time", 0.0) / 1000, 4),
+        "planejamento_s": round(explicacao.get("Planning Time", 0.0) / 1000, 4),
+        "linhas_servidor": plano.get("Actual Rows"),
+        "blocos": {
+            "cache": plano.get("Shared Hit Blocks", 0),
+            "disco": plano.get("Shared Read Blocks", 0),
+            "temporarios": plano.get("Temp Read Blocks", 0) + plano.get("Temp Written Blocks", 0)
+        },
+        "nos_mais_lentos": _nos_mais_lentos(plano),
+        "explain_s": round(time.perf_counter() - inicio, 4),
+        "plano": explicacao
+    }
+
+def _resumo_perfil(sql_file, perfil):
+    lento = perfil["nos_mais_lentos"][0] if perfil["nos_mais_lentos"] else None
+    fases = "".join(
+        f", {rotulo} {perfil[chave]:.2f}s" for chave, rotulo in
+        [("transferencia_s", "transferência"), ("dataframe_s", "DataFrame"), ("tipagem_s", "tipagem"),
+         ("streaming_s", "streaming para o CSV")]
+        if chave in perfil
+    )
+    return (f"[PERFIL] {sql_file}: servidor {perfil['servidor_s']:.2f}s (planejamento {perfil['planejamento_s']:.2f}s)"
+            f"{fases}; blocos cache/disco {perfil['blocos']['cache']}/{perfil['blocos']['disco']}"
+            + (f"; nó mais lento: {lento['no']} ({lento['tempo_proprio_s']:.2f}s)" if lento else ""))
+
+def gravar_csv(df, caminho_csv):
+    # Cópia em CSV da extração, para auditoria ou para rodar depois sem o banco
+    df.to_csv(caminho_csv, index=False, encoding="utf-8-sig")
+
+# Linhas trazidas do servidor a cada ida ao banco na extração em streaming
+TAMANHO_LOTE_STREAMING = 20000
+
+def exportar_streaming(caminho_sql, conn, caminho_csv, tamanho_lote=TAMANHO_LOTE_STREAMING, agregacao=None):
+    """
+    Executa a query em um cursor do lado do servidor e grava o CSV em lotes de
+    `tamanho_lote` linhas, sem montar o DataFrame: a memória fica constante,
+    qualquer que seja o tamanho do resultado. Retorna o número de linhas.
+
+    O CSV é escrito em um arquivo temporário e só substitui o anterior ao
+    final; se a extração falhar, a cópia local continua intacta.
+    """
+    # DECLARE ... CURSOR aceita uma única instrução, sem o ";" final
+    query = _ler_consulta(caminho_sql, agregacao).strip().rstrip(";")
+    temporario = caminho_csv.with_name(f".{caminho_csv.name}.parcial")
+    linhas = 0
+    try:
+        with conn.cursor(name=f"extracao_{uuid.uuid4().hex}") as cursor, \
+                open(temporario, "w", newline="", encoding="utf-8-sig") as f:
+            cursor.execute(query)
+            escritor = csv.writer(f)
+            # Em cursores nomeados, as colunas só são conhecidas após a primeira busca
+            lote = cursor.fetchmany(tamanho_lote)
+            escritor.writerow([coluna.name for coluna in cursor.description])
+            while lote:
+                escritor.writerows(lote)
+                linhas += len(lote)
+                lote = cursor.fetchmany(tamanho_lote)
+        conn.rollback()  # encerra a transação aberta pelo cursor (só leitura)
+        temporario.replace(caminho_csv)
+    finally:
+        temporario.unlink(missing_ok=True)
+    return linhas
+
+def _linhas_por_s(linhas, tempo):
+    return round(linhas / tempo) if tempo > 0 else None
+
+def _idade(segundos):
+    return f"há {segundos / 60:.0f} min" if segundos >= 60 else f"há {segundos:.0f}s"
+
+def _buscar_cache(cache, caminho_sql, caminho_csv, streaming, gravar, parametros=None):
+    """
+    Resultado da query guardado no cache: (DataFrame ou None, linhas, idade em s),
+    ou None se não houver entrada válida. Grava o CSV quando pedido; em streaming
+    o CSV guardado é copiado e não há DataFrame.
+    """
+    if streaming:
+        encontrado = cache.copiar_csv(caminho_sql, caminho_csv, parametros)
+        return None if encontrado is None else (None, *encontrado)
+    encontrado = cache.buscar(caminho_sql, parametros)
+    if encontrado is None:
+        return None
+    df, idade = encontrado
+    if gravar:
+        gravar_csv(df, caminho_csv)
+    return df, len(df), idade
+
+def _como_texto(df):
+    # Valores como ficariam no CSV, para juntar o que vem do banco ao que já está em disco
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)), dtype=str)
+
+class ExtracaoIncremental:
+    """
+    Extração incremental: cada query tem uma marca d'água (a maior data de envio
+    já extraída) e só as linhas a partir dela são buscadas no banco. O CSV da
+    query em inputs/ é o armazenamento local, em que as linhas novas são
+    acrescentadas ao final; o estado das marcas fica em `caminho`.
+
+    Linhas sem data de envio (marca nula) são buscadas de novo a cada execução;
+    o que já está no CSV é reconhecido pela chave da query em `chaves`
+    ({arquivo .sql: colunas}), ou pela linha inteira quando ela não tem chave.
+
+    A extração completa é feita na primeira vez, quando a query ou suas colunas
+    mudam e a cada `dias_completa` dias, o que reflete linhas apagadas ou
+    corrigidas no banco.
+    """
+
+    def __init__(self, caminho, colunas, dias_completa=7, forcar_completa=False, chaves=None):
+        self.caminho = Path(caminho)
+        self.colunas = dict(colunas)  # {arquivo .sql: coluna da marca d'água}
+        self.chaves = dict(chaves or {})
+        self.dias_completa = dias_completa
+        self.forcar_completa = forcar_completa
+        self._trava = threading.Lock()  # as queries rodam em threads do mesmo pool
+        self.estado = {}
+        if self.caminho.exists():
+            try:
+                self.estado = json.loads(self.caminho.read_text(encoding="utf-8"))
+            except (ValueError, OSError) as e:
+                print(f"[AVISO] Estado da extração incremental ilegível ({e}). As queries serão extraídas por completo.")
+
+    def atende(self, sql_file):
+        return sql_file in self.colunas
+
+    def _motivo_completa(self, sql_file, caminho_sql, caminho_csv):
+        # Motivo para extrair a query inteira, ou None se a incremental basta
+        registro = self.estado.get(sql_file)
+        if self.forcar_completa:
+            return "extração completa solicitada"
+        if registro is None or registro.get("marca") is None:
+            return "sem marca d'água"
+        if not caminho_csv.exists():
+            return "CSV local inexistente"
+        if registro["coluna"] != self.colunas[sql_file] or registro["hash_sql"] != hash_arquivo(caminho_sql):
+            return "query alterada"
+        idade = datetime.now() - datetime.fromisoformat(registro["completa_em"])
+        if idade >= timedelta(days=self.dias_completa):
+            return f"última extração completa há {idade.days} dias"
+        return None
+
+    def _registrar(self, sql_file, caminho_sql, marca, completa):
+        with self._trava:
+            registro = self.estado.setdefault(sql_file, {})
+            registro.update(coluna=self.colunas[sql_file], hash_sql=hash_arquivo(caminho_sql), marca=marca)
+            if completa:
+                registro["completa_em"] = datetime.now().isoformat(timespec="seconds")
+            temporario = self.caminho.with_name(self.caminho.name + ".tmp")
+            temporario.write_text(json.dumps(self.estado, ensure_ascii=False, indent=2), encoding="utf-8")
+            temporario.replace(self.caminho)
+
+    def _marca(self, df, coluna, anterior=None):
+        # Maior data de envio do DataFrame (ou a anterior, se ele não tiver nenhuma)
+        if coluna not in df.columns:
+            raise ValueError(f"coluna da marca d'água ausente no resultado: {coluna}")
+        maior = pd.to_datetime(df[coluna], format="ISO8601").max()
+        if anterior is not None:
+            maior = max(maior, pd.Timestamp(anterior)) if pd.notna(maior) else pd.Timestamp(anterior)
+        return None if pd.isna(maior) else maior.isoformat(sep=" ")
+
+    def extrair(self, sql_file, caminho_sql, conn, caminho_csv):
+        """
+        Extrai a query e atualiza o CSV local. Retorna (DataFrame tipado com o
+        histórico inteiro, linhas lidas do banco, linhas novas, modo).
+        """
+        coluna = self.colunas[sql_file]
+        motivo = self._motivo_completa(sql_file, caminho_sql, caminho_csv)
+        if motivo is None:
+            resultado = self._extrair_novas(sql_file, caminho_sql, conn, caminho_csv)
+            if resultado is not None:
+                return resultado
+            motivo = "colunas do CSV local diferentes das da query"
+
+        df = _executar_consulta(caminho_sql, conn)
+        gravar_csv(df, caminho_csv)
+        self._registrar(sql_file, caminho_sql, self._marca(df, coluna), completa=True)
+        return df, len(df), len(df), f"completa ({motivo})"
+
+    def _extrair_novas(self, sql_file, caminho_sql, conn, caminho_csv):
+        coluna = self.colunas[sql_file]
+        marca = self.estado[sql_file]["marca"]
+        # A query original vira subconsulta; "%" literal precisa ser escapado por causa do parâmetro
+        query = caminho_sql.read_text(encoding='utf-8').strip().rstrip(";").replace("%", "%%")
+        consulta = (
+            f'SELECT * FROM ({query}) AS consulta '
+            f'WHERE consulta."{coluna}" >= %(marca)s OR consulta."{coluna}" IS NULL'
+        )
+        lidas = pd.read_sql_query(consulta, conn, params={"marca": marca})
+
+        existente = pd.read_csv(caminho_csv, dtype=str)
+        if list(lidas.columns) != list(existente.columns):
+            return None
+
+        chave = list(self.chaves.get(sql_file) or existente.columns)
+        ausentes = [c for c in chave if c not in existente.columns]
+        if ausentes:
+            raise ValueError(f"colunas da chave ausentes no resultado: {', '.join(ausentes)}")
+
+        # Linhas já gravadas (empate na marca, marca nula ou execução interrompida antes de
+        # salvar o estado) não se repetem. O lote é tipado como na extração completa (1.0
+        # é gravado 1 e 12.50, 12.5), e a chave é comparada no texto do CSV depois de tipar
+        # histórico e lote juntos, para um lote só de inteiros não virar 7 contra o 7.0 gravado
+        lote = _como_texto(tipar_dataframe(lidas))
+        textos = _como_texto(tipar_dataframe(pd.concat([existente[chave], lote[chave]], ignore_index=True)))
+        textos = textos.fillna("")
+        gravadas = pd.MultiIndex.from_frame(textos.iloc[:len(existente)])
+        novas = lote.loc[~pd.MultiIndex.from_frame(textos.iloc[len(existente):]).isin(gravadas)]
+        if not novas.empty:
+            novas.to_csv(caminho_csv, mode="a", header=False, index=False, encoding="utf-8")
+
+        self._registrar(sql_file, caminho_sql, self._marca(lote, coluna, marca), completa=False)
+        # Tipado junto com o histórico, o lote novo fica com os mesmos tipos do CSV
+        df = tipar_dataframe(pd.concat([existente, novas], ignore_index=True))
+        return df, len(lidas), len(novas), "incremental"
+
+def consultar(query_file_name, pasta_inputs, output_csv_name=None, cache=None):
+    """
+    Lê o arquivo SQL da pasta inputs, executa e devolve o DataFrame tipado (None em caso de falha).
+    Com `output_csv_name`, grava também o CSV na pasta inputs.
+    Com `cache` (um `CacheConsultas`), um resultado guardado e ainda válido é usado
+    sem consultar o banco, e o que vem do banco é guardado.
     """
-    # Define os caminhos
     caminho_sql = pasta_inputs / query_file_name
-    caminho_csv = pasta_inputs / output_csv_name
 
     if not caminho_sql.exists():
         print(f"[ERRO] Arquivo SQL não encontrado: {caminho_sql}")
-        return
+        return None
 
     try:
-        conn = get_db_connection()
-        query = caminho_sql.read_text(encoding='utf-8')
-        
-        df = pd.read_sql_query(query, conn)
-        
-        # Salva na pasta INPUTS
-        df.to_csv(caminho_csv, index=False, encoding="utf-8-sig")
-        print(f"[OK] Dados extraídos e salvos em: {caminho_csv.name}")
-        
-        conn.close()
+        inicio = time.perf_counter()
+        encontrado = None
+        if cache is not None:
+            caminho_csv = pasta_inputs / output_csv_name if output_csv_name else None
+            encontrado = _buscar_cache(cache, caminho_sql, caminho_csv, False, caminho_csv is not None)
+        if encontrado is not None:
+            df, _, idade = encontrado
+            origem = f"do cache ({_idade(idade)})"
+        else:
+            conn = get_db_connection()
+            try:
+                df = _executar_consulta(caminho_sql, conn)
+            finally:
+                conn.close()
+            if cache is not None:
+                cache.guardar(caminho_sql, df)
+            if output_csv_name:
+                gravar_csv(df, pasta_inputs / output_csv_name)
+            origem = "do banco"
+        tempo = time.perf_counter() - inicio
+        if output_csv_name:
+            print(f"[OK] Dados {origem} salvos em: {output_csv_name} ({len(df)} linhas em {tempo:.2f}s)")
+        else:
+            print(f"[OK] Dados {origem}: {query_file_name} ({len(df)} linhas em {tempo:.2f}s)")
+        return df
     except Exception as e:
-        print(f"[ERRO] Falha ao conectar ou salvar {output_csv_name}: {e}")
+        print(f"[ERRO] Falha ao conectar ou extrair {query_file_name}: {e}")
+        return None
 
+def export_query_to_csv(query_file_name, output_csv_name, pasta_inputs, streaming=False, cache=None):
+    """
+    Lê o arquivo SQL da pasta inputs, executa e salva o CSV na mesma pasta inputs.
+    Com `streaming=True` o resultado vai direto para o CSV, em lotes, e a função
+    retorna o número de linhas (None em caso de falha) em vez do DataFrame.
+    Com `cache`, repetições da query dentro da validade do cache não vão ao banco.
+    """
+    if not streaming:
+        return consultar(query_file_name, pasta_inputs, output_csv_name, cache)
 
-# (saver.py)
-def __adjust_column_size(ws):
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            if cell.value:
+    caminho_sql = pasta_inputs / query_file_name
+    if not caminho_sql.exists():
+        print(f"[ERRO] Arquivo SQL não encontrado: {caminho_sql}")
+        return None
+
+    try:
+        inicio = time.perf_counter()
+        caminho_csv = pasta_inputs / output_csv_name
+        encontrado = _buscar_cache(cache, caminho_sql, caminho_csv, True, True) if cache is not None else None
+        if encontrado is not None:
+            _, linhas, idade = encontrado
+            origem = f"do cache ({_idade(idade)})"
+        else:
+            conn = get_db_connection()
+            try:
+                linhas = exportar_streaming(caminho_sql, conn, caminho_csv)
+            finally:
+                conn.close()
+            if cache is not None:
+                cache.guardar_csv(caminho_sql, caminho_csv, linhas)
+            origem = "do banco"
+        tempo = time.perf_counter() - inicio
+        print(f"[OK] Dados {origem} salvos em: {output_csv_name} "
+              f"({linhas} linhas em {tempo:.2f}s, {_linhas_por_s(linhas, tempo)} linhas/s)")
+        return linhas
+    except Exception as e:
+        print(f"[ERRO] Falha ao conectar ou extrair {query_file_name}: {e}")
+        return None
+
+def exportar_queries_concorrente(mapa_queries, pasta_inputs, max_conexoes=4, ao_concluir=None, gravar=True,
+                                 streaming=False, incremental=None, cache=None, agregacoes=None, perfil=False):
+    """
+    Executa todas as queries de `mapa_queries` (pares sql -> csv) em paralelo,
+    compartilhando um pool de no máximo `max_conexoes` conexões.
+
+    Uma falha afeta apenas a própria query. Retorna uma lista de dicionários com
+    o status, o tempo (s), o número de linhas, as linhas por segundo e o
+    DataFrame tipado ("dados") de cada extração. Se informada, `ao_concluir` é
+    chamada com o dicionário de cada query assim que ela termina. Com
+    `gravar=False` o CSV não é escrito.
+
+    Com `streaming=True` cada resultado é gravado no CSV em lotes, sem passar por
+    um DataFrame (ver `exportar_streaming`): "dados" fica None e quem consome lê o CSV.
+
+    Com `incremental` (uma `ExtracaoIncremental`), as queries que ela atende só
+    buscam as linhas novas e as acrescentam ao CSV; "dados" traz o histórico
+    inteiro, "linhas" as lidas do banco e "linhas_novas" as acrescentadas.
+
+    Com `cache` (um `CacheConsultas`), as demais queries com resultado guardado
+    e válido não vão ao banco; "origem" indica "cache" ou "banco".
+
+    Com `agregacoes` ({arquivo .sql: agregação}, ver envios_agregados), essas
+    queries são agrupadas no banco e trazem uma linha por chave em vez de uma
+    por envio; no cache, ficam separadas do resultado linha a linha.
+
+    Com `perfil=True`, cada query que vai ao banco (exceto as incrementais) é
+    antes analisada com EXPLAIN (ANALYZE, BUFFERS) — e portanto executada duas
+    vezes no servidor — e "perfil" traz o tempo no servidor, a transferência,
+    a montagem e a tipagem do DataFrame (ver `perfilar_consulta`). O tempo do
+    EXPLAIN não entra em "tempo" e o cache não é lido, só atualizado.
+    """
+    agregacoes = agregacoes or {}
+    parametros = lambda sql_file: {"agregacao": agregacoes[sql_file]} if sql_file in agregacoes else None
+    ao_concluir = ao_concluir or (lambda resultado: None)
+    resultados = {
+        sql_file: {"sql": sql_file, "csv": csv_file, "status": "pendente", "tempo": 0.0, "linhas": 0,
+                   "linhas_por_s": None, "linhas_novas": None, "modo": None, "origem": None, "erro": None,
+                   "dados": None}
+        for sql_file, csv_file in mapa_queries
+    }
+
+    pendentes = []
+    for sql_file, csv_file in mapa_queries:
+        if not (pasta_inputs / sql_file).exists():
+            resultados[sql_file].update(status="erro", erro=f"Arquivo SQL não encontrado: {pasta_inputs / sql_file}")
+            ao_concluir(resultados[sql_file])
+        elif cache is not None and not perfil and not (incremental is not None and incremental.atende(sql_file)):
+            # Resolvidas antes de abrir o pool: se todas estiverem no cache, o banco nem é acessado
+            inicio = time.perf_counter()
+            try:
+                encontrado = _buscar_cache(cache, pasta_inputs / sql_file, pasta_inputs / csv_file, streaming, gravar,
+                                           parametros(sql_file))
+            except Exception as e:
+                print(f"[AVISO] Cache de {sql_file} ilegível ({e}). Consultando o banco.")
+                encontrado = None
+            if encontrado is None:
+                pendentes.append((sql_file, csv_file))
+                continue
+            df, linhas, idade = encontrado
+            tempo = time.perf_counter() - inicio
+            resultados[sql_file].update(
+                status="ok", linhas=linhas, tempo=tempo, linhas_por_s=_linhas_por_s(linhas, tempo), dados=df,
+                origem="cache"
+            )
+            print(f"[OK] {sql_file} -> {csv_file if gravar or streaming else 'memória'} "
+                  f"(cache {_idade(idade)}, {linhas} linhas em {tempo:.2f}s)")
+            ao_concluir(resultados[sql_file])
+        else:
+            pendentes.append((sql_file, csv_file))
+
+    if not pendentes:
+        return list(resultados.values())
+
+    # Nunca abre mais threads do que conexões: getconn() não bloqueia quando o pool esgota
+    n_conexoes = max(1, min(max_conexoes, len(pendentes)))
+    try:
+        pool = criar_pool_conexoes(n_conexoes)
+    except Exception as e:
+        for sql_file, _ in pendentes:
+            resultados[sql_file].update(status="erro", erro=f"Falha ao criar pool de conexões: {e}")
+            ao_concluir(resultados[sql_file])
+        return list(resultados.values())
+
+    def tarefa(sql_file, csv_file):
+        inicio = time.perf_counter()
+        conn = pool.getconn()
+        extras = {}
+        perfil_sql = None
+        try:
+            if perfil and not (incremental is not None and incremental.atende(sql_file)):
+                perfil_sql = perfilar_consulta(_ler_consulta(pasta_inputs / sql_file, agregacoes.get(sql_file)), conn)
+                extras["perfil"] = perfil_sql
+            if incremental is not None and incremental.atende(sql_file):
+                df, linhas, novas, modo = incremental.extrair(sql_file, pasta_inputs / sql_file, conn, pasta_inputs / csv_file)
+                extras = {"linhas_novas": novas, "modo": modo}
+            elif streaming:
+                df = None
+                inicio_streaming = time.perf_counter()
+                linhas = exportar_streaming(pasta_inputs / sql_file, conn, pasta_inputs / csv_file,
+                                            agregacao=agregacoes.get(sql_file))
+                if perfil_sql is not None:
+                    perfil_sql["streaming_s"] = round(time.perf_counter() - inicio_streaming, 4)
+                if cache is not None:
+                    cache.guardar_csv(pasta_inputs / sql_file, pasta_inputs / csv_file, linhas, parametros(sql_file))
+            else:
+                df = _executar_consulta(pasta_inputs / sql_file, conn, agregacoes.get(sql_file), perfil_sql)
+                linhas = len(df)
+                if cache is not None:
+                    cache.guardar(pasta_inputs / sql_file, df, parametros(sql_file))
+                if gravar:
+                    gravar_csv(df, pasta_inputs / csv_file)
+        finally:
+            pool.putconn(conn)
+        return df, linhas, extras, time.perf_counter() - inicio - (perfil_sql["explain_s"] if perfil_sql else 0.0)
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_conexoes) as executor:
+            futuros = {executor.submit(tarefa, sql, csv): sql for sql, csv in pendentes}
+            for futuro in as_completed(futuros):
+                sql_file = futuros[futuro]
                 try:
-                    max_length = max(max_length, len(str(cell.value)) + 5)
-                except:
-                    pass
-        ws.column_dimensions[column_letter].width = max_length + 2
-
-def __adjust_borders(ws):
-    border_style = Border(
-        top=Side(border_style='thin', color='000000'),
-        bottom=Side(border_style='thin', color='000000'),
-        left=Side(border_style='thin', color='000000'),
-        right=Side(border_style='thin', color='000000')
-    )
-    for row in ws.iter_rows(max_col=ws.max_column):
-        for cell in row:
-            cell.border = border_style
-
-def __align_rows(ws):
-    for row in ws.iter_rows(max_col=ws.max_column):
-        for cell in row:
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-
-def __compare_cells(ws, row, col1, col2):
-    v1 = ws[f"{col1}{row}"].value
-    v2 = ws[f"{col2}{row}"].value
-    return v1 == v2
-
-def __paint(ws):
-    # Cabeçalho
-    for cell in ws["1:1"]:
-        cell.font = Font(color="FFFFFF")
-        cell.fill = PatternFill(start_color="244062", end_color="244062", fill_type="solid")
-
-    for cell in ws["E:E"]:
-        if cell.row == 1: continue
-        
-        row = cell.row
-        # Regras de pintura condicionais
-        if not __compare_cells(ws, row, "F", "G"):
-            ws[f"F{row}"].fill = PatternFill(start_color="ffc7ce", end_color="ffc7ce", fill_type="solid")
-
-        if not __compare_cells(ws, row, "H", "I"):
-            ws[f"H{row}"].fill = PatternFill(start_color="ffc7ce", end_color="ffc7ce", fill_type="solid")
-
-        if not __compare_cells(ws, row, "J", "K"):
-            ws[f"J{row}"].fill = PatternFill(start_color="ffc7ce", end_color="ffc7ce", fill_type="solid")
-
-        val_l = ws[f"L{row}"].value
-        if val_l != 0 and __compare_cells(ws, row, "L", "M"):
-             ws[f"L{row}"].fill = PatternFill(start_color="ffc7ce", end_color="ffc7ce", fill_type="solid")
+                    df, linhas, extras, tempo = futuro.result()
+                    resultados[sql_file].update(
+                        status="ok", linhas=linhas, tempo=tempo, linhas_por_s=_linhas_por_s(linhas, tempo), dados=df,
+                        origem="banco", **extras
+                    )
+                    destino = resultados[sql_file]['csv'] if gravar or streaming or "modo" in extras else "memória"
+                    detalhe = f", {extras['linhas_novas']} novas, {extras['modo']}" if "modo" in extras else ""
+                    print(f"[OK] {sql_file} -> {destino} (banco, {linhas} linhas em {tempo:.2f}s, "
+                          f"{resultados[sql_file]['linhas_por_s']} linhas/s{detalhe})")
+                    if "perfil" in extras:
+                        print(_resumo_perfil(sql_file, extras["perfil"]))
+                except Exception as e:
+                    resultados[sql_file].update(status="erro", erro=str(e))
+                    print(f"[ERRO] Falha ao extrair {sql_file}: {e}")
+                ao_concluir(resultados[sql_file])
+    finally:
+        pool.closeall()
+
+    return list(resultados.values())
+
+
+# (saver.py)
+# Estilos do relatório de validação
+_BORDA = Border(
+    top=Side(border_style='thin', color='000000'),
+    bottom=Side(border_style='thin', color='000000'),
+    left=Side(border_style='thin', color='000000'),
+    right=Side(border_style='thin', color='000000')
+)
+_ALINHAMENTO = Alignment(horizontal='center', vertical='center')
+_FONTE_CABECALHO = Font(color="FFFFFF")
+_COR_CABECALHO = "244062"
+_COR_DESTAQUE = "ffc7ce"
+# Formatos de data e data/hora do df.to_excel
+_FORMATO_DATA = "YYYY-MM-DD"
+_FORMATO_DATA_HORA = "YYYY-MM-DD HH:MM:SS"
+
+def _preenchimento(cor):
+    return PatternFill(start_color=cor, end_color=cor, fill_type="solid")
+
+def _valor_planilha(valor):
+    # Valor como a planilha o devolve ao ser lida: vazio vira None e números são
+    # gravados com 16 dígitos significativos ("%.16g"), inteiros sem ".0"
+    if valor is None or valor is pd.NaT or valor is pd.NA or valor == "":
+        return None
+    if isinstance(valor, bool):
+        return valor
+    if isinstance(valor, (float, np.floating)):
+        if np.isnan(valor):
+            return None
+        if np.isinf(valor):
+            return "inf" if valor > 0 else "-inf"
+        texto = "%.16g" % valor
+        return float(texto) if any(c in texto for c in ".eE") else int(texto)
+    if isinstance(valor, np.integer):
+        return int(valor)
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime()
+    return valor
+
+def _coluna_planilha(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        # Datas tipadas voltam ao texto do CSV da extração ("2025-11-01" quando
+        # não há hora), como o relatório sempre as gravou
+        serie = serie.astype(str).where(serie.notna(), None)
+    return pd.Series([_valor_planilha(v) for v in serie.tolist()], index=serie.index, dtype=object)
+
+def __add_regionals(df):
+    # Regional de cada município (2ª coluna da consulta) pelo cadastro; Expansão tem prioridade
+    cidades = df.iloc[:, 1]
+    regionais = carregar_registro().regionais_dos_municipios(cidades, ["expansao", "grs"])
+    dados = df.copy(deep=False)
+    dados.insert(0, "regional", regionais.to_numpy(dtype=object), allow_duplicates=True)
+    return dados
+
+def __delete_null(df):
+    """
+    Remove as linhas sem mês de referência (coluna E da planilha) antes da
+    escrita. Retorna o DataFrame filtrado e o número de linhas descartadas.
+    """
+    mes = df.iloc[:, 4]
+    manter = mes.notna() & (mes.astype(object) != "")
+    return df[manter], int((~manter).sum())
+
+def __adjust_column_size(nomes, colunas):
+    # Largura de cada coluna pelo maior texto, cabeçalho incluído
+    larguras = []
+    for nome, valores in zip(nomes, colunas):
+        max_length = max((len(str(v)) + 5 for v in [nome, *valores] if v), default=0)
+        larguras.append(max_length + 2)
+    return larguras
+
+def __paint(colunas, linhas):
+    """
+    Cor de preenchimento de cada célula do corpo do relatório, por coluna
+    ({letra: array com a cor ou None}), calculada sobre a coluna inteira.
+    Colunas ausentes contam como vazias.
+    """
+    vazia = np.full(linhas, None, dtype=object)
+    valores = lambda col: colunas[col].to_numpy() if col in colunas else vazia
+    # Vazio é igual a vazio e números se comparam pelo valor, como na planilha
+    iguais = lambda col1, col2: valores(col1) == valores(col2)
+    destaques = {}
+
+    # Regras de pintura condicionais
+    for col1, col2 in [("F", "G"), ("H", "I"), ("J", "K")]:
+        destaques[col1] = ~iguais(col1, col2)
+    destaques["L"] = (valores("L") != 0) & iguais("L", "M")
 
     # Notas Fiscais
-    for cell in ws["N:N"]:
-        if cell.row == 1: continue
-        if str(cell.value).lower() == "não":
-            cell.fill = PatternFill(start_color="ffc7ce", end_color="ffc7ce", fill_type="solid")
-    
+    destaques["N"] = pd.Series(valores("N")).astype(str).str.lower().eq("não").to_numpy()
+
     # Percentual Despesas
     for col in ["Q", "R"]:
-        for cell in ws[f"{col}:{col}"]:
-            if cell.row == 1: continue
-            try:
-                if float(cell.value) >= 60:
-                    cell.fill = PatternFill(start_color="ffc7ce", end_color="ffc7ce", fill_type="solid")
-            except:
-                pass
-
-    # Cores Regionais
-    colors = {
-        "Gabriel": "a9c5e6", "Bianca": "ffff99", "Valquiria": "b2ffff",
-        "Larissa": "f1e0c6", "Luana": "ffccff", "Paranavaí": "9b59b6",
-        "Maringá": "ffccff", "Francisco Beltrão": "b2ffff",
-        "Londrina": "a9c5e6", "Guarapuava": "f1e0c6", "Curitiba": "ffff99"
-    }
-    for cell in ws["A:A"]:
-        if cell.row == 1: continue
-        if cell.value in colors:
-            cell.fill = PatternFill(start_color=colors[cell.value], end_color=colors[cell.value], fill_type="solid")
-
-def __add_regionals(ws):
-    grs = {
-        "Altônia": "Gabriel", "Anahy": "Bianca", "Assis Chateaubriand": "Gabriel",
-        "Boa Vista da Aparecida": "Bianca", "Braganey": "Bianca", "Brasilândia do Sul": "Gabriel",
-        "Cafelândia": "Valquiria", "Campo Bonito": "Bianca", "Capitão Leônidas Marques": "Bianca",
-        "Cascavel": "Valquiria", "Catanduvas": "Bianca", "Céu Azul": "Luana", "Corbélia": "Bianca",
-        "Diamante D'Oeste": "Luana", "Diamante do Sul": "Bianca", "Entre Rios do Oeste": "Luana",
-        "Formosa do Oeste": "Valquiria", "Foz do Iguaçu": "Larissa",
-        "Francisco Alves": "Gabriel", "Guaíra": "Gabriel",
-        "Guaraniaçu": "Bianca", "Ibema": "Bianca", "Iguatu": "Bianca",
-        "Iracema do Oeste": "Valquiria", "Itaipulândia": "Luana", "Jesuítas": "Valquiria",
-        "Lindoeste": "Bianca", "Marechal Cândido Rondon": "Luana",
-        "Maripá": "Gabriel", "Matelândia": "Larissa", "Medianeira": "Larissa",
-        "Mercedes": "Gabriel", "Missal": "Luana", "Mundo Novo": "Gabriel",
-        "Nova Aurora": "Valquiria", "Nova Santa Rosa": "Gabriel", "Ouro Verde do Oeste": "Gabriel",
-        "Palotina": "Gabriel", "Pato Bragado": "Luana", "Quatro Pontes": "Gabriel",
-        "Ramilândia": "Luana", "Santa Helena": "Luana", "Santa Lúcia": "Bianca",
-        "Santa Tereza do Oeste": "Luana", "Santa Terezinha de Itaipu": "Larissa",
-        "São José das Palmeiras": "Luana", "São Miguel do Iguaçu": "Larissa", "São Pedro do Iguaçu": "Luana",
-        "Serranópolis do Iguaçu": "Larissa", "Terra Roxa": "Gabriel", "Toledo": "Gabriel",
-        "Três Barras do Paraná": "Bianca", "Tupãssi": "Valquiria", "Ubiratã": "Valquiria",
-        "Vera Cruz do Oeste": "Luana"
-    }
+        destaques[col] = (pd.to_numeric(pd.Series(valores(col)), errors="coerce") >= 60).to_numpy()
 
-    expansao = {
-        " Alto Paraná": "Paranavaí", " Amaporã": "Paranavaí", "Apucarana": "Maringá",
-        "Atalaia": "Paranavaí", "Barracão": "Francisco Beltrão", "Borrazópolis": "Maringá",
-        "Cambará": "Londrina", "Campina da Lagoa": "Guarapuava",
-        "Campo Largo": "Curitiba", "Campo Magro": "Curitiba", "Capanema": "Francisco Beltrão",
-        "Cerro Azul": "Curitiba", "Colorado": "Paranavaí", "Coronel Vivida": "Laranjeiras do Sul",
-        "Cruzeiro do Sul": "Paranavaí", "Enéas Marques": "Francisco Beltrão",
-        "Francisco Beltrão": "Francisco Beltrão", "General Carneiro": "Laranjeiras do Sul",
-        "Ibaiti": "Londrina", "Jaguapitã": "Londrina", "Jaguariaíva": "Londrina",
-        "Jardim Alegre": "Maringá", "Kaloré": "Maringá", "Lapa": "Curitiba",
-        "Laranjeiras do Sul": "Laranjeiras do Sul", "Mandaguaçu": "Maringá", "Mandaguari": "Maringá",
-        "Marmeleiro": "Francisco Beltrão", "Mato Rico": "Guarapuava", "Nova Tebas": "Guarapuava",
-        "Ortigueira": "Londrina", "Palmital": "Laranjeiras do Sul", "Paraíso do Norte": "Paranavaí",
-        "Presidente Castelo Branco": "Maringá", "Quedas do Iguaçu": "Laranjeiras do Sul", "Realeza": "Francisco Beltrão",
-        "Reserva do Iguaçu": "Laranjeiras do Sul", "Ribeirão Claro": "Londrina", "Rio Branco do Sul": "Curitiba",
-        "Rio Negro": "Curitiba", "Salgado Filho": "Francisco Beltrão",
-        "Santa Maria do Oeste": "Laranjeiras do Sul", "Santa Mariana": "Londrina", "Santa Mônica": "Paranavaí",
-        "Santana do Itararé": "Londrina", "São João": "Laranjeiras do Sul", "São João do Caiuá": "Paranavaí",
-        "São João do Ivaí": "Maringá", "São João do Triunfo": "Curitiba", "Tijucas do Sul": "Curitiba"
+    cores_celulas = {
+        col: np.where(mascara, _COR_DESTAQUE, None) for col, mascara in destaques.items() if col in colunas
     }
 
-    ws.insert_cols(1)
-    ws["A1"].value = "regional"
-
-    for row in ws["C:C"]:
-        if row.row == 1: continue
-        
-        # strip() remove espaços extras que podem atrapalhar o match
-        cidade = str(row.value).strip() if row.value else ""
-        
-        if cidade in expansao:
-            ws[f"A{row.row}"] = expansao[cidade]
-        elif cidade in grs:
-            ws[f"A{row.row}"] = grs[cidade]
-        # Tenta match direto também (caso a chave no dict tenha espaço)
-        elif row.value in expansao:
-             ws[f"A{row.row}"] = expansao[row.value]
-
-def __delete_null(ws):
-    rows_to_delete = []
-    for cell in ws["E:E"]:
-        if cell.row == 1: continue
-        if cell.value is None:
-            rows_to_delete.append(cell.row)
-    
-    for r in reversed(rows_to_delete):
-        ws.delete_rows(r, 1)
-
-def __add_filters(ws):
-    ws.auto_filter.ref = ws.dimensions
+    # Cores Regionais (paleta própria do relatório de validação)
+    cores_celulas["A"] = carregar_registro().cores(valores("A"), "cor_validacao").to_numpy(dtype=object)
+    return cores_celulas
 
 def processar_e_salvar_excel(df, caminho_arquivo_saida):
     """
-    Salva o DataFrame em Excel e aplica toda a formatação.
+    Salva o DataFrame em Excel já formatado. Regionais, filtro de nulos,
+    larguras e destaques são calculados sobre o DataFrame; a planilha é
+    escrita uma única vez, linha a linha, sem reabrir o arquivo.
+    Retorna os contadores da planilha (células, estilos distintos e linhas descartadas).
     """
-    # 1. Cria o arquivo bruto
-    df.to_excel(caminho_arquivo_saida, index=False)
+    dados, descartadas = __delete_null(__add_regionals(df))
+    if descartadas:
+        print(f"[AVISO] {descartadas} linha(s) sem mês de referência descartada(s) de {len(df)}.")
+
+    # Valores como serão gravados, indexados pela letra da coluna na planilha
+    letras = [get_column_letter(i) for i in range(1, dados.shape[1] + 1)]
+    colunas = {letra: _coluna_planilha(dados.iloc[:, i]) for i, letra in enumerate(letras)}
+    cores_celulas = __paint(colunas, len(dados))
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    for letra, largura in zip(letras, __adjust_column_size(dados.columns, colunas.values())):
+        ws.column_dimensions[letra].width = largura
+    ws.auto_filter.ref = f"A1:{letras[-1]}{len(dados) + 1}"
+
+    # Cada combinação de estilo é montada uma vez; as células compartilham o mesmo
+    # StyleArray em vez de registrar borda, alinhamento e cor a cada célula
+    estilos = {}
+
+    def estilo(cor, formato, fonte):
+        chave = (cor, formato, fonte)
+        if chave not in estilos:
+            modelo = WriteOnlyCell(ws)
+            modelo.border = _BORDA
+            modelo.alignment = _ALINHAMENTO
+            if fonte is not None:
+                modelo.font = fonte
+            if cor is not None:
+                modelo.fill = _preenchimento(cor)
+            if formato is not None:
+                modelo.number_format = formato
+            estilos[chave] = modelo._style
+        return estilos[chave]
 
-    # 2. Reabre com Openpyxl para estilizar
-    wb = load_workbook(caminho_arquivo_saida)
-    ws = wb.active
+    def celula(valor, cor=None, fonte=None):
+        cell = WriteOnlyCell(ws, value=valor)
+        if isinstance(valor, datetime):
+            formato = _FORMATO_DATA_HORA
+        elif isinstance(valor, date):
+            formato = _FORMATO_DATA
+        else:
+            formato = None
+        cell._style = estilo(cor, formato, fonte)
+        return cell
 
-    # Aplica as transformações
-    __add_regionals(ws)
-    __delete_null(ws)
-    __add_filters(ws)
-    __adjust_column_size(ws)
-    __adjust_borders(ws)
-    __align_rows(ws)
-    __paint(ws)
+    ws.append([celula(nome, _COR_CABECALHO, _FONTE_CABECALHO) for nome in dados.columns])
+    cores_linha = [cores_celulas.get(letra) for letra in letras]
+    for i, linha in enumerate(zip(*(colunas[letra].tolist() for letra in letras))):
+        ws.append([celula(valor, cores[i] if cores is not None else None) for valor, cores in zip(linha, cores_linha)])
 
     wb.save(caminho_arquivo_saida)
-    print(f"[OK] Relatório formatado salvo em: {caminho_arquivo_saida}")
\ No newline at end of file
+    print(f"[OK] Relatório formatado salvo em: {caminho_arquivo_saida}")
+    return {"celulas": (len(dados) + 1) * len(letras), "estilos": len(estilos), "linhas_descartadas": descartadas}
@@ -0,0 +1,107 @@
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+
+def hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    """
+    Retorna o SHA-256 do conteúdo do arquivo, ou None se ele não existir.
+    """
+    caminho = Path(caminho)
+    if not caminho.exists():
+        return None
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+class Manifesto:
+    """
+    Registro dos hashes das entradas usadas para gerar cada artefato de saída.
+    Um artefato só precisa ser reconstruído quando alguma entrada mudou ou o
+    arquivo de saída não existe mais.
+    """
+
+    def __init__(self, caminho, pasta_base):
+        self.caminho = Path(caminho)
+        self.pasta_base = Path(pasta_base)
+        self._hashes = {}  # cache: cada entrada é lida uma única vez por execução
+        self.artefatos = {}
+        if self.caminho.exists():
+            try:
+                self.artefatos = json.loads(self.caminho.read_text(encoding="utf-8")).get("artefatos", {})
+            except (ValueError, OSError) as e:
+                print(f"[AVISO] Manifesto ilegível ({e}). Todas as saídas serão reconstruídas.")
+
+    def _chave(self, caminho):
+        caminho = Path(caminho)
+        try:
+            return caminho.relative_to(self.pasta_base).as_posix()
+        except ValueError:
+            return caminho.as_posix()
+
+    def hashes(self, entradas):
+        resultado = {}
+        for entrada in entradas:
+            chave = self._chave(entrada)
+            if chave not in self._hashes:
+                self._hashes[chave] = hash_arquivo(entrada)
+            resultado[chave] = self._hashes[chave]
+        return resultado
+
+    def definir_hash(self, caminho, valor):
+        # Entradas recebidas em memória: o hash vem do conteúdo, não do arquivo em disco
+        self._hashes[self._chave(caminho)] = valor
+
+    def avaliar(self, artefato, entradas, caminho_saida, forcar=False):
+        """
+        Retorna (reconstruir, motivo, hashes) para o artefato informado.
+        """
+        atuais = self.hashes(entradas)
+        motivo = self._motivo(artefato, atuais, caminho_saida, forcar, completo=True)
+        return motivo is not None, motivo or "entradas inalteradas", atuais
+
+    def antecipar(self, artefato, entradas, caminho_saida, forcar=False):
+        """
+        Avalia o artefato com só parte das entradas disponível. Retorna o motivo
+        quando já é certo que ele será reconstruído, ou None se a decisão depende
+        das entradas que faltam.
+        """
+        return self._motivo(artefato, self.hashes(entradas), caminho_saida, forcar, completo=False)
+
+    def _motivo(self, artefato, atuais, caminho_saida, forcar, completo):
+        if forcar:
+            return "reconstrução forçada"
+        if not Path(caminho_saida).exists():
+            return "arquivo de saída inexistente"
+
+        registro = self.artefatos.get(artefato)
+        if registro is None:
+            return "sem registro no manifesto"
+
+        anteriores = registro.get("entradas", {})
+        alteradas = sorted(k for k in atuais if anteriores.get(k) != atuais[k])
+        # Entradas que deixaram de existir só podem ser apontadas com a lista completa
+        removidas = sorted(k for k in anteriores if k not in atuais) if completo else []
+        if alteradas or removidas:
+            return "entradas alteradas: " + ", ".join(alteradas + removidas)
+
+        return None
+
+    def registrar(self, artefato, hashes):
+        self.artefatos[artefato] = {
+            "entradas": hashes,
+            "gerado_em": datetime.now().isoformat(timespec="seconds")
+        }
+
+    def descartar(self, artefato):
+        # Sem registro, o artefato é reconstruído na próxima execução
+        self.artefatos.pop(artefato, None)
+
+    def salvar(self):
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        conteudo = {"artefatos": self.artefatos}
+        self.caminho.write_text(json.dumps(conteudo, indent=2, ensure_ascii=False), encoding="utf-8")
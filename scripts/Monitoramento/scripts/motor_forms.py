@@ -0,0 +1,375 @@
+import importlib
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from openpyxl import Workbook, load_workbook
+
+import envios_agregados
+import estado_validacao
+import regionais
+import tipagem
+import utils
+from relatorio_execucao import medir, contar_workbook
+from tipagem import hash_dataframe
+from utils import mover_abas, pastas_convenios
+
+
+# Builders na ordem em que as abas devem aparecer nos arquivos de saída.
+# O script_form123 gera as abas dos forms 1, 2 e 3; script_form1, script_form2
+# e script_form3 geram uma aba cada, para reconstruir só um form do arquivo.
+BUILDERS_PADRAO = [
+    "script_form123",
+    "script_form4"
+]
+
+# Módulos e dados usados por todos os builders: mudar qualquer um deles muda as saídas
+ENTRADAS_COMPARTILHADAS = [
+    Path(modulo.__file__) for modulo in (utils, regionais, tipagem, envios_agregados, estado_validacao)
+] + [regionais.ARQUIVO_REGISTRO]
+
+
+def _executar_builder(nome_modulo, pasta_inputs, convenios, dados=None, preparado=None):
+    # Roda dentro do processo filho: importa o builder e devolve os workbooks gerados e as medições
+    detalhes = []
+    with medir(nome_modulo) as medicao:
+        modulo = importlib.import_module(nome_modulo)
+        if preparado is None:
+            workbooks = modulo.construir(pasta_inputs, convenios, detalhes, dados)
+        else:
+            workbooks = modulo.construir(pasta_inputs, convenios, detalhes, dados, preparado=preparado)
+
+    # Contadores de saída (células, estilos, regras condicionais) de cada convênio
+    for detalhe in detalhes:
+        if detalhe["nome"] == nome_modulo and detalhe.get("convenio") in workbooks:
+            detalhe["contadores"].update(contar_workbook(workbooks[detalhe["convenio"]]))
+        medicao.contar(linhas_lidas=detalhe.get("linhas_lidas"), **detalhe.get("contadores", {}))
+
+    medicao.dados["detalhes"] = detalhes
+    return modulo.ARQUIVO_SAIDA, workbooks, medicao.como_dict()
+
+
+def _lotes(nome_modulo, pasta_inputs, convenios):
+    # Convênios de cada tarefa de um builder. Builders que tratam cada convênio de forma
+    # independente (POR_CONVENIO) viram uma tarefa por convênio, que o pool roda em
+    # paralelo; as abas voltam ao processo principal e são reunidas em _coletar.
+    modulo = importlib.import_module(nome_modulo)
+    if not getattr(modulo, "POR_CONVENIO", False):
+        return [convenios]
+    return [[convenio] for convenio in (convenios or modulo.caminhos_auxiliares(pasta_inputs))]
+
+
+def _submeter(executor, nome_modulo, pasta_inputs, convenios, dados, medicoes):
+    """
+    Submete as tarefas de um builder ao pool: [(builder, convênios, futuro)].
+    Builders com `preparar` (ex: script_form123) fazem aqui, uma vez no processo
+    principal, o trabalho comum a todos os convênios (ler e indexar os CSVs), e
+    cada tarefa recebe só a parte do seu convênio no lugar dos DataFrames. Uma
+    falha na preparação vale como falha de todas as tarefas do builder.
+    """
+    modulo = importlib.import_module(nome_modulo)
+    lotes = _lotes(nome_modulo, pasta_inputs, convenios)
+    if not hasattr(modulo, "preparar"):
+        return [
+            (nome_modulo, lote, executor.submit(_executar_builder, nome_modulo, pasta_inputs, lote, dados))
+            for lote in lotes
+        ]
+
+    try:
+        detalhes = []
+        with medir(f"{nome_modulo}:preparar") as medicao:
+            preparados = modulo.preparar(pasta_inputs, convenios, detalhes, dados)
+        for detalhe in detalhes:
+            medicao.contar(linhas_lidas=detalhe.get("linhas_lidas"))
+        medicao.dados["detalhes"] = detalhes
+        medicoes.append(medicao.como_dict())
+    except Exception as e:
+        falha = Future()
+        falha.set_exception(e)
+        return [(nome_modulo, lote, falha) for lote in lotes]
+
+    return [
+        (nome_modulo, lote, executor.submit(
+            _executar_builder, nome_modulo, pasta_inputs, lote, None,
+            preparados if lote is None else {convenio: preparados[convenio] for convenio in lote}
+        ))
+        for lote in lotes
+    ]
+
+
+def entradas_builder(modulo, pasta_inputs, convenio):
+    """
+    Lista os arquivos dos quais a saída de um builder depende para um convênio:
+    CSVs e SQLs declarados em ENTRADAS, a planilha auxiliar, o próprio código
+    e as ENTRADAS_COMPARTILHADAS (módulos auxiliares e cadastro de regionais).
+    """
+    entradas = [pasta_inputs / nome for nome in modulo.ENTRADAS]
+    entradas.append(modulo.caminhos_auxiliares(pasta_inputs)[convenio])
+    entradas.append(Path(modulo.__file__))
+    return entradas + ENTRADAS_COMPARTILHADAS
+
+
+def _grupos_saida(pasta_inputs, pasta_saida, builders, convenios):
+    # Um grupo por arquivo de saída e convênio, com as entradas de cada builder que escreve nele.
+    # Builders não selecionados entram na avaliação, mas só rodam se o arquivo ainda não existir;
+    # nesse caso bastam os builders padrão do arquivo, que já geram todas as abas dele.
+    modulos = {nome: importlib.import_module(nome) for nome in dict.fromkeys(BUILDERS_PADRAO + list(builders))}
+    arquivos_selecionados = {modulos[nome].ARQUIVO_SAIDA for nome in builders}
+
+    por_arquivo = {}
+    for nome, modulo in modulos.items():
+        if modulo.ARQUIVO_SAIDA in arquivos_selecionados:
+            por_arquivo.setdefault(modulo.ARQUIVO_SAIDA, []).append(nome)
+
+    grupos = []
+    for arquivo_saida, nomes in por_arquivo.items():
+        selecionados = [nome for nome in nomes if nome in builders]
+        for convenio in convenios:
+            pasta_convenio = pastas_convenios[convenio][1]
+            caminho_saida = pasta_saida / pasta_convenio / arquivo_saida
+            # Sem o arquivo anterior não há de onde tirar as abas dos builders não selecionados
+            parcial = len(selecionados) < len(nomes) and caminho_saida.exists()
+            completos = [nome for nome in nomes if nome in BUILDERS_PADRAO] or nomes
+            grupos.append({
+                "artefato": f"{pasta_convenio}/{arquivo_saida}",
+                "arquivo_saida": arquivo_saida,
+                "convenio": convenio,
+                "caminho_saida": caminho_saida,
+                "entradas": {nome: entradas_builder(modulos[nome], pasta_inputs, convenio) for nome in nomes},
+                "executar": selecionados if parcial else completos,
+                "parcial": parcial
+            })
+    return grupos
+
+
+def _decisao(grupo, reconstruir, motivo, hashes):
+    return {
+        "artefato": grupo["artefato"],
+        "arquivo_saida": grupo["arquivo_saida"],
+        "convenio": grupo["convenio"],
+        "reconstruir": reconstruir,
+        "motivo": motivo,
+        "hashes": hashes,
+        "parcial": grupo["parcial"]
+    }
+
+
+def planejar_reconstrucao(pasta_inputs, pasta_saida, manifesto, builders=None, convenios=None, forcar=False):
+    """
+    Decide, por arquivo de saída e convênio, o que precisa ser reconstruído.
+
+    Retorna ({builder: [convênios]}, decisões), onde cada decisão traz o
+    artefato, se será reconstruído, o motivo, os hashes das entradas e se a
+    reconstrução é parcial (só os builders selecionados de um arquivo compartilhado).
+    """
+    builders = builders or BUILDERS_PADRAO
+    convenios = convenios or list(pastas_convenios)
+
+    plano = {nome: [] for nome in dict.fromkeys(BUILDERS_PADRAO + list(builders))}
+    decisoes = []
+    for grupo in _grupos_saida(pasta_inputs, pasta_saida, builders, convenios):
+        entradas = [e for lista in grupo["entradas"].values() for e in lista]
+        reconstruir, motivo, hashes = manifesto.avaliar(
+            grupo["artefato"], entradas, grupo["caminho_saida"], forcar
+        )
+        decisoes.append(_decisao(grupo, reconstruir, motivo, hashes))
+        if reconstruir:
+            for nome in grupo["executar"]:
+                plano[nome].append(grupo["convenio"])
+
+    return plano, decisoes
+
+
+def substituir_abas(wb_novo, caminho_existente):
+    """
+    Abre o arquivo de saída já gravado e troca as abas de mesmo nome pelas de
+    `wb_novo`, mantendo a posição original; abas novas vão para o final.
+    """
+    wb = load_workbook(caminho_existente)
+    ordem = {nome: i for i, nome in enumerate(wb.sheetnames)}
+
+    for nome in wb_novo.sheetnames:
+        if nome in wb.sheetnames:
+            wb.remove(wb[nome])
+    mover_abas(wb_novo, wb)
+
+    wb._sheets.sort(key=lambda ws: ordem.get(ws.title, len(ordem)))
+    return wb
+
+
+def _coletar(tarefas, ordem, medicoes):
+    # Espera as tarefas [(builder, convênios, futuro)] e junta as abas de cada
+    # arquivo/convênio na ordem de `ordem`. Um arquivo/convênio com builder que
+    # falhou não é montado, preservando a versão anterior em disco.
+    resultados = {}
+    falhas = set()
+    for nome, convenios, futuro in tarefas:
+        try:
+            arquivo_saida, workbooks, medicao = futuro.result()
+            print(f"{nome}: OK ({medicao['tempo_parede_s']:.2f}s)")
+            resultados.setdefault(nome, []).append((arquivo_saida, workbooks))
+            medicoes.append(medicao)
+        except Exception as e:
+            print(f"[ERRO] Falha durante a execução de {nome}: {e}")
+            medicoes.append({"nome": nome, "convenios": convenios, "status": "erro", "erro": str(e)})
+            arquivo_saida = importlib.import_module(nome).ARQUIVO_SAIDA
+            falhas |= {(arquivo_saida, c) for c in (convenios or [None])}
+
+    def falhou(arquivo_saida, convenio):
+        return (arquivo_saida, convenio) in falhas or (arquivo_saida, None) in falhas
+
+    for arquivo_saida, convenio in sorted(falhas, key=str):
+        alvo = f"'{arquivo_saida}'" + (f" ({convenio})" if convenio else "")
+        print(f"[AVISO] {alvo} não será salvo por causa de falha em um dos builders.")
+
+    # Junta as abas de cada builder no workbook do respectivo arquivo/convênio
+    saidas = {}
+    for nome in ordem:
+        for arquivo_saida, workbooks in resultados.get(nome, []):
+            for convenio, wb in workbooks.items():
+                if falhou(arquivo_saida, convenio):
+                    continue
+                chave = (arquivo_saida, convenio)
+                if chave not in saidas:
+                    saidas[chave] = Workbook()
+                    saidas[chave].remove(saidas[chave].active)
+                mover_abas(wb, saidas[chave])
+
+    return saidas
+
+
+def executar_builders(pasta_inputs, builders=None, convenios=None, max_workers=None, medicoes=None):
+    """
+    Executa os builders em um pool de processos (um processo por convênio nos
+    builders com POR_CONVENIO) e junta as abas geradas nos workbooks finais,
+    respeitando a ordem de `builders`.
+
+    `convenios` pode ser uma lista (vale para todos os builders) ou um
+    dicionário {builder: [convênios]}; builders sem convênio não são executados.
+
+    Retorna {(arquivo_saida, convênio): Workbook}. Um builder que falhar é
+    reportado sem interromper os demais, e o arquivo de saída dele fica de fora.
+    As medições de cada builder são acrescentadas a `medicoes`, se informada.
+    """
+    builders = builders or BUILDERS_PADRAO
+    if not isinstance(convenios, dict):
+        convenios = {nome: convenios for nome in builders}
+    builders = [nome for nome in builders if convenios.get(nome) is None or convenios[nome]]
+    if not builders:
+        return {}
+    lotes = [lote for nome in builders for lote in _lotes(nome, pasta_inputs, convenios[nome])]
+    max_workers = max_workers or min(len(lotes), os.cpu_count() or 1)
+    medicoes = [] if medicoes is None else medicoes
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        tarefas = [
+            tarefa for nome in builders
+            for tarefa in _submeter(executor, nome, pasta_inputs, convenios[nome], None, medicoes)
+        ]
+        return _coletar(tarefas, builders, medicoes)
+
+
+class PipelineBuilders:
+    """
+    Dispara cada builder assim que as entradas dele estão prontas, enquanto as
+    demais ainda estão sendo extraídas do banco.
+
+    A decisão de reconstruir segue o manifesto, por arquivo de saída e convênio:
+    basta uma entrada alterada de um dos builders do arquivo para que ele seja
+    reconstruído, sem esperar as outras; sem alteração, a decisão aguarda todas.
+    """
+
+    def __init__(self, pasta_inputs, pasta_saida, manifesto, builders=None, convenios=None,
+                 forcar=False, pendentes=(), max_workers=None, medicoes=None, dados=None, executor=None):
+        self.pasta_inputs = pasta_inputs
+        self.manifesto = manifesto
+        self.forcar = forcar
+        self.builders = builders or BUILDERS_PADRAO
+        self.grupos = _grupos_saida(pasta_inputs, pasta_saida, self.builders, convenios or list(pastas_convenios))
+        self.ordem = list(dict.fromkeys(BUILDERS_PADRAO + list(self.builders)))
+        # Arquivos de inputs/ ainda em extração
+        self.pendentes = {pasta_inputs / nome for nome in pendentes}
+        # DataFrames em memória, entregues aos builders no lugar dos CSVs: os extraídos
+        # do banco e os já carregados por quem chama (ex: o serviço residente)
+        self.dados = dict(dados or {})
+        self.decisoes = {}
+        self.submetidos = set()
+        self.tarefas = []
+        self.medicoes = [] if medicoes is None else medicoes
+        # Um executor recebido (com workers já aquecidos) continua aberto ao final
+        self._executor_proprio = executor is None
+        self.executor = executor or ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1)
+        self._avaliar()
+
+    def entrada_disponivel(self, nome_arquivo, df=None):
+        """
+        Informa que um arquivo de inputs/ terminou de ser extraído (ou que a extração falhou
+        e a cópia local será usada) e dispara o que já pode rodar. Com `df`, os builders
+        recebem o DataFrame em memória e o manifesto usa o hash do conteúdo dele.
+        """
+        if df is not None:
+            self.dados[nome_arquivo] = df
+            self.manifesto.definir_hash(self.pasta_inputs / nome_arquivo, hash_dataframe(df))
+        self.pendentes.discard(self.pasta_inputs / nome_arquivo)
+        self._avaliar()
+
+    def _disponivel(self, entradas):
+        return not any(entrada in self.pendentes for entrada in entradas)
+
+    def _avaliar(self):
+        novos = {}
+        for grupo in self.grupos:
+            artefato = grupo["artefato"]
+            prontos = [e for nome, lista in grupo["entradas"].items() if self._disponivel(lista) for e in lista]
+            completo = all(self._disponivel(lista) for lista in grupo["entradas"].values())
+
+            if artefato not in self.decisoes:
+                if completo:
+                    reconstruir, motivo, hashes = self.manifesto.avaliar(
+                        artefato, prontos, grupo["caminho_saida"], self.forcar
+                    )
+                    self._decidir(grupo, reconstruir, motivo, hashes)
+                else:
+                    motivo = self.manifesto.antecipar(artefato, prontos, grupo["caminho_saida"], self.forcar)
+                    if motivo:
+                        self._decidir(grupo, True, motivo, None)
+
+            decisao = self.decisoes.get(artefato)
+            if decisao is None:
+                continue
+            # Hashes de uma decisão antecipada só ficam completos quando tudo chegou
+            if decisao["hashes"] is None and completo:
+                decisao["hashes"] = self.manifesto.hashes(prontos)
+            if not decisao["reconstruir"]:
+                continue
+
+            for nome in grupo["executar"]:
+                chave = (nome, grupo["convenio"])
+                if chave not in self.submetidos and self._disponivel(grupo["entradas"][nome]):
+                    self.submetidos.add(chave)
+                    novos.setdefault(nome, []).append(grupo["convenio"])
+
+        for nome in self.ordem:
+            if nome in novos:
+                modulo = importlib.import_module(nome)
+                dados = {csv: self.dados[csv] for csv in modulo.ENTRADAS if csv in self.dados}
+                self.tarefas += _submeter(self.executor, nome, self.pasta_inputs, novos[nome], dados, self.medicoes)
+
+    def _decidir(self, grupo, reconstruir, motivo, hashes):
+        self.decisoes[grupo["artefato"]] = _decisao(grupo, reconstruir, motivo, hashes)
+        acao = "RECONSTRUIR" if reconstruir else "MANTER"
+        parcial = ", parcial" if reconstruir and grupo["parcial"] else ""
+        print(f"  {acao:<12} {grupo['artefato']} ({motivo}{parcial})")
+
+    def concluir(self):
+        """
+        Espera os builders e retorna ({(arquivo_saida, convênio): Workbook}, decisões).
+        Deve ser chamado depois que todas as extrações terminaram.
+        """
+        self.pendentes.clear()
+        self._avaliar()
+        try:
+            saidas = _coletar(self.tarefas, self.ordem, self.medicoes)
+        finally:
+            if self._executor_proprio:
+                self.executor.shutdown()
+        return saidas, [self.decisoes[grupo["artefato"]] for grupo in self.grupos]
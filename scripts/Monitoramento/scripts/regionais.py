@@ -0,0 +1,103 @@
+"""
+Cadastro único de regionais: município -> regional -> cor, por convênio.
+
+Os dados ficam em scripts/regionais.json (compartilhado com o Engajamento) e
+são carregados uma vez por processo. As buscas usam o nome normalizado
+(sem espaços nas pontas, acentos ou maiúsculas), como o resto dos scripts.
+"""
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    from utils import normalizar_texto
+except ImportError:
+    from Monitoramento.scripts.utils import normalizar_texto
+
+ARQUIVO_REGISTRO = Path(__file__).resolve().parents[2] / "regionais.json"
+
+
+def normalizar_serie(serie):
+    """Versão vetorizada de normalizar_texto; valores que não são texto viram nulos."""
+    texto = pd.Series(serie, dtype=object)
+    texto = texto.where(texto.map(lambda v: isinstance(v, str)))
+    return (texto.str.strip().str.lower().str.normalize("NFKD")
+            .str.encode("ascii", "ignore").str.decode("ascii"))
+
+
+class RegistroRegionais:
+    """
+    Tabelas do cadastro indexadas pelo nome normalizado:
+    `regionais` (nome e cores de cada regional) e `municipios`
+    (município, regional e convênio).
+    """
+
+    def __init__(self, dados):
+        regionais = pd.DataFrame.from_dict(dados["regionais"], orient="index")
+        regionais.index.name = "nome"
+        regionais = regionais.reset_index()
+        regionais.index = normalizar_serie(regionais["nome"]).to_numpy()
+        self.regionais = regionais
+        # Cor de cada paleta por nome normalizado, para as buscas célula a célula
+        self._paletas = {
+            paleta: regionais[paleta].dropna().to_dict() for paleta in regionais.columns if paleta != "nome"
+        }
+
+        municipios = pd.DataFrame(
+            [(municipio, regional, convenio)
+             for convenio, mapa in dados["municipios"].items()
+             for municipio, regional in mapa.items()],
+            columns=["municipio", "regional", "convenio"]
+        )
+        municipios.index = normalizar_serie(municipios["municipio"]).to_numpy()
+        self.municipios = municipios
+
+        # Cada município pertence a uma regional conhecida, uma vez por convênio
+        desconhecidas = set(normalizar_serie(municipios["regional"])) - set(regionais.index)
+        if desconhecidas:
+            raise ValueError(f"Regionais sem cadastro em {ARQUIVO_REGISTRO.name}: {sorted(desconhecidas)}")
+        repetidos = municipios.reset_index().duplicated(["index", "convenio"])
+        if repetidos.any():
+            raise ValueError(f"Municípios repetidos em {ARQUIVO_REGISTRO.name}: "
+                             f"{municipios['municipio'][repetidos.to_numpy()].tolist()}")
+
+    @classmethod
+    def carregar(cls, caminho=ARQUIVO_REGISTRO):
+        with open(caminho, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def regionais_dos_municipios(self, municipios, convenios=None):
+        """
+        Regional de cada município da série (None quando não cadastrado).
+        `convenios` define onde procurar e, pela ordem, qual vale quando o
+        município aparece em mais de um; padrão: todos.
+        """
+        chaves = normalizar_serie(municipios)
+        resultado = pd.Series(None, index=chaves.index, dtype=object)
+        for convenio in convenios or self.municipios["convenio"].unique():
+            tabela = self.municipios.loc[self.municipios["convenio"] == convenio, "regional"]
+            resultado = resultado.fillna(chaves.map(tabela))
+        return resultado.astype(object).where(resultado.notna(), None)
+
+    def cores(self, regionais, paleta="cor"):
+        """Cor hex de cada regional da série na paleta indicada (None quando não há)."""
+        if paleta not in self.regionais:
+            return pd.Series(None, index=pd.Series(regionais).index, dtype=object)
+        cores = normalizar_serie(regionais).map(self.regionais[paleta].dropna())
+        return cores.astype(object).where(cores.notna(), None)
+
+    def cor(self, regional, paleta="cor"):
+        """Cor hex de uma regional, ou None."""
+        return self._paletas.get(paleta, {}).get(normalizar_texto(regional))
+
+
+@lru_cache(maxsize=None)
+def carregar_registro():
+    """Cadastro do arquivo padrão, lido uma vez por processo."""
+    return RegistroRegionais.carregar()
+
+
+def cor_regional(regional, paleta="cor"):
+    return carregar_registro().cor(regional, paleta)
@@ -0,0 +1,152 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource  # Indisponível no Windows
+except ImportError:
+    resource = None
+
+
+# O tracemalloc deixa o código bem mais lento; por padrão só o pico de RSS é medido
+RASTREAR_MEMORIA = os.getenv("RELATORIO_TRACEMALLOC", "") == "1"
+
+
+def pico_rss_mb():
+    """
+    Pico de memória residente do processo atual (MB), quando o sistema permite medir.
+    """
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS em bytes
+    return round(pico / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def contar_workbook(wb):
+    """
+    Conta células, estilos distintos e regras de formatação condicional de um workbook.
+    """
+    celulas = 0
+    regras_cf = 0
+    estilos = set()
+    for ws in wb.worksheets:
+        celulas += len(ws._cells)
+        for cell in ws._cells.values():
+            if cell._style is not None:
+                estilos.add(tuple(cell._style))
+        for faixa in ws.conditional_formatting:
+            regras_cf += len(faixa.rules)
+    return {"celulas": celulas, "estilos": len(estilos), "regras_cf": regras_cf}
+
+
+class Medicao:
+    """
+    Resultado de um bloco medido: tempos, memória e contadores livres.
+    """
+
+    def __init__(self, nome, **contexto):
+        self.nome = nome
+        self.contexto = contexto
+        self.contadores = {}
+        self.dados = {}
+
+    def contar(self, **valores):
+        # Acumula contadores numéricos (linhas lidas, células escritas, ...)
+        for chave, valor in valores.items():
+            if valor is not None:
+                self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def como_dict(self):
+        return {"nome": self.nome, **self.contexto, **self.dados, "contadores": self.contadores}
+
+
+@contextmanager
+def medir(nome, **contexto):
+    """
+    Mede tempo de parede, tempo de CPU e pico de memória do bloco
+    (RSS do processo; tracemalloc com RELATORIO_TRACEMALLOC=1).
+    Pode ser usado tanto no processo principal quanto nos processos filhos.
+    """
+    medicao = Medicao(nome, **contexto)
+    rastreando = tracemalloc.is_tracing()
+    if RASTREAR_MEMORIA:
+        if not rastreando:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+    inicio_parede = time.perf_counter()
+    inicio_cpu = time.process_time()
+    status = "ok"
+    try:
+        yield medicao
+    except BaseException:
+        status = "erro"
+        raise
+    finally:
+        medicao.dados.update({
+            "status": status,
+            "tempo_parede_s": round(time.perf_counter() - inicio_parede, 3),
+            "tempo_cpu_s": round(time.process_time() - inicio_cpu, 3),
+            "pico_rss_mb": pico_rss_mb()
+        })
+        if RASTREAR_MEMORIA:
+            _, pico = tracemalloc.get_traced_memory()
+            if not rastreando:
+                tracemalloc.stop()
+            medicao.dados["pico_tracemalloc_mb"] = round(pico / (1024 * 1024), 1)
+
+
+def medir_convenios(itens, nome, medicoes):
+    """
+    Envolve o laço `for convenio, ... in itens` de um builder: cada iteração é
+    medida e o resultado (dict) é acrescentado à lista `medicoes`.
+    """
+    for item in itens:
+        with medir(nome, convenio=item[0]) as medicao:
+            yield item
+        medicoes.append(medicao.como_dict())
+
+
+class RelatorioExecucao:
+    """
+    Reúne as medições de uma execução do pipeline e grava um JSON por execução.
+    """
+
+    def __init__(self, pasta_relatorios):
+        self.pasta_relatorios = Path(pasta_relatorios)
+        self.inicio = datetime.now()
+        self.etapas = []
+        self.extras = {}
+
+    @contextmanager
+    def etapa(self, nome, **contexto):
+        with medir(nome, **contexto) as medicao:
+            try:
+                yield medicao
+            finally:
+                self.etapas.append(medicao)
+
+    def adicionar(self, medicao_dict, etapa=None):
+        # Medições feitas em processos filhos chegam como dicionário e são anexadas à etapa
+        if etapa is not None:
+            etapa.dados.setdefault("detalhes", []).append(medicao_dict)
+        else:
+            self.etapas.append(medicao_dict)
+
+    def salvar(self):
+        self.pasta_relatorios.mkdir(parents=True, exist_ok=True)
+        conteudo = {
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "fim": datetime.now().isoformat(timespec="seconds"),
+            "pico_rss_mb": pico_rss_mb(),
+            "etapas": [e if isinstance(e, dict) else e.como_dict() for e in self.etapas],
+            **self.extras
+        }
+        caminho = self.pasta_relatorios / f"execucao_{self.inicio.strftime('%Y-%m-%d_%H-%M-%S')}.json"
+        caminho.write_text(json.dumps(conteudo, indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+        return caminho
@@ -0,0 +1,89 @@
+import datetime
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from openpyxl.writer.excel import ExcelWriter
+
+from relatorio_execucao import medir, contar_workbook
+
+
+def nivel_compressao_padrao():
+    """
+    Nível de compressão do zip lido de XLSX_COMPRESSAO (0 = sem compressão, 9 = máxima).
+    Sem a variável, usa o padrão do zlib, o mesmo do wb.save().
+    """
+    valor = os.getenv("XLSX_COMPRESSAO", "")
+    return int(valor) if valor else None
+
+
+def salvar_workbook(wb, caminho, nivel_compressao=None):
+    """
+    Salva o workbook como o wb.save(), mas com o nível de compressão do zip ajustável.
+    O arquivo é escrito ao lado e só substitui o anterior depois de completo.
+    """
+    caminho = Path(caminho)
+    temporario = caminho.with_name(f".{caminho.name}.tmp")
+
+    # Nível 0 grava as partes sem deflate (ZIP_STORED), que o Excel também abre
+    if nivel_compressao == 0:
+        archive = zipfile.ZipFile(temporario, "w", zipfile.ZIP_STORED, allowZip64=True)
+    else:
+        archive = zipfile.ZipFile(
+            temporario, "w", zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=nivel_compressao
+        )
+
+    try:
+        wb.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+        ExcelWriter(wb, archive).save()  # fecha o archive
+        os.replace(temporario, caminho)
+    except BaseException:
+        archive.close()
+        temporario.unlink(missing_ok=True)
+        raise
+
+
+def _salvar(wb, caminho, nivel_compressao):
+    # Roda no processo filho: salva e devolve a medição do salvamento
+    with medir("salvar", arquivo=str(caminho), nivel_compressao=nivel_compressao) as medicao:
+        medicao.contar(**contar_workbook(wb))
+        salvar_workbook(wb, caminho, nivel_compressao)
+        medicao.contar(bytes_gravados=Path(caminho).stat().st_size)
+    return medicao.como_dict()
+
+
+def salvar_workbooks(tarefas, max_workers=None, nivel_compressao=None):
+    """
+    Salva vários workbooks em paralelo, cada um em um processo.
+
+    `tarefas` é uma lista de (workbook, caminho). Retorna uma medição por
+    tarefa, na mesma ordem, com "status" "ok" ou "erro" (e a mensagem em "erro").
+    Uma falha não interrompe os demais salvamentos.
+    """
+    tarefas = list(tarefas)
+    if not tarefas:
+        return []
+    max_workers = max_workers or min(len(tarefas), os.cpu_count() or 1)
+
+    def _falha(caminho, e):
+        return {"nome": "salvar", "arquivo": str(caminho), "status": "erro", "erro": str(e)}
+
+    # Com um único worker não compensa copiar os workbooks para outro processo
+    if max_workers == 1:
+        resultados = []
+        for wb, caminho in tarefas:
+            try:
+                resultados.append(_salvar(wb, caminho, nivel_compressao))
+            except Exception as e:
+                resultados.append(_falha(caminho, e))
+        return resultados
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futuros = [executor.submit(_salvar, wb, caminho, nivel_compressao) for wb, caminho in tarefas]
+        resultados = []
+        for (_, caminho), futuro in zip(tarefas, futuros):
+            try:
+                resultados.append(futuro.result())
+            except Exception as e:
+                resultados.append(_falha(caminho, e))
+    return resultados
@@ -0,0 +1,386 @@
+from openpyxl import Workbook  # Para trabalhar com arquivos Excel
+from openpyxl.styles import Font, PatternFill, Alignment  # Para aplicar estilos nas células
+from openpyxl.formatting.rule import CellIsRule
+from copy import copy
+from openpyxl.worksheet.datavalidation import DataValidation
+from pathlib import Path  # Para manipulação de caminhos de arquivos
+from relatorio_execucao import medir_convenios
+from tipagem import carregar_entrada
+from cache_planilhas import carregar_planilha
+from envios_agregados import chaves_envio, eh_agregado, indexar_agregado
+from envios_agregados import indexar_envios as indexar_envios_linhas
+from estado_validacao import EstadoValidacao, aplicar_campos, chave_linha, por_linha
+from regionais import cor_regional
+from utils import (  # Estilos e funções auxiliares
+    cabeçalho_fill, cabeçalho_font, enviado_fill, analise_fill, enviado_font,
+    semtecnico_fill, atrasado_fill, validado_nao_fill, validado_sim_fill, outras_fill, duplicado_fill,
+    bordas, alinhamento,
+    normalizar_texto, normalizar_uvr, aplicar_estilo_status, clonar_abas
+)
+
+# Define o caminho do script atual
+caminho_script = Path(__file__).resolve()
+pasta_scripts = caminho_script.parent
+pasta_inputs = pasta_scripts.parent / "inputs"
+
+# Arquivo de saída (por convênio) que recebe as abas dos forms 1, 2 e 3
+ARQUIVO_SAIDA = "0 - Monitoramento Form 1, 2 e 3.xlsx"
+
+# Cada convênio lê a própria planilha auxiliar e gera o próprio workbook: o
+# motor_forms roda um processo por convênio e junta as abas no processo principal
+POR_CONVENIO = True
+
+# O que muda de um form para outro; o resto da aba é montado igual nos três.
+# coluna_uvr: coluna da UVR no CSV (None: a chave é só o município); formatar_uvr:
+# como a UVR do CSV entra na chave (na planilha, a coluna C passa sempre por normalizar_uvr);
+# abas_modelo: abas copiadas sem alteração da planilha auxiliar; formula_form1: coluna D
+# com a fórmula que busca o valor da aba do Form 1; largura_d: largura fixa da coluna D.
+FORMS = {
+    "1": {
+        "aba": "Form 1 - Município", "csv": "form1.csv", "sql": "form1.sql", "builder": "script_form1",
+        "coluna_uvr": None, "formatar_uvr": None,
+        "abas_modelo": ["Resumo", "Monitoramento"], "formula_form1": False, "largura_d": None
+    },
+    "2": {
+        "aba": "Form 2 - UVR", "csv": "form2.csv", "sql": "form2.sql", "builder": "script_form2",
+        "coluna_uvr": "uvr_nro", "formatar_uvr": format,
+        "abas_modelo": [], "formula_form1": True, "largura_d": 45
+    },
+    "3": {
+        "aba": "Form 3 - Empreendimento", "csv": "form3.csv", "sql": "form3.sql", "builder": "script_form3",
+        "coluna_uvr": "uvr_numero", "formatar_uvr": normalizar_uvr,
+        "abas_modelo": [], "formula_form1": True, "largura_d": 45
+    }
+}
+
+# Arquivos de inputs/ dos quais a saída depende (além da planilha auxiliar)
+ENTRADAS = [arquivo for config in FORMS.values() for arquivo in (config["csv"], config["sql"])]
+
+
+def caminhos_auxiliares(pasta_inputs):
+    # Arquivos auxiliares (originais do drive)
+    return {
+        "belem": pasta_inputs / "0 - Belém" / "0 - Monitoramento Form 1, 2 e 3.xlsx",
+        "expansao": pasta_inputs / "0 - Expansão" / "0 - Monitoramento Form 1, 2 e 3.xlsx",
+        "grs": pasta_inputs / "0 - GRS II" / "0 - Monitoramento Form 1, 2 e 3.xlsx",
+        "expansao_ms": pasta_inputs / "0 - Expansão MS" / "0 - Monitoramento Form 1, 2 e 3.xlsx"
+    }
+
+
+def indexar_envios(df_input, form):
+    # Status de envio e datas por município (Form 1) ou município/UVR (Forms 2 e 3)
+    config = FORMS[form]
+    uvrs = df_input[config["coluna_uvr"]] if config["coluna_uvr"] else None
+    chaves = chaves_envio(df_input['municipio'], uvrs, config["formatar_uvr"])
+
+    # Extração agregada: uma linha por chave, já com as datas e o status
+    if eh_agregado(df_input):
+        return indexar_agregado(df_input, chaves)
+
+    return indexar_envios_linhas(df_input, chaves, 'data_envio')
+
+
+def _chave_envio(municipio, uvr, config):
+    # Chave de uma linha da planilha auxiliar (município e UVR), no formato do índice de envios
+    if not isinstance(municipio, str):
+        return ""
+    if config["coluna_uvr"] is None:
+        return normalizar_texto(municipio)
+    return f"{normalizar_texto(municipio)}_{normalizar_uvr(uvr)}"
+
+
+def _chave_linha(row, config):
+    return _chave_envio(row[1].value, row[2].value, config)
+
+
+def _formula_form1(row_idx):
+    # Busca na aba do Form 1 o valor da coluna D do mesmo município/UVR
+    return (
+        f'=IFERROR(IF(INDEX(\'Form 1 - Município\'!D2:D500, '
+        f'MATCH(B{row_idx}&C{row_idx}, INDEX(\'Form 1 - Município\'!B2:B500&\'Form 1 - Município\'!C2:C500, 0), 0))="", "", '
+        f'INDEX(\'Form 1 - Município\'!D2:D500, '
+        f'MATCH(B{row_idx}&C{row_idx}, INDEX(\'Form 1 - Município\'!B2:B500&\'Form 1 - Município\'!C2:C500, 0), 0))), "")'
+    )
+
+
+def montar_aba(ws_aux, novo_ws, config, dados_atualizados, estado=None):
+    """
+    Preenche `novo_ws` a partir da aba correspondente da planilha auxiliar,
+    atualizando status e datas de envio com o índice `dados_atualizados`.
+    Os campos manuais de cada linha vêm de `estado` (ver estado_validacao.py).
+    """
+    campos_da_linha = por_linha(estado or {})
+    dv_sim_nao = DataValidation(type="list", formula1='"Sim,Não"', allow_blank=True) #dropdown com sim e nao
+    novo_ws.add_data_validation(dv_sim_nao)
+
+    dv_sim_nao_ti = DataValidation(type="list", formula1='"Sim,Não,Em Análise"', allow_blank=True)
+    novo_ws.add_data_validation(dv_sim_nao_ti)
+
+    dv_status = DataValidation(type="list", formula1='"Enviado, Atrasado, Outras Ocorrências, Sem Técnico, Duplicado"', allow_blank=True) #dropdown de status
+    novo_ws.add_data_validation(dv_status)
+
+    # Copia e estiliza os cabeçalhos
+    headers = [cell.value for cell in ws_aux[1]]
+    for col_num, header in enumerate(headers, start=1):
+        cell = novo_ws.cell(row=1, column=col_num, value=header)
+        cell.fill = cabeçalho_fill
+        cell.font = cabeçalho_font
+        cell.border = bordas
+        cell.alignment = alinhamento
+
+    novo_ws.auto_filter.ref = "A1:G1"
+
+    # Processa as linhas da planilha auxiliar
+    for row_idx, row in enumerate(ws_aux.iter_rows(min_row=2), start=2):
+
+        # Constrói a lista de dados da linha a partir dos valores das células
+        row_data = [cell.value for cell in row]
+        if config["formula_form1"]:
+            row_data[3] = _formula_form1(row_idx)
+        aplicar_campos(row_data, headers, campos_da_linha(chave_linha(row[1].value, row[2].value)))
+
+        chave = _chave_linha(row, config)
+
+        # Atualiza status e data de envio, se estiver no dicionário
+        if chave in dados_atualizados:
+
+            # 1. Contar o número de datas de envio já registradas (coluna F, índice 5)
+            datas_antigas_str = row_data[5] if row_data[5] and isinstance(row_data[5], str) else ""
+            num_datas_antigas = len([data for data in datas_antigas_str.split(',') if data.strip()])
+
+            # 2. Contar o número de novas datas de envio
+            num_datas_novas = len(dados_atualizados[chave]["datas"])
+
+            # 3. Se o número de datas aumentou, marcar "Validado pelo Regional" como "Não"
+            if num_datas_novas > num_datas_antigas:
+                row_data[6] = "Não"
+
+            row_data[5] = ", ".join(dados_atualizados[chave]["datas"])
+            row_data[4] = dados_atualizados[chave]["status"]
+        else:
+            # Caso não tenha envio:
+            if row_data[4] == "Sem Técnico":
+                pass
+            elif row_data[4] is None:
+                row_data[4] = "Atrasado"
+
+        # Escreve os dados na nova planilha com estilos
+        for col_idx, value in enumerate(row_data, start=1):
+            cell = novo_ws.cell(row=row_idx, column=col_idx, value=value)
+
+            # Isso preserva quebras de linha (wrap_text) e outras formatações de alinhamento.
+            original_cell = row[col_idx - 1]
+
+            if original_cell.has_style:
+                cell.fill = copy(original_cell.fill)
+            cell.alignment = Alignment(
+                horizontal=original_cell.alignment.horizontal,
+                vertical=original_cell.alignment.vertical,
+                text_rotation=original_cell.alignment.text_rotation,
+                wrap_text=original_cell.alignment.wrap_text,
+                shrink_to_fit=original_cell.alignment.shrink_to_fit,
+                indent=original_cell.alignment.indent
+            )
+
+            cell.border = bordas
+            cell.font = Font(name='Arial', size=11)
+
+            if col_idx == 7:
+                dv_sim_nao.add(cell.coordinate)
+            if col_idx == 10:
+                dv_sim_nao_ti.add(cell.coordinate)
+            if col_idx == 5:
+                dv_status.add(cell.coordinate)
+
+        # Isso garante que o conteúdo não fique escondido.
+        source_row_index = row[0].row
+        if source_row_index in ws_aux.row_dimensions:
+            novo_ws.row_dimensions[row_idx].height = ws_aux.row_dimensions[source_row_index].height
+
+        # Coloração de validação (Sim/Não)
+        if row_data[6] == "Não":
+            novo_ws.cell(row=row_idx, column=7).fill = validado_nao_fill
+        elif row_data[6] == "Sim":
+            novo_ws.cell(row=row_idx, column=7).fill = validado_sim_fill
+
+        # Coloração regional
+        cor_hex = cor_regional(row_data[0])
+        if cor_hex:
+            novo_ws.cell(row=row_idx, column=1).fill = PatternFill(start_color=cor_hex, end_color=cor_hex, fill_type="solid")
+
+    # Aplica cor ao status
+    for row_idx in range(2, novo_ws.max_row + 1):
+        status_cell = novo_ws.cell(row=row_idx, column=5)
+        aplicar_estilo_status(status_cell, status_cell.value)
+
+    # Ajusta a largura das colunas com base no conteúdo
+    for col in novo_ws.columns:
+        max_length = max(len(str(cell.value)) if cell.value else 0 for cell in col)
+        col_letter = col[0].column_letter
+        novo_ws.column_dimensions[col_letter].width = max_length + 5
+
+    novo_ws.freeze_panes = 'D1' #Congela as colunas A,B,C
+    if config["largura_d"]:
+        novo_ws.column_dimensions['D'].width = config["largura_d"]
+
+    if novo_ws.max_row >= 2:
+        coluna_validado_regional = f"G2:G{novo_ws.max_row}"
+        coluna_validado_ti = f"J2:J{novo_ws.max_row}"
+        coluna_status = f"E2:E{novo_ws.max_row}"
+
+        rule_sim = CellIsRule(operator='equal', formula=['"Sim"'], stopIfTrue=True, fill=validado_sim_fill)
+        novo_ws.conditional_formatting.add(coluna_validado_regional, rule_sim)
+        novo_ws.conditional_formatting.add(coluna_validado_ti, rule_sim)
+
+        rule_nao = CellIsRule(operator='equal', formula=['"Não"'], stopIfTrue=True, fill=validado_nao_fill)
+        novo_ws.conditional_formatting.add(coluna_validado_regional, rule_nao)
+        novo_ws.conditional_formatting.add(coluna_validado_ti, rule_nao)
+
+        rule_analise = CellIsRule(operator='equal', formula=['"Em Análise"'], stopIfTrue=True, fill=analise_fill)
+        novo_ws.conditional_formatting.add(coluna_validado_ti, rule_analise)
+
+        status_rules = {
+            "Enviado": {"fill": enviado_fill, "font": enviado_font},
+            "Atrasado": {"fill": atrasado_fill, "font": enviado_font},
+            "Outras Ocorrências": {"fill": outras_fill, "font": enviado_font},
+            "Sem Técnico": {"fill": semtecnico_fill, "font": enviado_font},
+            "Duplicado": {"fill": duplicado_fill, "font": enviado_font}
+        }
+
+        for status_text, styles in status_rules.items():
+            rule = CellIsRule(operator='equal',
+                              formula=[f'"{status_text}"'],
+                              stopIfTrue=True,
+                              fill=styles["fill"],
+                              font=styles["font"])
+            novo_ws.conditional_formatting.add(coluna_status, rule)
+
+
+def _planilhas_auxiliares(pasta_inputs, convenios):
+    planilhas_auxiliares = caminhos_auxiliares(pasta_inputs)
+    if convenios:
+        planilhas_auxiliares = {conv: caminho for conv, caminho in planilhas_auxiliares.items() if conv in convenios}
+    return planilhas_auxiliares
+
+
+def _indexar_forms(forms, pasta_inputs, medicoes, dados):
+    # Carrega os CSVs e indexa os envios de cada form
+    indices = {}
+    for form in forms:
+        csv_file_input = FORMS[form]["csv"]
+        df_input = carregar_entrada(pasta_inputs, csv_file_input, dados)
+        medicoes.append({
+            "nome": "leitura",
+            "arquivo": csv_file_input,
+            "origem": "memória" if dados and csv_file_input in dados else "csv",
+            "linhas_lidas": len(df_input)
+        })
+        indices[form] = indexar_envios(df_input, form)
+    return indices
+
+
+def preparar_forms(forms, pasta_inputs=pasta_inputs, convenios=None, medicoes=None, dados=None):
+    """
+    Lê e indexa os CSVs dos `forms` uma única vez (no processo principal) e
+    separa, para cada convênio, só os envios das linhas da planilha auxiliar
+    dele, pelas chaves guardadas no estado de validação. Retorna
+    {convênio: {form: (índice, chaves)}}, entregue a `construir_forms` no lugar
+    dos DataFrames.
+    """
+    indices = _indexar_forms(forms, pasta_inputs, [] if medicoes is None else medicoes, dados)
+    preparados = {}
+    with EstadoValidacao(pasta_inputs) as estado:
+        for convenio, caminho in _planilhas_auxiliares(pasta_inputs, convenios).items():
+            campos = estado.ler_planilha(convenio, caminho, forms)
+            preparados[convenio] = {}
+            for form in forms:
+                chaves = {
+                    _chave_envio(valores.get("Município"), valores.get("UVR"), FORMS[form])
+                    for valores in campos[form].values()
+                }
+                preparados[convenio][form] = ({c: indices[form][c] for c in chaves if c in indices[form]}, chaves)
+    return preparados
+
+
+def _chaves_preparadas(ws_aux, config, chaves):
+    # Indica se todas as linhas com município da aba estão entre as `chaves` da preparação
+    return all(
+        _chave_linha(row, config) in chaves for row in ws_aux.iter_rows(min_row=2)
+        if isinstance(row[1].value, str) and row[1].value.strip()
+    )
+
+
+def construir_forms(forms, pasta_inputs=pasta_inputs, convenios=None, medicoes=None, dados=None,
+                    nome="script_form123", preparado=None):
+    """
+    Gera as abas dos forms em `forms` (chaves de FORMS, na ordem das abas) de
+    cada convênio, abrindo a planilha auxiliar do convênio uma única vez.
+    Retorna {convênio: Workbook}; as medições por convênio vão para `medicoes`
+    sob `nome` e `dados` ({CSV: DataFrame}) dispensa a leitura dos CSVs.
+    Com `preparado` (ver `preparar_forms`), os CSVs não são lidos: cada convênio
+    usa os envios já separados para ele.
+    """
+    planilhas_auxiliares = _planilhas_auxiliares(pasta_inputs, convenios)
+    medicoes = [] if medicoes is None else medicoes
+    indices = None if preparado is not None else _indexar_forms(forms, pasta_inputs, medicoes, dados)
+
+    workbooks = {}
+    estado = EstadoValidacao(pasta_inputs)
+
+    # Processa cada planilha auxiliar (Belém, Expansão, GRS, Expansão MS)
+    for convenio, caminho in medir_convenios(planilhas_auxiliares.items(), nome, medicoes):
+        wb_aux = carregar_planilha(caminho)
+        # Campos manuais de todos os forms do convênio, lidos de uma vez do estado
+        campos = estado.ler_planilha(convenio, caminho, forms)
+
+        # Workbook próprio do convênio; o orquestrador junta as abas dos forms no final
+        wb_destino = Workbook()
+        wb_destino.remove(wb_destino.active)
+
+        for form in forms:
+            config = FORMS[form]
+
+            # Verifica se a aba existe
+            if config["aba"] not in wb_aux.sheetnames:
+                print(f"A aba '{config['aba']}' não foi encontrada em {convenio}. Nenhuma modificação será feita.")
+                continue
+
+            # Abas do modelo copiadas sem alteração
+            for nome_aba in clonar_abas(wb_aux, wb_destino, config["abas_modelo"]):
+                print(f"Aba '{nome_aba}' copiada do modelo '{convenio}'.")
+
+            if preparado is None:
+                envios = indices[form]
+            else:
+                envios, chaves = preparado[convenio][form]
+                # Planilha alterada depois da preparação: as linhas novas precisam do índice inteiro
+                if not _chaves_preparadas(wb_aux[config["aba"]], config, chaves):
+                    print(f"[AVISO] '{config['aba']}' de {convenio} mudou desde a preparação; reindexando os envios.")
+                    preparado = None
+                    indices = _indexar_forms(forms, pasta_inputs, medicoes, dados)
+                    envios = indices[form]
+
+            montar_aba(
+                wb_aux[config["aba"]], wb_destino.create_sheet(config["aba"]), config, envios, campos[form]
+            )
+
+        if wb_destino.sheetnames:
+            workbooks[convenio] = wb_destino
+
+    estado.fechar()
+    return workbooks
+
+
+def construir(pasta_inputs=pasta_inputs, convenios=None, medicoes=None, dados=None, preparado=None):
+    """
+    Gera as abas 'Form 1 - Município', 'Form 2 - UVR' e 'Form 3 - Empreendimento'
+    de cada convênio a partir do form1.csv, form2.csv e form3.csv, lendo cada
+    planilha auxiliar uma vez. Retorna {convênio: Workbook}; a gravação fica a
+    cargo do orquestrador.
+    """
+    return construir_forms(list(FORMS), pasta_inputs, convenios, medicoes, dados, preparado=preparado)
+
+
+def preparar(pasta_inputs=pasta_inputs, convenios=None, medicoes=None, dados=None):
+    """Índices de envios dos forms 1, 2 e 3 separados por convênio (ver `preparar_forms`)."""
+    return preparar_forms(list(FORMS), pasta_inputs, convenios, medicoes, dados)
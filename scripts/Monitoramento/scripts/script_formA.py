@@ -9,8 +9,9 @@ import unicodedata
 try:
     from utils import (
         cabeçalho_fill, cabeçalho_font, enviado_fill, enviado_font,
-        atrasado_fill, bordas, alinhamento, cores_regionais
+        atrasado_fill, bordas, alinhamento
     )
+    from regionais import cor_regional
 except ImportError:
     print("ERRO: O arquivo 'utils.py' não foi encontrado na pasta 'scripts'.")
     print("Por favor, certifique-se de que o seu arquivo utils.py está no lugar certo.")
@@ -94,8 +95,8 @@ def gerar_planilha_estilizada(df, nome_convenio):
     for row in range(2, ws.max_row + 1):
         cell_regional = ws.cell(row=row, column=coluna_regional_idx)
         nome_regional = cell_regional.value
-        if nome_regional and nome_regional in cores_regionais:
-            cor_hex = cores_regionais[nome_regional]
+        cor_hex = cor_regional(nome_regional)
+        if cor_hex:
             fill_regional = PatternFill(start_color=cor_hex, end_color=cor_hex, fill_type="solid")
             cell_regional.fill = fill_regional
 
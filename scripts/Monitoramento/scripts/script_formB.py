@@ -12,8 +12,9 @@ import unicodedata
 try:
     from utils import (
         cabeçalho_fill, cabeçalho_font, enviado_fill, enviado_font,
-        atrasado_fill, cores_regionais, bordas, alinhamento
+        atrasado_fill, bordas, alinhamento
     )
+    from regionais import cor_regional
 
     try:
         from utils import nao_possui_fill, nao_possui_font
@@ -122,8 +123,8 @@ def gerar_planilha_estilizada_formB(df, nome_convenio):
     for row in range(2, ws.max_row + 1):
         cell_regional = ws.cell(row=row, column=coluna_regional_idx)
         nome_regional = cell_regional.value
-        if nome_regional and nome_regional in cores_regionais:
-            cor_hex = cores_regionais[nome_regional]
+        cor_hex = cor_regional(nome_regional)
+        if cor_hex:
             fill_regional = PatternFill(start_color=cor_hex, end_color=cor_hex, fill_type="solid")
             cell_regional.fill = fill_regional
 
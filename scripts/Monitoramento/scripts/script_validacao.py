@@ -1,61 +1,180 @@
-import sys
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
-import pandas as pd
 
 try:
-    from lib_validacao import export_query_to_csv, processar_e_salvar_excel
+    from lib_validacao import exportar_queries_concorrente, processar_e_salvar_excel
 except ImportError:
-    from Monitoramento.scripts.lib_validacao import export_query_to_csv, processar_e_salvar_excel
+    from Monitoramento.scripts.lib_validacao import exportar_queries_concorrente, processar_e_salvar_excel
 
-print(">>> Iniciando Validacao: Banco de Dados -> Excel")
+try:
+    from cache_consultas import CacheConsultas
+    from relatorio_execucao import medir
+    from tipagem import carregar_entrada
+except ImportError:
+    from Monitoramento.scripts.cache_consultas import CacheConsultas
+    from Monitoramento.scripts.relatorio_execucao import medir
+    from Monitoramento.scripts.tipagem import carregar_entrada
 
 pasta_scripts = Path(__file__).resolve().parent
 pasta_root = pasta_scripts.parent
 pasta_inputs = pasta_root / "inputs"
 pasta_outputs = pasta_root / "outputs"
 
-# Extração do Banco de Dados para a pasta INPUTS 
-
-print(f"Buscando dados no banco e salvando em: {pasta_inputs}")
-
-# GRS
-export_query_to_csv("consulta_grs.sql", "data_grs.csv", pasta_inputs)
-
-# Expansão
-export_query_to_csv("consulta_expansao.sql", "data_expansao.csv", pasta_inputs)
-
-
-# Geração dos Relatórios Excel na pasta OUTPUTS 
-now = datetime.now()
-timestamp = now.strftime("%d-%m-%Y %H-%M")
-
-# Processamento GRS
-csv_grs = pasta_inputs / "data_grs.csv"
-if csv_grs.exists():
-    df_grs = pd.read_csv(csv_grs)
-    
-    # Define pasta de saída do GRS (Cria se não existir)
-    output_grs = pasta_outputs / "GRS"
-    output_grs.mkdir(parents=True, exist_ok=True)
-    
-    arquivo_final = output_grs / f"1 - Formulários - GRS - {timestamp}.xlsx"
-    processar_e_salvar_excel(df_grs, arquivo_final)
-else:
-    print(f"[AVISO] {csv_grs.name} não encontrado. Pulando geração do relatório GRS.")
-
-# Processamento Expansão
-csv_exp = pasta_inputs / "data_expansao.csv"
-if csv_exp.exists():
-    df_exp = pd.read_csv(csv_exp)
-    
-    # Define pasta de saída da Expansão
-    output_exp = pasta_outputs / "Expansão"
-    output_exp.mkdir(parents=True, exist_ok=True)
-    
-    arquivo_final = output_exp / f"1 - Formulários - Expansão - {timestamp}.xlsx"
-    processar_e_salvar_excel(df_exp, arquivo_final)
-else:
-    print(f"[AVISO] {csv_exp.name} não encontrado. Pulando geração do relatório Expansão.")
-
-print(">>> Validação finalizado.")
\ No newline at end of file
+
+# Relatórios de validação de cada convênio: consulta .sql e CSV extraído em inputs/,
+# pasta em outputs/ e nome usado no arquivo. Um novo relatório (ex: Belém ou
+# Expansão MS) é uma nova entrada aqui, com a consulta em inputs/.
+RELATORIOS = {
+    "grs": {"sql": "consulta_grs.sql", "csv": "data_grs.csv", "pasta": "GRS", "nome": "GRS"},
+    "expansao": {"sql": "consulta_expansao.sql", "csv": "data_expansao.csv", "pasta": "Expansão", "nome": "Expansão"}
+}
+
+
+def relatorios_selecionados(convenios=None):
+    return [convenio for convenio in RELATORIOS if convenios is None or convenio in convenios]
+
+
+def consultas_selecionadas(convenios=None):
+    return [(RELATORIOS[c]["sql"], RELATORIOS[c]["csv"]) for c in relatorios_selecionados(convenios)]
+
+
+def gerar_relatorio(convenio, pasta_inputs, pasta_outputs, timestamp, df=None):
+    """
+    Gera o relatório formatado de um convênio a partir do DataFrame recebido ou,
+    na falta dele, do CSV de inputs/. Roda em um worker; retorna a medição.
+    """
+    relatorio = RELATORIOS[convenio]
+    with medir("relatorio_validacao", convenio=relatorio["nome"]) as medicao:
+        dados = {relatorio["csv"]: df} if df is not None else None
+        df = carregar_entrada(pasta_inputs, relatorio["csv"], dados)
+        medicao.contar(linhas_lidas=len(df))
+
+        # Pasta de saída do convênio (criada se não existir)
+        pasta = pasta_outputs / relatorio["pasta"]
+        pasta.mkdir(parents=True, exist_ok=True)
+
+        arquivo_final = pasta / f"1 - Formulários - {relatorio['nome']} - {timestamp}.xlsx"
+        medicao.contar(**processar_e_salvar_excel(df, arquivo_final))
+    return medicao.como_dict()
+
+
+def executar(pasta_inputs=pasta_inputs, pasta_outputs=pasta_outputs, medicoes=None, convenios=None,
+             extrair=True, dados=None, gravar_csv=True, streaming=False, cache=None, max_workers=None,
+             executor=None, perfil=False):
+    """
+    Extrai as consultas de validação e gera os relatórios formatados dos convênios
+    de RELATORIOS. Se `medicoes` for informada, recebe as medições de cada relatório
+    gerado; `convenios` restringe os relatórios gerados (ex: ["grs"]).
+
+    As consultas rodam em paralelo (DB_MAX_CONEXOES conexões) e cada relatório é
+    formatado em um processo próprio (até `max_workers`, ou VALIDACAO_WORKERS; por
+    padrão um por relatório, limitado ao número de CPUs). Com `executor`, os
+    relatórios usam esse pool em vez de criar um. A falha de um relatório não
+    impede os demais; ao final, é levantada com os convênios que falharam.
+
+    Com `extrair=False` nada é consultado: são usados os DataFrames de `dados`
+    ({CSV: DataFrame}, ex: extraídos antes pelo orquestrador) ou, na falta deles,
+    os CSVs de inputs/. Com `gravar_csv=False` a extração não grava os CSVs.
+    Com `streaming=True` a extração grava os CSVs em lotes, sem montar os
+    DataFrames, e os relatórios são gerados a partir deles.
+    Com `cache` (um `CacheConsultas`), queries extraídas há pouco (aqui ou pelo
+    EXECUTAR_TODOS.py) são lidas do cache em vez do banco. Com `perfil=True`,
+    o EXPLAIN ANALYZE e o tempo de cada fase das consultas são exibidos.
+    """
+    medicoes = [] if medicoes is None else medicoes
+    dados = dict(dados or {})
+    selecionados = relatorios_selecionados(convenios)
+    if not selecionados:
+        print(">>> Nenhum relatório de validação para os convênios selecionados.")
+        return
+    print(">>> Iniciando Validacao: Banco de Dados -> Excel")
+
+    # Extração do Banco de Dados (e cópia em CSV na pasta INPUTS), com as consultas em paralelo
+
+    if extrair:
+        print("Buscando dados no banco" + (f" e salvando em: {pasta_inputs}" if gravar_csv or streaming else ""))
+        resultados = exportar_queries_concorrente(
+            consultas_selecionadas(convenios), pasta_inputs, int(os.getenv("DB_MAX_CONEXOES", "4")),
+            gravar=gravar_csv, streaming=streaming, cache=cache, perfil=perfil
+        )
+        for r in resultados:
+            if r["status"] == "ok" and r["dados"] is not None:
+                dados[r["csv"]] = r["dados"]
+
+
+    # Geração dos Relatórios Excel na pasta OUTPUTS, um por worker
+    now = datetime.now()
+    timestamp = now.strftime("%d-%m-%Y %H-%M")
+
+    tarefas = []
+    for convenio in selecionados:
+        csv = RELATORIOS[convenio]["csv"]
+        if csv in dados or (pasta_inputs / csv).exists():
+            tarefas.append((convenio, dados.get(csv)))
+        else:
+            print(f"[AVISO] {csv} não encontrado. Pulando geração do relatório {RELATORIOS[convenio]['nome']}.")
+
+    max_workers = max_workers or int(os.getenv("VALIDACAO_WORKERS", "0")) or min(len(tarefas), os.cpu_count() or 1)
+    falhas = []
+
+    def registrar(convenio, obter):
+        try:
+            medicoes.append(obter())
+        except Exception as e:
+            print(f"[ERRO] Falha ao gerar o relatório {RELATORIOS[convenio]['nome']}: {e}")
+            medicoes.append({"nome": "relatorio_validacao", "convenio": RELATORIOS[convenio]["nome"],
+                             "status": "erro", "erro": str(e)})
+            falhas.append(convenio)
+
+    # Com um único relatório (ou worker) não compensa copiar os dados para outro processo
+    if executor is None and (len(tarefas) <= 1 or max_workers == 1):
+        for convenio, df in tarefas:
+            registrar(convenio, lambda: gerar_relatorio(convenio, pasta_inputs, pasta_outputs, timestamp, df))
+    elif tarefas:
+        pool = executor or ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            futuros = [
+                (convenio, pool.submit(gerar_relatorio, convenio, pasta_inputs, pasta_outputs, timestamp, df))
+                for convenio, df in tarefas
+            ]
+            for convenio, futuro in futuros:
+                registrar(convenio, futuro.result)
+        finally:
+            if executor is None:
+                pool.shutdown()
+
+    if falhas:
+        raise RuntimeError(f"relatórios de validação com falha: {', '.join(falhas)}")
+    print(">>> Validação finalizado.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extrai as consultas de validação e gera os relatórios formatados.")
+    parser.add_argument(
+        "--convenio", action="append", choices=list(RELATORIOS),
+        help="gera apenas o relatório do convênio (pode ser repetido); padrão: todos (ou RELATORIOS_VALIDACAO=grs,expansao)"
+    )
+    parser.add_argument("--workers", type=int, help="processos para formatar os relatórios (equivale a VALIDACAO_WORKERS)")
+    args = parser.parse_args(argv)
+
+    convenios = args.convenio
+    if convenios is None and os.getenv("RELATORIOS_VALIDACAO"):
+        convenios = [c.strip() for c in os.getenv("RELATORIOS_VALIDACAO").split(",") if c.strip()]
+        desconhecidos = [c for c in convenios if c not in RELATORIOS]
+        if desconhecidos:
+            parser.error(f"RELATORIOS_VALIDACAO com convênio desconhecido: {', '.join(desconhecidos)}")
+
+    executar(
+        convenios=convenios,
+        streaming=os.getenv("EXTRACAO_STREAMING", "") == "1",
+        cache=CacheConsultas.do_ambiente(pasta_inputs / ".cache_consultas"),
+        max_workers=args.workers,
+        perfil=os.getenv("PERFIL_SQL", "") == "1"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+Serviço residente do monitoramento: fica em execução, observa inputs/ e
+regenera só as saídas afetadas a cada mudança, sem pagar de novo a importação
+de pandas/openpyxl nem a leitura das planilhas auxiliares e CSVs que não mudaram.
+
+    python servico.py                      # observa inputs/ e atende em 127.0.0.1:8765
+    python servico.py --poll-banco 600     # também consulta o banco a cada 10 minutos
+    curl -X POST "http://127.0.0.1:8765/regenerar?aguardar=1"
+"""
+import argparse
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from dotenv import load_dotenv
+
+from EXECUTAR_TODOS import (
+    caminho_manifesto, imprimir_resumo, mapa_queries, pasta_inputs, pasta_relatorios,
+    pasta_saida, pasta_scripts, salvar_saidas
+)
+from cache_planilhas import ativar_cache
+from estado_validacao import sincronizar
+from manifesto import Manifesto
+from motor_forms import BUILDERS_PADRAO, PipelineBuilders
+from regionais import ARQUIVO_REGISTRO
+from relatorio_execucao import RelatorioExecucao
+from salvamento import nivel_compressao_padrao
+from tipagem import ler_csv_tipado
+from utils import pastas_convenios
+import script_validacao
+
+
+def _versao(caminho):
+    # (mtime, tamanho) do arquivo, ou None se ele não existir
+    try:
+        estado = caminho.stat()
+    except FileNotFoundError:
+        return None
+    return (estado.st_mtime_ns, estado.st_size)
+
+
+def _iniciar_worker():
+    # Ctrl+C encerra o serviço pelo processo principal, que desliga os workers;
+    # o tratador de SIGTERM herdado do principal não vale aqui
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    ativar_cache()
+
+
+def _encerrar_por_sinal(signum, frame):
+    # SIGTERM (ex: systemd, docker stop) encerra como o Ctrl+C
+    raise KeyboardInterrupt
+
+
+class ServicoMonitoramento:
+    """
+    Mantém em memória o que as execuções avulsas refazem a cada vez: os módulos
+    importados, os CSVs já tipados e, nos workers (que continuam vivos entre
+    regenerações), as planilhas auxiliares já lidas.
+    """
+
+    def __init__(self, convenios=None, max_workers=None):
+        self.convenios = convenios or list(pastas_convenios)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # {CSV: ((mtime_ns, tamanho), DataFrame)}
+        self.dados = {}
+        self.pedidos = queue.Queue()
+        self.estado = {
+            "iniciado_em": datetime.now().isoformat(timespec="seconds"),
+            "em_execucao": False,
+            "execucoes": 0,
+            "ultima": None
+        }
+        ativar_cache()
+        self.executor = self._novo_executor()
+        self.assinatura = self._assinatura()
+        # Os relatórios de validação só são refeitos quando o CSV deles muda
+        self.versoes_validacao = {csv: _versao(pasta_inputs / csv) for _, csv in script_validacao.consultas_selecionadas()}
+
+    def _novo_executor(self):
+        # Cada worker liga o próprio cache de planilhas, que vale enquanto o processo viver
+        return ProcessPoolExecutor(max_workers=self.max_workers, initializer=_iniciar_worker)
+
+    def _garantir_executor(self):
+        # Um worker que morreu (ex: falta de memória) inutiliza o pool: recria antes do ciclo
+        try:
+            self.executor.submit(int).result()
+        except BrokenProcessPool:
+            print("[AVISO] Pool de workers interrompido. Recriando...")
+            self.executor = self._novo_executor()
+
+    def _assinatura(self):
+        # (mtime, tamanho) de tudo o que pode mudar uma saída: inputs/, o código dos scripts
+        # e o cadastro de regionais. Pastas ocultas (ex: .cache_consultas) não são entradas dos builders
+        arquivos = [
+            p for p in pasta_inputs.rglob("*")
+            if p.is_file() and not any(parte.startswith(".") for parte in p.relative_to(pasta_inputs).parent.parts)
+        ] + list(pasta_scripts.glob("*.py")) + [ARQUIVO_REGISTRO]
+        # Arquivos de trava e temporários do Excel ficam de fora
+        versoes = {c: _versao(c) for c in arquivos if not c.name.startswith(("~$", "."))}
+        return {caminho: versao for caminho, versao in versoes.items() if versao is not None}
+
+    def _carregar_dados(self):
+        # Relê só os CSVs que mudaram desde a última regeneração
+        nomes = [csv for _, csv in mapa_queries] + [csv for _, csv in script_validacao.consultas_selecionadas()]
+        for nome in nomes:
+            caminho = pasta_inputs / nome
+            versao = _versao(caminho)
+            if versao is None:
+                self.dados.pop(nome, None)
+            elif nome not in self.dados or self.dados[nome][0] != versao:
+                self.dados[nome] = (versao, ler_csv_tipado(caminho))
+        return {nome: df for nome, (_, df) in self.dados.items()}
+
+    def pedir(self, motivo, forcar=False, validar=False):
+        """
+        Agenda uma regeneração (de qualquer thread). Retorna o pedido, cujo
+        evento "concluido" é sinalizado ao final, com o resumo em "resultado".
+        """
+        pedido = {"motivo": motivo, "forcar": forcar, "validar": validar,
+                  "concluido": threading.Event(), "resultado": None}
+        self.pedidos.put(pedido)
+        return pedido
+
+    def regenerar(self, motivo, forcar=False, validar=False):
+        """
+        Executa um ciclo do pipeline sobre os arquivos atuais de inputs/: o manifesto
+        decide o que reconstruir. `validar` refaz todos os relatórios de validação;
+        sem ele, só os dos CSVs de validação alterados.
+        """
+        print(f"\n=== Regenerando ({motivo}) ===")
+        self.estado["em_execucao"] = True
+        relatorio = RelatorioExecucao(pasta_relatorios)
+        relatorio.extras["servico"] = {"motivo": motivo, "forcar": forcar}
+        inicio = time.perf_counter()
+        try:
+            self._garantir_executor()
+            with relatorio.etapa("builders") as etapa:
+                dados = self._carregar_dados()
+                manifesto = Manifesto(caminho_manifesto, pasta_scripts.parent)
+                medicoes_builders = []
+                importados = sincronizar(pasta_inputs, BUILDERS_PADRAO, self.convenios)
+                etapa.dados["estado_validacao"] = {f"{c}/{arquivo}": linhas for (c, arquivo), linhas in importados.items()}
+                pipeline = PipelineBuilders(
+                    pasta_inputs, pasta_saida, manifesto, BUILDERS_PADRAO, self.convenios, forcar=forcar,
+                    medicoes=medicoes_builders, dados=dados, executor=self.executor
+                )
+                saidas, decisoes = pipeline.concluir()
+                etapa.dados["decisoes"] = [
+                    {k: d[k] for k in ("artefato", "reconstruir", "motivo", "parcial")} for d in decisoes
+                ]
+                etapa.dados["detalhes"] = medicoes_builders
+                for m in medicoes_builders:
+                    etapa.contar(**m.get("contadores", {}))
+
+            with relatorio.etapa("validacao") as etapa:
+                convenios_validacao = self._convenios_validacao(validar)
+                if convenios_validacao:
+                    medicoes_validacao = []
+                    etapa.dados["detalhes"] = medicoes_validacao
+                    script_validacao.executar(
+                        pasta_inputs, pasta_saida, medicoes_validacao, convenios_validacao,
+                        extrair=False, dados=dados, executor=self.executor
+                    )
+                else:
+                    etapa.dados["status_validacao"] = "sem alterações"
+
+            nivel_compressao = nivel_compressao_padrao()
+            with relatorio.etapa("salvamento", nivel_compressao=nivel_compressao) as etapa:
+                salvos = salvar_saidas(saidas, decisoes, manifesto, relatorio, etapa, nivel_compressao)
+
+            imprimir_resumo(decisoes, salvos)
+            resultado = {
+                "motivo": motivo,
+                "status": "ok",
+                "reconstruidos": sorted(salvos),
+                "mantidos": sum(1 for d in decisoes if not d["reconstruir"]),
+                "validacao": convenios_validacao
+            }
+        except Exception as e:
+            print(f"[ERRO] Falha na regeneração: {e}")
+            resultado = {"motivo": motivo, "status": "erro", "erro": str(e)}
+        finally:
+            self.estado["em_execucao"] = False
+
+        resultado["fim"] = datetime.now().isoformat(timespec="seconds")
+        resultado["tempo_s"] = round(time.perf_counter() - inicio, 2)
+        resultado["relatorio"] = str(relatorio.salvar())
+        self.estado["execucoes"] += 1
+        self.estado["ultima"] = resultado
+        print(f"Regeneração concluída em {resultado['tempo_s']:.2f}s. Aguardando alterações...")
+        return resultado
+
+    def _convenios_validacao(self, todos):
+        convenios = []
+        for convenio, relatorio in script_validacao.RELATORIOS.items():
+            csv = relatorio["csv"]
+            if convenio not in self.convenios:
+                continue
+            versao = _versao(pasta_inputs / csv)
+            if versao is not None and (todos or versao != self.versoes_validacao.get(csv)):
+                convenios.append(convenio)
+            self.versoes_validacao[csv] = versao
+        return convenios
+
+    def _codigo_alterado(self, alterados):
+        # Os workers importaram o código antigo: são recriados (e o cache de planilhas com eles)
+        scripts = sorted(c.name for c in alterados if c.suffix == ".py" and c.parent == pasta_scripts)
+        if not scripts:
+            return
+        print(f"Código alterado ({', '.join(scripts)}). Reiniciando os workers...")
+        self.executor.shutdown()
+        self.executor = self._novo_executor()
+        if any(not nome.startswith("script_form") for nome in scripts):
+            print("[AVISO] Reinicie o serviço para que o processo principal também use o código novo.")
+
+    def consultar_banco(self, max_conexoes):
+        """
+        Extrai as queries dos forms e da validação e grava os CSVs cujo conteúdo
+        mudou; a observação de inputs/ dispara a regeneração em seguida.
+        """
+        from lib_validacao import exportar_queries_concorrente, gravar_csv
+
+        queries = mapa_queries + script_validacao.consultas_selecionadas(self.convenios)
+        print(f"\nConsultando o banco ({len(queries)} queries)...")
+        for r in exportar_queries_concorrente(queries, pasta_inputs, max_conexoes, gravar=False):
+            if r["status"] != "ok":
+                print(f"  {r['sql']:<22} ERRO   {r['erro']}")
+                continue
+            caminho = pasta_inputs / r["csv"]
+            conteudo = r["dados"].to_csv(index=False).encode("utf-8-sig")
+            if caminho.exists() and caminho.read_bytes().replace(b"\r\n", b"\n") == conteudo.replace(b"\r\n", b"\n"):
+                continue
+            gravar_csv(r["dados"], caminho)
+            print(f"  {r['sql']:<22} NOVOS DADOS  {r['linhas']} linhas")
+
+    def executar(self, intervalo=2.0, poll_banco=None, max_conexoes=4):
+        """
+        Laço principal: atende os pedidos e, a cada `intervalo` segundos, compara
+        inputs/ com a última leitura. Uma alteração só dispara a regeneração
+        depois de um intervalo sem novas mudanças (arquivos ainda sendo copiados).
+        """
+        self.regenerar("inicialização")
+        proxima_consulta = time.monotonic() + poll_banco if poll_banco else None
+        alterados = set()
+        while True:
+            try:
+                pedido = self.pedidos.get(timeout=intervalo)
+            except queue.Empty:
+                pedido = None
+            if pedido is not None:
+                pedido["resultado"] = self.regenerar(pedido["motivo"], pedido["forcar"], pedido["validar"])
+                pedido["concluido"].set()
+                continue
+
+            atual = self._assinatura()
+            novos = {c for c in atual.keys() | self.assinatura.keys() if atual.get(c) != self.assinatura.get(c)}
+            self.assinatura = atual
+            if novos:
+                alterados |= novos
+                continue
+            if alterados:
+                self._codigo_alterado(alterados)
+                nomes = sorted(c.relative_to(pasta_scripts.parent).as_posix() for c in alterados)
+                self.regenerar("alterados: " + ", ".join(nomes[:5]) + (" ..." if len(nomes) > 5 else ""))
+                alterados = set()
+
+            if proxima_consulta is not None and time.monotonic() >= proxima_consulta:
+                try:
+                    self.consultar_banco(max_conexoes)
+                except Exception as e:
+                    print(f"[ERRO] Falha na consulta ao banco: {e}")
+                proxima_consulta = time.monotonic() + poll_banco
+
+    def encerrar(self):
+        self.executor.shutdown()
+
+
+class _Gatilho(BaseHTTPRequestHandler):
+    """
+    POST /regenerar[?forcar=1][&validar=1][&aguardar=1]  agenda uma regeneração
+    GET  /estado                                         estado do serviço e da última regeneração
+    """
+
+    def _responder(self, codigo, conteudo):
+        corpo = json.dumps(conteudo, indent=2, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/estado":
+            return self._responder(404, {"erro": "use GET /estado ou POST /regenerar"})
+        self._responder(200, self.server.servico.estado)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/regenerar":
+            return self._responder(404, {"erro": "use GET /estado ou POST /regenerar"})
+        parametros = {chave: valores[-1] == "1" for chave, valores in parse_qs(url.query).items()}
+        pedido = self.server.servico.pedir(
+            "pedido HTTP", forcar=parametros.get("forcar", False), validar=parametros.get("validar", False)
+        )
+        if parametros.get("aguardar"):
+            pedido["concluido"].wait()
+            return self._responder(200, pedido["resultado"])
+        self._responder(202, {"agendado": True})
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def iniciar_gatilho(servico, porta):
+    # Só aceita conexões da própria máquina
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), _Gatilho)
+    servidor.servico = servico
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    print(f"Gatilho HTTP em http://127.0.0.1:{servidor.server_address[1]} (POST /regenerar, GET /estado)")
+    return servidor
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        description="Mantém o pipeline de monitoramento em execução e regenera as saídas quando inputs/ muda."
+    )
+    parser.add_argument("--convenio", action="append",
+                        help="atende apenas o convênio informado (pode ser repetido); padrão: todos")
+    parser.add_argument("--intervalo", type=float, default=2.0,
+                        help="segundos entre as verificações de inputs/ (padrão 2)")
+    parser.add_argument("--poll-banco", type=float, metavar="SEGUNDOS",
+                        help="consulta o banco a cada SEGUNDOS e grava os CSVs que mudaram (requer credenciais)")
+    parser.add_argument("--porta", type=int, default=8765,
+                        help="porta local do gatilho HTTP (padrão 8765; 0 desativa)")
+    return parser
+
+
+def main(argv=None):
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+    load_dotenv()
+
+    convenios = list(dict.fromkeys(args.convenio)) if args.convenio else list(pastas_convenios)
+    desconhecidos = [c for c in convenios if c not in pastas_convenios]
+    if desconhecidos:
+        parser.error(f"convênio desconhecido: {', '.join(desconhecidos)} (use {', '.join(pastas_convenios)})")
+    if args.poll_banco and not all(os.getenv(var) for var in ["DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST"]):
+        parser.error("--poll-banco requer as credenciais do banco no .env")
+
+    signal.signal(signal.SIGTERM, _encerrar_por_sinal)
+    servico = ServicoMonitoramento(convenios, int(os.getenv("MAX_WORKERS", "0")) or None)
+    servidor = iniciar_gatilho(servico, args.porta) if args.porta else None
+    try:
+        servico.executar(args.intervalo, args.poll_banco, int(os.getenv("DB_MAX_CONEXOES", "4")))
+    except KeyboardInterrupt:
+        print("\nEncerrando o serviço...")
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+        servico.encerrar()
+
+
+if __name__ == "__main__":
+    main()
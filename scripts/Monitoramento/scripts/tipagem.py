@@ -0,0 +1,86 @@
+import hashlib
+from datetime import date
+import pandas as pd
+
+
+# Datas como o banco as exporta: "2025-01-15" ou "2025-01-15 12:36:30.141064"
+_PADRAO_DATA = r"^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2}(\.\d+)?)?$"
+
+# Números com zero à esquerda (CNPJ, códigos) continuam texto
+_PADRAO_CODIGO = r"^-?0\d"
+
+# Colunas de texto com até esta fração de valores distintos viram categoria
+LIMITE_CATEGORIA = 0.5
+
+
+def _numerica(serie):
+    # Números inteiros (mesmo com nulos) viram Int64, para "1" não virar "1.0"
+    if serie.dtype.kind == "f":
+        valores = serie.dropna()
+        if not valores.empty and (valores % 1 == 0).all():
+            return serie.astype("Int64")
+    return serie
+
+
+def _tipar_coluna(serie):
+    valores = serie.dropna()
+    if valores.empty or serie.dtype.kind in "Mmb" or isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie
+    if serie.dtype.kind in "iuf":
+        return _numerica(serie)
+
+    # Datas do banco chegam como datetime.date; as do CSV, como texto ISO
+    if valores.map(lambda v: isinstance(v, date)).all():
+        return pd.to_datetime(serie)
+
+    if valores.map(lambda v: isinstance(v, str)).all():
+        texto = valores.str.strip()
+        if texto.str.match(_PADRAO_DATA).all():
+            return pd.to_datetime(serie, format="ISO8601")
+        if not texto.str.match(_PADRAO_CODIGO).any():
+            numeros = pd.to_numeric(texto, errors="coerce")
+            if numeros.notna().all():
+                return _numerica(pd.to_numeric(serie, errors="coerce"))
+        if valores.nunique() <= LIMITE_CATEGORIA * len(valores):
+            return serie.astype("category")
+        return serie
+
+    # Decimal (NUMERIC do Postgres) e afins
+    numeros = pd.to_numeric(serie, errors="coerce")
+    if numeros.notna().sum() == len(valores):
+        return _numerica(numeros)
+    return serie
+
+
+def tipar_dataframe(df):
+    """
+    Ajusta os tipos das colunas: datas para datetime64, números para Int64 ou
+    float64 e textos repetitivos para category. Vale tanto para o resultado
+    de uma query quanto para um CSV lido como texto.
+    """
+    return pd.DataFrame({coluna: _tipar_coluna(df[coluna]) for coluna in df.columns}, index=df.index)
+
+
+def ler_csv_tipado(caminho_csv):
+    return tipar_dataframe(pd.read_csv(caminho_csv, dtype=str))
+
+
+def carregar_entrada(pasta_inputs, nome_csv, dados=None):
+    """
+    Retorna o DataFrame de uma entrada: o recebido em memória do orquestrador
+    (`dados`, {nome do CSV: DataFrame}), se houver, ou o CSV de inputs/.
+    """
+    if dados and nome_csv in dados:
+        return dados[nome_csv]
+    return ler_csv_tipado(pasta_inputs / nome_csv)
+
+
+def hash_dataframe(df):
+    """
+    SHA-256 do conteúdo de um DataFrame (colunas, tipos e valores), usado no
+    manifesto quando a entrada chega em memória em vez de CSV.
+    """
+    h = hashlib.sha256()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
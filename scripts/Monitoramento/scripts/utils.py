@@ -1,4 +1,9 @@
+from openpyxl.cell.cell import Cell, MergedCell
+from openpyxl.formatting.formatting import ConditionalFormatting
 from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.worksheet.merge import MergedCellRange
+from copy import copy, deepcopy
 from datetime import datetime
 import unicodedata
 
@@ -18,29 +23,6 @@ analise_fill = PatternFill(start_color="FFA500", end_color= "FFA500", fill_type=
 validado_nao_fill = PatternFill(start_color="FF6666", end_color="FF6666", fill_type="solid")
 validado_sim_fill = PatternFill(start_color="66FF66", end_color="66FF66", fill_type="solid")
 
-cores_regionais = {
-    "Gabriel": "A3DDFF",
-    "Bianca": "FFF7C9",
-    "Valquiria": "91F0D3",
-    "Valquíria": "91F0D3",
-    "Luana": "FFD2DE",
-    "Larissa": "EBC99F",
-    "Paranavaí": "B879D1",
-    "Ana Paula": "993399",
-    "Londrina": "A9C5E6",
-    "Francisco Beltrão": "B2FFFF",
-    "Maringá": "FFCCFF",
-    "Curitiba": "FFFF99",
-    "Guarapuava": "F1E0C6",
-    "Laranjeiras do Sul" : "FFD3AC",
-    "Cibax": "FDEE00",     
-    "Comafen": "FFA500",    
-    "Coripa": "008000",     
-    "Cifra": "00BFFF",    
-    "Conisul": "FF0000",    
-    "Gustavo" : "CCC0DA"
-}
-
 bordas = Border(
     top=Side(border_style="thin", color="000000"),
     bottom=Side(border_style="thin", color="000000"),
@@ -59,7 +41,7 @@ def normalizar_texto(texto):
 def normalizar_uvr(uvr_nro):
     try:
         return str(int(uvr_nro))
-    except ValueError:
+    except (ValueError, TypeError):  # TypeError: nulos (pd.NA) de colunas numéricas
         return uvr_nro
 
 
@@ -88,3 +70,151 @@ def aplicar_estilo_status(cell, status):
 
 
 
+
+
+# Convênios atendidos: chave interna -> (pasta em inputs/, pasta em outputs/)
+pastas_convenios = {
+    "belem": ("0 - Belém", "Belém"),
+    "expansao": ("0 - Expansão", "Expansão"),
+    "grs": ("0 - GRS II", "GRS"),
+    "expansao_ms": ("0 - Expansão MS", "Expansão MS")
+}
+
+
+def _tradutor_estilos(wb_origem, wb_destino):
+    """
+    Retorna uma função que converte o StyleArray de uma célula de `wb_origem`
+    nos índices equivalentes das tabelas de estilo de `wb_destino`.
+    Cada combinação de estilo é traduzida uma única vez.
+    """
+    tabelas = ["_fonts", "_fills", "_borders", None, "_protections", "_alignments"]
+    mapas = [{} for _ in tabelas]
+    cache = {}
+
+    def traduzir_indice(pos, idx):
+        if idx in mapas[pos]:
+            return mapas[pos][idx]
+        if pos == 3:  # numFmtId: formatos internos (< 164) são iguais em qualquer workbook
+            if idx < 164:
+                novo = idx
+            else:
+                novo = wb_destino._number_formats.add(wb_origem._number_formats[idx - 164]) + 164
+        else:
+            novo = getattr(wb_destino, tabelas[pos]).add(getattr(wb_origem, tabelas[pos])[idx])
+        mapas[pos][idx] = novo
+        return novo
+
+    def traduzir_estilo_nomeado(idx):
+        estilo = wb_origem._named_styles[idx]
+        if estilo.name not in wb_destino._named_styles.names:
+            wb_destino.add_named_style(copy(estilo))
+        return wb_destino._named_styles.names.index(estilo.name)
+
+    def traduzir(style_array):
+        chave = tuple(style_array)
+        if chave not in cache:
+            novo = [traduzir_indice(pos, idx) for pos, idx in enumerate(chave[:6])]
+            novo += [chave[6], chave[7], traduzir_estilo_nomeado(chave[8])]
+            cache[chave] = StyleArray(novo)
+        return copy(cache[chave])
+
+    return traduzir
+
+
+def mover_abas(wb_origem, wb_destino):
+    """
+    Transfere todas as abas de `wb_origem` para o final de `wb_destino`,
+    sem recriar células: apenas os índices de estilo são remapeados.
+    """
+    traduzir = _tradutor_estilos(wb_origem, wb_destino)
+
+    for ws in list(wb_origem.worksheets):
+        for cell in ws._cells.values():
+            if cell._style is not None:
+                cell._style = traduzir(cell._style)
+        for dimensoes in (ws.row_dimensions, ws.column_dimensions):
+            for dim in dimensoes.values():
+                if dim._style is not None:
+                    dim._style = traduzir(dim._style)
+
+        wb_origem._sheets.remove(ws)
+        ws._parent = wb_destino
+        wb_destino._add_sheet(ws)
+
+
+def clonar_abas(wb_origem, wb_destino, nomes):
+    """
+    Copia para `wb_destino` as abas `nomes` de `wb_origem` (as que existirem lá
+    e ainda não existirem no destino), idênticas à original: valores, estilos,
+    dimensões, mesclagens, validações, formatação condicional, filtro,
+    proteção, painéis congelados e configuração de página. Como em `mover_abas`,
+    as células não são reestilizadas uma a uma: só os índices de estilo são
+    remapeados, uma vez por combinação. A aba de origem não é alterada (as regras
+    de validação e formatação são copiadas, não compartilhadas). Abas com imagens
+    ou tabelas não são suportadas e geram ValueError. Retorna os nomes copiados.
+    """
+    traduzir = _tradutor_estilos(wb_origem, wb_destino)
+    copiadas = []
+
+    for nome in nomes:
+        if nome not in wb_origem.sheetnames or nome in wb_destino.sheetnames:
+            continue
+        origem = wb_origem[nome]
+        # Imagens e tabelas não são copiadas com segurança pelo openpyxl (os nomes
+        # das tabelas são únicos no arquivo): melhor falhar que perder conteúdo
+        if origem._images or origem.tables:
+            raise ValueError(f"A aba modelo '{nome}' tem imagens ou tabelas, que não são copiadas.")
+        ws = wb_destino.create_sheet(nome)
+
+        for (linha, coluna), celula in origem._cells.items():
+            if isinstance(celula, MergedCell):
+                nova = MergedCell(ws, row=linha, column=coluna)
+            else:
+                nova = Cell(ws, row=linha, column=coluna)
+                nova._value = celula._value
+                nova.data_type = celula.data_type
+                if celula.hyperlink:
+                    nova._hyperlink = copy(celula.hyperlink)
+                if celula.comment:
+                    nova.comment = copy(celula.comment)
+            if celula._style is not None:
+                nova._style = traduzir(celula._style)
+            ws._cells[(linha, coluna)] = nova
+
+        for dimensoes_origem, dimensoes in ((origem.row_dimensions, ws.row_dimensions),
+                                            (origem.column_dimensions, ws.column_dimensions)):
+            for chave, dim in dimensoes_origem.items():
+                nova = copy(dim)
+                nova.parent = ws
+                if dim._style is not None:
+                    nova._style = traduzir(dim._style)
+                dimensoes[chave] = nova
+
+        # As células mescladas já vieram acima; aqui só os intervalos
+        for intervalo in origem.merged_cells.ranges:
+            ws.merged_cells.add(MergedCellRange(ws, intervalo.coord))
+
+        # O openpyxl reescreve o dxfId das regras ao salvar: cada aba fica com as suas
+        for dv in origem.data_validations.dataValidation:
+            ws.add_data_validation(deepcopy(dv))
+        for formatacao in origem.conditional_formatting:
+            intervalo = ConditionalFormatting(str(formatacao.sqref))
+            for regra in formatacao.rules:
+                ws.conditional_formatting.add(intervalo, deepcopy(regra))
+
+        ws.auto_filter = deepcopy(origem.auto_filter)
+        ws.protection = copy(origem.protection)
+        ws._print_rows = deepcopy(origem._print_rows)
+        ws._print_cols = deepcopy(origem._print_cols)
+        ws._print_area = deepcopy(origem._print_area)
+
+        ws.sheet_format = copy(origem.sheet_format)
+        ws.sheet_properties = copy(origem.sheet_properties)
+        ws.page_margins = copy(origem.page_margins)
+        ws.page_setup = copy(origem.page_setup)
+        ws.print_options = copy(origem.print_options)
+        ws.views = copy(origem.views)
+        ws.sheet_view.tabSelected = False  # só a aba ativa do destino fica selecionada
+        copiadas.append(nome)
+
+    return copiadas
@@ -0,0 +1,101 @@
+"""
+Extração incremental (lib_validacao.ExtracaoIncremental) contra uma conexão
+falsa do Postgres: as consultas rodam em um SQLite em memória e, como no
+psycopg2, as colunas NUMERIC chegam como Decimal.
+
+    python -m pytest scripts/Monitoramento/tests
+"""
+import sqlite3
+import sys
+from collections import namedtuple
+from decimal import Decimal
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import lib_validacao  # noqa: E402
+
+pytestmark = pytest.mark.filterwarnings("ignore:pandas only supports SQLAlchemy")
+
+Coluna = namedtuple("Coluna", "name type_code display_size internal_size precision scale null_ok")
+
+# Linhas com o formato das do form4: quantidade inteira com nulos, valor NUMERIC e envio sem data
+LINHAS = [
+    ("Castro", "2025-01-02 10:00:00", 1, "12.50"),
+    ("Palmital", "2025-02-03 11:30:00", None, "7.00"),
+    ("Castro", None, 3, "2.00"),
+]
+
+
+class CursorFalso:
+    def __init__(self, banco):
+        self._cursor = banco.cursor()
+        self.description = None
+
+    def execute(self, query, params=None):
+        # Parâmetros no estilo do psycopg2 (%(nome)s, com "%" literal escapado)
+        self._cursor.execute(query.replace("%(marca)s", ":marca").replace("%%", "%"), params or {})
+        self.description = [Coluna(d[0], *[None] * 6) for d in self._cursor.description]
+
+    def fetchall(self):
+        return [(*linha[:-1], Decimal(linha[-1])) for linha in self._cursor.fetchall()]
+
+    def close(self):
+        pass
+
+
+class ConexaoFalsa:
+    def __init__(self):
+        self.banco = sqlite3.connect(":memory:")
+        self.banco.execute("CREATE TABLE envios (municipio TEXT, data_de_envio TEXT, quantidade INTEGER, valor TEXT)")
+        self.banco.executemany("INSERT INTO envios VALUES (?, ?, ?, ?)", LINHAS)
+
+    def cursor(self, *args, **kwargs):
+        return CursorFalso(self.banco)
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def pasta(tmp_path):
+    (tmp_path / "form4.sql").write_text("SELECT * FROM envios;\n", encoding="utf-8")
+    return tmp_path
+
+
+def _extrair(pasta, conn):
+    # Sem chave para a query: as linhas são comparadas inteiras, como no form4
+    incremental = lib_validacao.ExtracaoIncremental(pasta / "estado.json", {"form4.sql": "data_de_envio"})
+    return incremental.extrair("form4.sql", pasta / "form4.sql", conn, pasta / "form4.csv")
+
+
+def test_linhas_ja_gravadas_nao_se_repetem(pasta):
+    conn = ConexaoFalsa()
+    _, _, _, modo = _extrair(pasta, conn)
+    assert modo.startswith("completa")
+    gravado = (pasta / "form4.csv").read_text(encoding="utf-8-sig")
+
+    # A marca d'água é a data do Palmital: ele volta pelo empate e o envio sem data, pela marca
+    # nula. No lote só há valores inteiros, e o CSV guarda 7.0 e 2.0
+    df, lidas, novas, modo = _extrair(pasta, conn)
+
+    assert (modo, lidas, novas) == ("incremental", 2, 0)
+    assert (pasta / "form4.csv").read_text(encoding="utf-8-sig") == gravado
+    assert len(df) == len(LINHAS)
+
+
+def test_linhas_novas_entram_uma_vez(pasta):
+    conn = ConexaoFalsa()
+    _extrair(pasta, conn)
+    conn.banco.execute("INSERT INTO envios VALUES ('Tibagi', '2025-03-04 09:00:00', 2, '3.10')")
+
+    _, _, novas, _ = _extrair(pasta, conn)
+    df, _, novas_depois, _ = _extrair(pasta, conn)
+
+    assert (novas, novas_depois) == (1, 0)
+    csv = pd.read_csv(pasta / "form4.csv", dtype=str, encoding="utf-8-sig")
+    assert csv["municipio"].tolist() == ["Castro", "Palmital", "Castro", "Tibagi"]
+    assert csv["valor"].tolist() == ["12.5", "7.0", "2.0", "3.1"]
+    assert df["quantidade"].dtype == "Int64"
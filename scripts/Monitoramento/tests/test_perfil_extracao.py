@@ -0,0 +1,192 @@
+"""
+Modo perfil da extração (lib_validacao) contra uma conexão falsa do Postgres:
+o EXPLAIN devolve um plano fixo e as consultas rodam em um SQLite em memória.
+
+    python -m pytest scripts/Monitoramento/tests
+"""
+import json
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import lib_validacao  # noqa: E402
+
+pytestmark = pytest.mark.filterwarnings("ignore:pandas only supports SQLAlchemy")
+
+PLANO = [{
+    "Plan": {
+        "Node Type": "Hash Join", "Actual Total Time": 50.0, "Actual Loops": 1, "Actual Rows": 3,
+        "Shared Hit Blocks": 10, "Shared Read Blocks": 4, "Temp Read Blocks": 1, "Temp Written Blocks": 2,
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "envios", "Actual Total Time": 40.0,
+             "Actual Loops": 1, "Actual Rows": 3},
+            {"Node Type": "Index Scan", "Relation Name": "uvr", "Actual Total Time": 1.0,
+             "Actual Loops": 3, "Actual Rows": 1},
+        ]
+    },
+    "Planning Time": 2.0,
+    "Execution Time": 52.0
+}]
+
+# Tempo que as linhas levam para "chegar do banco" no fetchall, e o do EXPLAIN ANALYZE.
+# O EXPLAIN não dorme: adianta o relógio da conexão, somado ao perf_counter pelo fixture `pool`
+ESPERA_BUSCA = 0.03
+ESPERA_EXPLAIN = 100.0
+
+# Como no psycopg2, as colunas de cursor.description têm nome
+Coluna = namedtuple("Coluna", "name type_code display_size internal_size precision scale null_ok")
+
+
+class CursorFalso:
+    def __init__(self, conexao):
+        self._conexao = conexao
+        self._cursor = conexao.banco.cursor()
+        self._comandos = conexao.comandos
+        self._explain = None
+        self.description = None
+
+    def execute(self, query, params=None):
+        self._comandos.append(query)
+        if query.startswith("EXPLAIN"):
+            self._conexao.relogio += ESPERA_EXPLAIN
+            self._explain = [(json.dumps(PLANO),)]
+            self.description = [Coluna("QUERY PLAN", *[None] * 6)]
+            return
+        self._cursor.execute(query, params or ())
+        self.description = [Coluna(d[0], *[None] * 6) for d in self._cursor.description]
+
+    def fetchone(self):
+        return self._explain[0] if self._explain else self._cursor.fetchone()
+
+    def fetchall(self):
+        time.sleep(ESPERA_BUSCA)
+        return self._cursor.fetchall()
+
+    def fetchmany(self, tamanho):
+        return self._cursor.fetchmany(tamanho)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConexaoFalsa:
+    def __init__(self):
+        self.banco = sqlite3.connect(":memory:", check_same_thread=False)
+        self.banco.execute("CREATE TABLE envios (municipio TEXT, data_envio TEXT, quantidade REAL)")
+        self.banco.executemany("INSERT INTO envios VALUES (?, ?, ?)", [
+            ("Castro", "2025-01-02", 1), ("Palmital", "2025-02-03", 2), ("Castro", "2025-03-04", 3)
+        ])
+        self.comandos = []
+        self.rollbacks = 0
+        self.relogio = 0.0
+
+    def cursor(self, *args, **kwargs):
+        return CursorFalso(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def commit(self):
+        pass
+
+
+class PoolFalso:
+    def __init__(self):
+        self.conexao = ConexaoFalsa()
+
+    def getconn(self):
+        return self.conexao
+
+    def putconn(self, conn):
+        pass
+
+    def closeall(self):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = PoolFalso()
+    monkeypatch.setattr(lib_validacao, "criar_pool_conexoes", lambda max_conexoes: pool)
+    perf_counter = time.perf_counter
+    monkeypatch.setattr(time, "perf_counter", lambda: perf_counter() + pool.conexao.relogio)
+    return pool
+
+
+@pytest.fixture
+def pasta_inputs(tmp_path):
+    (tmp_path / "form1.sql").write_text("SELECT * FROM envios;\n", encoding="utf-8")
+    return tmp_path
+
+
+def _extrair(pasta_inputs, **opcoes):
+    resultado, = lib_validacao.exportar_queries_concorrente(
+        [("form1.sql", "form1.csv")], pasta_inputs, 2, **opcoes
+    )
+    assert resultado["status"] == "ok", resultado.get("erro")
+    return resultado
+
+
+def test_perfilar_consulta_resume_o_plano():
+    conn = ConexaoFalsa()
+    perfil = lib_validacao.perfilar_consulta("SELECT * FROM envios;\n", conn)
+
+    assert conn.comandos == ["EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT * FROM envios"]
+    assert conn.rollbacks == 1
+    assert perfil["servidor_s"] == 0.052
+    assert perfil["planejamento_s"] == 0.002
+    assert perfil["linhas_servidor"] == 3
+    assert perfil["blocos"] == {"cache": 10, "disco": 4, "temporarios": 3}
+    assert perfil["plano"] == PLANO[0]
+    # Tempo próprio: o Hash Join gasta 50ms menos os 40ms + 3 x 1ms dos filhos
+    assert perfil["nos_mais_lentos"] == [
+        {"no": "Seq Scan em envios", "tempo_proprio_s": 0.04, "linhas": 3},
+        {"no": "Hash Join", "tempo_proprio_s": 0.007, "linhas": 3},
+        {"no": "Index Scan em uvr", "tempo_proprio_s": 0.003, "linhas": 3},
+    ]
+
+
+def test_perfil_separa_as_fases_da_extracao(pool, pasta_inputs):
+    resultado = _extrair(pasta_inputs, gravar=False, perfil=True)
+    perfil = resultado["perfil"]
+
+    assert pool.conexao.comandos[0].startswith("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT * FROM envios")
+    assert perfil["linhas"] == 3
+    # A busca inclui a espera do fetchall; o que passa do tempo no servidor é transferência
+    assert perfil["consulta_s"] >= ESPERA_BUSCA
+    assert perfil["transferencia_s"] == pytest.approx(max(perfil["consulta_s"] - perfil["servidor_s"], 0.0), abs=1e-3)
+    for fase in ("dataframe_s", "tipagem_s"):
+        assert perfil[fase] >= 0
+    # O tempo da extração não conta o EXPLAIN, que adiantou o relógio em ESPERA_EXPLAIN
+    assert perfil["explain_s"] >= ESPERA_EXPLAIN
+    assert perfil["consulta_s"] <= resultado["tempo"] < perfil["explain_s"]
+
+
+def test_perfil_nao_altera_os_dados(pool, pasta_inputs):
+    com_perfil = _extrair(pasta_inputs, gravar=False, perfil=True)
+    sem_perfil = _extrair(pasta_inputs, gravar=False)
+
+    assert "perfil" not in sem_perfil
+    pd.testing.assert_frame_equal(com_perfil["dados"], sem_perfil["dados"])
+    assert pd.api.types.is_datetime64_any_dtype(com_perfil["dados"]["data_envio"])
+
+
+def test_perfil_em_streaming_mede_a_gravacao_do_csv(pool, pasta_inputs):
+    resultado = _extrair(pasta_inputs, streaming=True, perfil=True)
+
+    assert resultado["perfil"]["streaming_s"] >= 0
+    assert "consulta_s" not in resultado["perfil"]
+    csv = pd.read_csv(pasta_inputs / "form1.csv", encoding="utf-8-sig")
+    assert csv["municipio"].tolist() == ["Castro", "Palmital", "Castro"]